@@ -42,6 +42,11 @@ class ParamGroup:
         for arg in vars(args).items():
             if arg[0] in vars(self) or ("_" + arg[0]) in vars(self):
                 setattr(group, arg[0], arg[1])
+        # Parameters added after a model's cfg_args was written take their defaults
+        for key, value in vars(self).items():
+            key = key[1:] if key.startswith("_") else key
+            if not hasattr(group, key):
+                setattr(group, key, value)
         return group
 
 class ModelParams(ParamGroup): 
@@ -53,6 +58,14 @@ class ModelParams(ParamGroup):
         self._resolution = -1
         self._white_background = False
         self.data_device = "cuda"
+        self.device = "cuda"
+        self.load_workers = 8
+        self.image_cache = ""
+        self.lazy_images = False
+        self.image_memory_mb = 4096
+        self.prefetch_views = 4
+        self.max_pending_saves = 2
+        self.morton_order = False
         self.eval = False
         super().__init__(parser, "Loading Parameters", sentinel)
 
@@ -66,6 +79,9 @@ class PipelineParams(ParamGroup):
         self.convert_SHs_python = False
         self.compute_cov3D_python = False
         self.debug = False
+        self.rasterizer = "cuda"
+        self.frustum_culling = False
+        self.lod_threshold = 0.0
         super().__init__(parser, "Pipeline Parameters")
 
 class OptimizationParams(ParamGroup):
@@ -86,7 +102,10 @@ class OptimizationParams(ParamGroup):
         self.densify_from_iter = 500
         self.densify_until_iter = 15_000
         self.densify_grad_threshold = 0.0002
+        self.max_gaussians = 0
+        self.gaussian_memory_mb = 0
         self.random_background = False
+        self.batch_size = 1
         super().__init__(parser, "Optimization Parameters")
 
 def get_combined_args(parser : ArgumentParser):
@@ -0,0 +1,110 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Times how long a checkpoint blocks training with torch.save and with
+# CheckpointWriter, then checks that sharded checkpoints round trip bitwise:
+# after overwriting a checkpoint that is still being written, after a restore
+# into a new GaussianModel, and after a replace interrupted between renames.
+# Run from the repository root: python -m benchmarks.checkpoint
+
+import os
+import copy
+import time
+import shutil
+import tempfile
+import torch
+from argparse import ArgumentParser
+from scene.gaussian_model import GaussianModel
+from utils.checkpoint_utils import CheckpointWriter, load_checkpoint
+from benchmarks.densify import TrainingArgs, simulate_step
+from benchmarks.ply_io import random_model
+
+def assert_same(value, expected, path=""):
+    if isinstance(expected, torch.Tensor):
+        assert type(value) == type(expected), "{} is a {}, expected {}".format(path, type(value), type(expected))
+        assert torch.equal(value, expected), "{} differs".format(path)
+        assert value.requires_grad == expected.requires_grad, "{} requires_grad differs".format(path)
+    elif isinstance(expected, (tuple, list)):
+        assert type(value) == type(expected) and len(value) == len(expected), "{} has a different structure".format(path)
+        for idx, (item, expected_item) in enumerate(zip(value, expected)):
+            assert_same(item, expected_item, "{}/{}".format(path, idx))
+    elif isinstance(expected, dict):
+        assert value.keys() == expected.keys(), "{} has different keys".format(path)
+        for key in expected:
+            assert_same(value[key], expected[key], "{}/{}".format(path, key))
+    else:
+        assert value == expected, "{} is {}, expected {}".format(path, value, expected)
+
+def training_model(num_points, sh_degree, generator):
+    gaussians = random_model(num_points, sh_degree)
+    for name in ("_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"):
+        setattr(gaussians, name, torch.nn.Parameter(getattr(gaussians, name).detach().clone()))
+    gaussians._opacity.data.abs_()
+    gaussians._scaling.data.mul_(0.5).sub_(5.0)
+    gaussians.spatial_lr_scale = 1.0
+    gaussians.max_radii2D = torch.zeros(num_points)
+    gaussians.training_setup(TrainingArgs)
+    # Adam state and spare capacity from a densification step
+    simulate_step(gaussians, generator)
+    gaussians.densify_and_prune(0.0002, 0.005, 5.0, 20)
+    simulate_step(gaussians, generator)
+    return gaussians
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Checkpoint benchmark")
+    parser.add_argument("--num_points", type=int, default=200_000)
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--shard_mb", type=float, default=16)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    generator = torch.Generator().manual_seed(0)
+    gaussians = training_model(args.num_points, args.sh_degree, generator)
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, "chkpnt7000")
+        start = time.time()
+        torch.save((gaussians.capture(), 7000), os.path.join(folder, "chkpnt7000.pth"))
+        print("torch.save blocks for {:.3f}s".format(time.time() - start))
+
+        writer = CheckpointWriter(args.shard_mb)
+        start = time.time()
+        writer.save(path, gaussians, 7000)
+        print("CheckpointWriter.save blocks for {:.3f}s".format(time.time() - start))
+        writer.close()
+        assert_same(load_checkpoint(path, "cpu"), (gaussians.capture(), 7000))
+        print("{} shards of at most {} MB".format(len(os.listdir(path)) - 1, args.shard_mb))
+
+        # The second save replaces the first, training goes on while both are written
+        writer.save(path, gaussians, 7000)
+        simulate_step(gaussians, generator)
+        expected = copy.deepcopy(gaussians.capture())
+        writer.save(path, gaussians, 7001)
+        simulate_step(gaussians, generator)
+        writer.close()
+        assert_same(load_checkpoint(path, "cpu"), (expected, 7001))
+        assert sorted(os.listdir(folder)) == ["chkpnt7000", "chkpnt7000.pth"], "Leftover files: {}".format(os.listdir(folder))
+
+        restored = GaussianModel(args.sh_degree, device="cpu")
+        restored.restore(path, TrainingArgs)
+        assert_same(restored.capture(), expected)
+        assert_same(load_checkpoint(os.path.join(folder, "chkpnt7000.pth"), "cpu")[1], 7000)
+
+        # A crash between the two renames of a replace leaves only the moved copy
+        os.replace(path, path + ".old12345")
+        assert_same(load_checkpoint(path, "cpu"), (expected, 7001))
+        writer.save(path, gaussians, 7002)
+        writer.close()
+        assert_same(load_checkpoint(path, "cpu"), (gaussians.capture(), 7002))
+        assert not os.path.exists(path + ".old12345"), "The copy of the interrupted replace was not removed"
+        print("Checkpoints round trip bitwise")
+    finally:
+        shutil.rmtree(folder)
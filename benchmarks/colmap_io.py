@@ -0,0 +1,103 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use 
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Compares the vectorized COLMAP binary readers with the previous
+# struct-per-element implementation on a synthetic reconstruction.
+# Run from the repository root: python -m benchmarks.colmap_io
+
+import os
+import struct
+import tempfile
+import numpy as np
+from argparse import ArgumentParser
+from scene.colmap_loader import read_next_bytes, read_points3D_binary, read_extrinsics_binary
+from benchmarks.common import timed
+
+def write_synthetic_model(folder, num_points, num_images, points2D_per_image, mean_track_length):
+    rng = np.random.default_rng(0)
+    with open(os.path.join(folder, "points3D.bin"), "wb") as fid:
+        fid.write(struct.pack("<Q", num_points))
+        for point_id in range(num_points):
+            track_length = int(rng.integers(2, 2 * mean_track_length - 1))
+            fid.write(struct.pack("<QdddBBBd", point_id + 1, *rng.random(3), *rng.integers(0, 256, 3), rng.random()))
+            fid.write(struct.pack("<Q", track_length))
+            fid.write(rng.integers(1, num_images, 2 * track_length).astype("<i4").tobytes())
+    with open(os.path.join(folder, "images.bin"), "wb") as fid:
+        fid.write(struct.pack("<Q", num_images))
+        for image_id in range(num_images):
+            fid.write(struct.pack("<idddddddi", image_id + 1, *rng.random(7), 1))
+            fid.write("image_{:06d}.png".format(image_id).encode("utf-8") + b"\x00")
+            fid.write(struct.pack("<Q", points2D_per_image))
+            points2D = np.empty(points2D_per_image, dtype=[("x", "<f8"), ("y", "<f8"), ("id", "<i8")])
+            points2D["x"] = rng.random(points2D_per_image)
+            points2D["y"] = rng.random(points2D_per_image)
+            points2D["id"] = rng.integers(-1, num_points, points2D_per_image)
+            fid.write(points2D.tobytes())
+
+def legacy_read_points3D_binary(path_to_model_file):
+    with open(path_to_model_file, "rb") as fid:
+        num_points = read_next_bytes(fid, 8, "Q")[0]
+        xyzs = np.empty((num_points, 3))
+        rgbs = np.empty((num_points, 3))
+        errors = np.empty((num_points, 1))
+        for p_id in range(num_points):
+            binary_point_line_properties = read_next_bytes(fid, num_bytes=43, format_char_sequence="QdddBBBd")
+            xyzs[p_id] = np.array(binary_point_line_properties[1:4])
+            rgbs[p_id] = np.array(binary_point_line_properties[4:7])
+            errors[p_id] = np.array(binary_point_line_properties[7])
+            track_length = read_next_bytes(fid, num_bytes=8, format_char_sequence="Q")[0]
+            read_next_bytes(fid, num_bytes=8*track_length, format_char_sequence="ii"*track_length)
+    return xyzs, rgbs, errors
+
+def legacy_read_extrinsics_binary(path_to_model_file):
+    images = {}
+    with open(path_to_model_file, "rb") as fid:
+        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
+        for _ in range(num_reg_images):
+            binary_image_properties = read_next_bytes(fid, num_bytes=64, format_char_sequence="idddddddi")
+            image_name = ""
+            current_char = read_next_bytes(fid, 1, "c")[0]
+            while current_char != b"\x00":
+                image_name += current_char.decode("utf-8")
+                current_char = read_next_bytes(fid, 1, "c")[0]
+            num_points2D = read_next_bytes(fid, num_bytes=8, format_char_sequence="Q")[0]
+            x_y_id_s = read_next_bytes(fid, num_bytes=24*num_points2D, format_char_sequence="ddq"*num_points2D)
+            xys = np.column_stack([tuple(map(float, x_y_id_s[0::3])), tuple(map(float, x_y_id_s[1::3]))])
+            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
+            images[binary_image_properties[0]] = (image_name, xys, point3D_ids)
+    return images
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="COLMAP binary reader benchmark")
+    parser.add_argument("--num_points", type=int, default=500_000)
+    parser.add_argument("--num_images", type=int, default=500)
+    parser.add_argument("--points2D_per_image", type=int, default=5_000)
+    parser.add_argument("--mean_track_length", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_synthetic_model(tmp_dir, args.num_points, args.num_images, args.points2D_per_image, args.mean_track_length)
+        points_path = os.path.join(tmp_dir, "points3D.bin")
+        images_path = os.path.join(tmp_dir, "images.bin")
+
+        legacy_points, legacy_time = timed(legacy_read_points3D_binary, points_path)
+        new_points, new_time = timed(read_points3D_binary, points_path)
+        assert all(np.array_equal(a, b) for a, b in zip(legacy_points, new_points))
+        print("points3D.bin ({} points): legacy {:.3f}s, vectorized {:.3f}s, {:.1f}x".format(
+            args.num_points, legacy_time, new_time, legacy_time / new_time))
+
+        legacy_images, legacy_time = timed(legacy_read_extrinsics_binary, images_path)
+        new_images, new_time = timed(read_extrinsics_binary, images_path)
+        for image_id, (name, xys, point3D_ids) in legacy_images.items():
+            image = new_images[image_id]
+            assert image.name == name and np.array_equal(image.xys, xys) and np.array_equal(image.point3D_ids, point3D_ids)
+        print("images.bin ({} images x {} keypoints): legacy {:.3f}s, vectorized {:.3f}s, {:.1f}x".format(
+            args.num_images, args.points2D_per_image, legacy_time, new_time, legacy_time / new_time))
@@ -0,0 +1,40 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Helpers shared by the benchmarks.
+
+import time
+from argparse import ArgumentParser
+from arguments import PipelineParams
+
+def pipeline(**overrides):
+    """
+    The pipeline parameters train.py and render.py use without command line
+    options, on the CPU rasterizer, with the given ones changed. Every call
+    returns a new object, so changing one does not affect other renders.
+    """
+    parser = ArgumentParser()
+    params = PipelineParams(parser)
+    pipe = params.extract(parser.parse_args([]))
+    pipe.rasterizer = "cpu"
+    for key, value in overrides.items():
+        assert hasattr(pipe, key), "Unknown pipeline parameter {}".format(key)
+        setattr(pipe, key, value)
+    return pipe
+
+def timed(func, *args, repeat=1):
+    # Result of func(*args) and its best wall time in seconds over repeat calls
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
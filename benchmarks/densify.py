@@ -0,0 +1,90 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Times GaussianModel.densify_and_prune over several densification steps of a
+# synthetic model and reports the peak memory of the run.
+# Run from the repository root: python -m benchmarks.densify
+
+import time
+import resource
+import torch
+from argparse import ArgumentParser
+from benchmarks.ply_io import random_model
+
+class TrainingArgs:
+    position_lr_init = 0.00016
+    position_lr_final = 0.0000016
+    position_lr_delay_mult = 0.01
+    position_lr_max_steps = 30_000
+    feature_lr = 0.0025
+    opacity_lr = 0.05
+    scaling_lr = 0.005
+    rotation_lr = 0.001
+    percent_dense = 0.01
+    max_gaussians = 0
+    gaussian_memory_mb = 0
+
+def peak_memory_mb(device):
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def simulate_step(gaussians, generator):
+    # One optimizer step with random gradients and densification statistics
+    n = gaussians.get_xyz.shape[0]
+    for param in (gaussians._xyz, gaussians._features_dc, gaussians._features_rest,
+                  gaussians._opacity, gaussians._scaling, gaussians._rotation):
+        param.grad = 1e-3 * torch.randn(param.shape, generator=generator).to(param.device)
+    visible = (torch.rand(n, generator=generator) > 0.3).to(gaussians.device)
+    gaussians.xyz_gradient_accum[visible] += 3e-4 * torch.rand((int(visible.sum()), 1), generator=generator).to(gaussians.device)
+    gaussians.denom[visible] += 1
+    gaussians.max_radii2D[visible] = 25 * torch.rand(int(visible.sum()), generator=generator).to(gaussians.device)
+    gaussians.optimizer.step()
+    gaussians.optimizer.zero_grad(set_to_none = True)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Densification benchmark")
+    parser.add_argument("--num_points", type=int, default=1_000_000)
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--max_gaussians", type=int, default=0)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+    device = torch.device(args.device)
+
+    torch.manual_seed(0)
+    generator = torch.Generator().manual_seed(0)
+    gaussians = random_model(args.num_points, args.sh_degree)
+    gaussians.device = device
+    for name in ("_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"):
+        setattr(gaussians, name, torch.nn.Parameter(getattr(gaussians, name).detach().to(device)))
+    # Keep the opacity mostly above the pruning threshold and the scales small
+    gaussians._opacity.data.abs_()
+    gaussians._scaling.data.mul_(0.5).sub_(5.0)
+    gaussians.spatial_lr_scale = 1.0
+    gaussians.max_radii2D = torch.zeros(args.num_points, device=device)
+    TrainingArgs.max_gaussians = args.max_gaussians
+    gaussians.training_setup(TrainingArgs)
+
+    total = 0.0
+    for step in range(args.steps):
+        simulate_step(gaussians, generator)
+        before = gaussians.get_xyz.shape[0]
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        start = time.time()
+        gaussians.densify_and_prune(0.0002, 0.005, 5.0, 20)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        elapsed = time.time() - start
+        total += elapsed
+        print("step {}: {} -> {} Gaussians in {:.3f}s".format(step, before, gaussians.get_xyz.shape[0], elapsed))
+    print("densify_and_prune: {:.3f}s per step, peak memory {:.0f} MB".format(total / args.steps, peak_memory_mb(device)))
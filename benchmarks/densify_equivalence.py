@@ -0,0 +1,222 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Checks that the capacity-buffer storage of GaussianModel gives bitwise the
+# same parameters, densification statistics and Adam state as the original
+# implementation, which concatenated and masked every tensor, over random
+# sequences of optimizer steps, densification, pruning and opacity resets.
+# Then checks that densify_and_prune, which plans the whole step before
+# applying it, matches running densify_and_clone, densify_and_split and
+# prune_points one after another, with and without a screen-size limit.
+# Run from the repository root: python -m benchmarks.densify_equivalence
+
+import torch
+from torch import nn
+from argparse import ArgumentParser
+from scene.gaussian_model import GaussianModel
+from utils.general_utils import inverse_sigmoid
+from benchmarks.densify import TrainingArgs
+from benchmarks.morton import surface_model
+
+PARAMETERS = ("_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation")
+STATISTICS = ("xyz_gradient_accum", "denom", "max_radii2D")
+
+class ReferenceModel(GaussianModel):
+    """
+    GaussianModel with the storage of the original implementation: every
+    densification step concatenates, and every prune masks, each parameter
+    and Adam moment into new tensors.
+    """
+    def replace_tensor_to_optimizer(self, tensor, name):
+        optimizable_tensors = {}
+        for group in self.optimizer.param_groups:
+            if group["name"] == name:
+                stored_state = self.optimizer.state.get(group['params'][0], None)
+                stored_state["exp_avg"] = torch.zeros_like(tensor)
+                stored_state["exp_avg_sq"] = torch.zeros_like(tensor)
+
+                del self.optimizer.state[group['params'][0]]
+                group["params"][0] = nn.Parameter(tensor.requires_grad_(True))
+                self.optimizer.state[group['params'][0]] = stored_state
+
+                optimizable_tensors[group["name"]] = group["params"][0]
+        return optimizable_tensors
+
+    def reset_opacity(self):
+        opacities_new = inverse_sigmoid(torch.min(self.get_opacity, torch.ones_like(self.get_opacity)*0.01))
+        optimizable_tensors = self.replace_tensor_to_optimizer(opacities_new, "opacity")
+        self._opacity = optimizable_tensors["opacity"]
+
+    def _prune_optimizer(self, mask):
+        optimizable_tensors = {}
+        for group in self.optimizer.param_groups:
+            stored_state = self.optimizer.state.get(group['params'][0], None)
+            if stored_state is not None:
+                stored_state["exp_avg"] = stored_state["exp_avg"][mask]
+                stored_state["exp_avg_sq"] = stored_state["exp_avg_sq"][mask]
+
+                del self.optimizer.state[group['params'][0]]
+                group["params"][0] = nn.Parameter((group["params"][0][mask].requires_grad_(True)))
+                self.optimizer.state[group['params'][0]] = stored_state
+            else:
+                group["params"][0] = nn.Parameter(group["params"][0][mask].requires_grad_(True))
+            optimizable_tensors[group["name"]] = group["params"][0]
+        return optimizable_tensors
+
+    def set_parameters(self, tensors):
+        (self._xyz, self._features_dc, self._features_rest,
+         self._opacity, self._scaling, self._rotation) = [tensors[name] for name in ("xyz", "f_dc", "f_rest", "opacity", "scaling", "rotation")]
+
+    def prune_points(self, mask):
+        valid_points_mask = ~mask
+        self.set_parameters(self._prune_optimizer(valid_points_mask))
+        self.xyz_gradient_accum = self.xyz_gradient_accum[valid_points_mask]
+        self.denom = self.denom[valid_points_mask]
+        self.max_radii2D = self.max_radii2D[valid_points_mask]
+
+    def cat_tensors_to_optimizer(self, tensors_dict):
+        optimizable_tensors = {}
+        for group in self.optimizer.param_groups:
+            extension_tensor = tensors_dict[group["name"]]
+            stored_state = self.optimizer.state.get(group['params'][0], None)
+            if stored_state is not None:
+                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor)), dim=0)
+                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor)), dim=0)
+
+                del self.optimizer.state[group['params'][0]]
+                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+                self.optimizer.state[group['params'][0]] = stored_state
+            else:
+                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+            optimizable_tensors[group["name"]] = group["params"][0]
+        return optimizable_tensors
+
+    def densification_postfix(self, new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation):
+        self.set_parameters(self.cat_tensors_to_optimizer({"xyz": new_xyz, "f_dc": new_features_dc, "f_rest": new_features_rest,
+                                                           "opacity": new_opacities, "scaling": new_scaling, "rotation": new_rotation}))
+        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), dtype=self.dtype, device=self.device)
+        self.denom = torch.zeros((self.get_xyz.shape[0], 1), dtype=self.dtype, device=self.device)
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), dtype=self.dtype, device=self.device)
+
+    def densify_and_prune(self, max_grad, min_opacity, extent, max_screen_size):
+        grads = self.xyz_gradient_accum / self.denom
+        grads[grads.isnan()] = 0.0
+
+        self.densify_and_clone(grads, max_grad, extent)
+        self.densify_and_split(grads, max_grad, extent)
+
+        prune_mask = (self.get_opacity < min_opacity).squeeze()
+        if max_screen_size:
+            big_points_vs = self.max_radii2D > max_screen_size
+            big_points_ws = self.get_scaling.max(dim=1).values > 0.1 * extent
+            prune_mask = torch.logical_or(torch.logical_or(prune_mask, big_points_vs), big_points_ws)
+        self.prune_points(prune_mask)
+
+def make_pair(num_points, sh_degree, seed):
+    models = []
+    for cls in (GaussianModel, ReferenceModel):
+        gaussians = surface_model(num_points, sh_degree, torch.Generator().manual_seed(seed))
+        model = cls(sh_degree, device="cpu")
+        for name in PARAMETERS:
+            setattr(model, name, nn.Parameter(getattr(gaussians, name).detach().clone()))
+        model.active_sh_degree = sh_degree
+        model.spatial_lr_scale = 1.0
+        model.max_radii2D = torch.zeros(num_points)
+        model.training_setup(TrainingArgs)
+        models.append(model)
+    return models
+
+def assert_equal(model, reference, step):
+    for name in PARAMETERS + STATISTICS:
+        assert torch.equal(getattr(model, name), getattr(reference, name)), "{} differs after {}".format(name, step)
+    for group, reference_group in zip(model.optimizer.param_groups, reference.optimizer.param_groups):
+        state = model.optimizer.state[group["params"][0]]
+        reference_state = reference.optimizer.state[reference_group["params"][0]]
+        for key in ("exp_avg", "exp_avg_sq"):
+            assert torch.equal(state[key], reference_state[key]), "Adam {} of {} differs after {}".format(key, group["name"], step)
+
+def optimizer_step(models, generator):
+    num_points = models[0].get_xyz.shape[0]
+    grads = [torch.randn(getattr(models[0], name).shape, generator=generator) * 1e-2 for name in PARAMETERS]
+    visible = torch.rand(num_points, generator=generator) > 0.3
+    accum = torch.rand((int(visible.sum()), 1), generator=generator) * 4e-4
+    radii = torch.rand(int(visible.sum()), generator=generator) * 30
+    for model in models:
+        for name, grad in zip(PARAMETERS, grads):
+            getattr(model, name).grad = grad.clone()
+        model.xyz_gradient_accum[visible] += accum
+        model.denom[visible] += 1
+        model.max_radii2D[visible] = radii
+        model.optimizer.step()
+        model.optimizer.zero_grad(set_to_none=True)
+
+def check_storage(num_points, sh_degree, num_steps, seed):
+    models = make_pair(num_points, sh_degree, seed)
+    generator = torch.Generator().manual_seed(seed)
+    for step in range(num_steps):
+        optimizer_step(models, generator)
+        assert_equal(*models, "optimizer step {}".format(step))
+
+        # Append copies of random rows, as cloning does, then drop random rows
+        source = torch.randint(0, models[0].get_xyz.shape[0], (int(torch.randint(1, num_points, (1,), generator=generator)),), generator=generator)
+        drop = torch.rand(models[0].get_xyz.shape[0] + source.shape[0], generator=generator) < 0.2
+        for model in models:
+            model.densification_postfix(*[getattr(model, name).detach()[source] for name in PARAMETERS])
+        assert_equal(*models, "densification_postfix {}".format(step))
+        for model in models:
+            model.prune_points(drop)
+        assert_equal(*models, "prune_points {}".format(step))
+
+        if step % 3 == 2:
+            for model in models:
+                model.reset_opacity()
+            assert_equal(*models, "reset_opacity {}".format(step))
+    return models[0].get_xyz.shape[0]
+
+def check_densification(num_points, sh_degree, num_steps, seed, max_screen_size):
+    models = make_pair(num_points, sh_degree, seed)
+    generator = torch.Generator().manual_seed(seed)
+    # Spread opacities and sizes so that every pruning criterion fires
+    opacity = inverse_sigmoid(torch.rand((num_points, 1), generator=generator) * 0.1 + 1e-4)
+    log_scale = torch.log(torch.rand((num_points, 1), generator=generator) * 0.8 + 1e-3)
+    with torch.no_grad():
+        for model in models:
+            model._opacity.copy_(opacity)
+            model._scaling.copy_(log_scale.expand(-1, 3))
+    for step in range(num_steps):
+        optimizer_step(models, generator)
+        if step % 2 == 1:
+            # Both paths draw the split samples from the global generator
+            for model in models:
+                torch.manual_seed(seed * num_steps + step)
+                model.densify_and_prune(2e-4, 0.005, 5.0, max_screen_size)
+            assert_equal(*models, "densify_and_prune {}".format(step))
+        if step % 4 == 3:
+            for model in models:
+                model.reset_opacity()
+            assert_equal(*models, "reset_opacity {}".format(step))
+    return models[0].get_xyz.shape[0]
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Densification equivalence check")
+    parser.add_argument("--num_points", type=int, default=5000)
+    parser.add_argument("--sh_degree", type=int, default=2)
+    parser.add_argument("--num_steps", type=int, default=8)
+    parser.add_argument("--num_seeds", type=int, default=5)
+    args = parser.parse_args()
+
+    for seed in range(args.num_seeds):
+        final = check_storage(args.num_points, args.sh_degree, args.num_steps, seed)
+        print("seed {}: storage matches the reference over {} steps, {} -> {} Gaussians".format(seed, args.num_steps, args.num_points, final))
+    for max_screen_size in (None, 20):
+        for seed in range(args.num_seeds):
+            final = check_densification(args.num_points, args.sh_degree, args.num_steps, seed, max_screen_size)
+            print("seed {}, max_screen_size {}: densification matches the sequential path, {} -> {} Gaussians".format(seed, max_screen_size, args.num_points, final))
@@ -0,0 +1,81 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Renders a large outdoor-like scene (Gaussians scattered over a ground plane
+# around the camera) with and without frustum pre-culling, checks that images
+# and radii agree, and reports the time of the culling stage and of render.
+# Run from the repository root: python -m benchmarks.frustum_culling
+
+import math
+import torch
+from torch import nn
+from argparse import ArgumentParser
+from scene.gaussian_model import GaussianModel
+from benchmarks.morton import make_camera
+from benchmarks.common import pipeline, timed
+from gaussian_renderer import render, frustum_cull
+
+def outdoor_model(num_points, sh_degree, extent, generator):
+    xz = (torch.rand((num_points, 2), generator=generator) * 2 - 1) * extent
+    y = 1.0 + 0.5 * torch.rand((num_points, 1), generator=generator)
+    xyz = torch.stack((xz[:, 0], y[:, 0], xz[:, 1]), dim=1)
+    num_coeffs = (sh_degree + 1) ** 2
+    gaussians = GaussianModel(sh_degree, device="cpu")
+    gaussians._xyz = nn.Parameter(xyz)
+    gaussians._features_dc = nn.Parameter(torch.rand((num_points, 1, 3), generator=generator))
+    gaussians._features_rest = nn.Parameter(0.1 * torch.randn((num_points, num_coeffs - 1, 3), generator=generator))
+    gaussians._opacity = nn.Parameter(torch.randn((num_points, 1), generator=generator))
+    gaussians._scaling = nn.Parameter(math.log(0.05) + torch.randn((num_points, 3), generator=generator))
+    gaussians._rotation = nn.Parameter(torch.randn((num_points, 4), generator=generator))
+    gaussians.active_sh_degree = sh_degree
+    return gaussians
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Frustum pre-culling benchmark")
+    parser.add_argument("--num_points", type=int, default=300_000)
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--extent", type=float, default=200.0)
+    parser.add_argument("--render_size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    gaussians = outdoor_model(args.num_points, args.sh_degree, args.extent, generator)
+    camera = make_camera(args.render_size, args.render_size, 0.0)
+    background = torch.zeros(3)
+    full_pipeline = pipeline()
+    culled_pipeline = pipeline(frustum_culling=True)
+
+    with torch.no_grad():
+        indices, cull_time = timed(frustum_cull, camera, gaussians, repeat=args.repeat)
+        full, full_time = timed(render, camera, gaussians, full_pipeline, background, repeat=args.repeat)
+        culled, culled_time = timed(render, camera, gaussians, culled_pipeline, background, repeat=args.repeat)
+
+    num_visible = args.num_points if indices is None else indices.shape[0]
+    kept = torch.zeros(args.num_points, dtype=torch.bool)
+    kept[indices if indices is not None else slice(None)] = True
+    assert torch.equal(full["radii"][kept], culled["radii"][kept]), "Culling changed the radii of kept Gaussians"
+    max_error = float((full["render"] - culled["render"]).abs().max())
+    assert max_error < 1e-5, "Culling changed the image"
+    # The rasterizer gives a radius to Gaussians whose bounds touch a border tile, even off-image
+    border_only = int(torch.logical_and(~kept, full["radii"] > 0).sum())
+    print("{} Gaussians, {} ({:.1f}%) pass the culling test in {:.1f} ms, {} culled ones only reached border tiles".format(
+        args.num_points, num_visible, 100.0 * num_visible / args.num_points, 1000 * cull_time, border_only))
+    print("render: {:.3f}s without culling, {:.3f}s with culling ({:.2f}x), max pixel difference {:.2e}".format(
+        full_time, culled_time, full_time / culled_time, max_error))
+
+    # Training step: forward and backward through all parameters
+    def step(pipe):
+        render(camera, gaussians, pipe, background)["render"].sum().backward()
+    _, full_time = timed(step, full_pipeline, repeat=args.repeat)
+    _, culled_time = timed(step, culled_pipeline, repeat=args.repeat)
+    print("forward + backward: {:.3f}s without culling, {:.3f}s with culling ({:.2f}x)".format(
+        full_time, culled_time, full_time / culled_time))
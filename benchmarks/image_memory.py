@@ -0,0 +1,64 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Measures the resident memory of a scene's ground truth images when cameras
+# keep them as uint8 compared to the previous float32 storage.
+# Run from the repository root: python -m benchmarks.image_memory
+
+import gc
+import numpy as np
+import multiprocessing
+from argparse import ArgumentParser
+from scene.cameras import Camera
+from utils.general_utils import NumpyToTorch
+
+def rss_bytes():
+    with open("/proc/self/statm") as fid:
+        return int(fid.read().split()[1]) * 4096
+
+def make_cameras(num_images, width, height, legacy):
+    rng = np.random.default_rng(0)
+    cameras = []
+    for idx in range(num_images):
+        image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        if legacy:
+            # Previous behaviour: the float32 ground truth is what stays resident
+            cameras.append(NumpyToTorch(image).clamp(0.0, 1.0))
+        else:
+            cameras.append(Camera(colmap_id=idx, R=np.eye(3), T=np.zeros(3), FoVx=1.0, FoVy=1.0,
+                                  image=NumpyToTorch(image, normalize=False), gt_alpha_mask=None,
+                                  image_name=str(idx), uid=idx, data_device="cpu", device="cpu"))
+    return cameras
+
+def measure(num_images, width, height, legacy):
+    gc.collect()
+    before = rss_bytes()
+    cameras = make_cameras(num_images, width, height, legacy)
+    gc.collect()
+    after = rss_bytes()
+    tensors = cameras if legacy else [camera.raw_image[0] for camera in cameras]
+    image_bytes = sum(t.element_size() * t.nelement() for t in tensors)
+    del cameras, tensors
+    return image_bytes, after - before
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Ground truth image memory benchmark")
+    parser.add_argument("--num_images", type=int, default=1000)
+    parser.add_argument("--width", type=int, default=400)
+    parser.add_argument("--height", type=int, default=300)
+    args = parser.parse_args()
+
+    for name, legacy in (("float32", True), ("uint8", False)):
+        # Fresh process per run so that freed pages of one run do not hide the next one's growth
+        with multiprocessing.Pool(1) as pool:
+            image_bytes, rss = pool.apply(measure, (args.num_images, args.width, args.height, legacy))
+        print("{:>7}: {} images {}x{}, image tensors {:.0f} MB, RSS increase {:.0f} MB".format(
+            name, args.num_images, args.width, args.height, image_bytes / 2**20, rss / 2**20))
@@ -0,0 +1,58 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Builds the level-of-detail hierarchy of a dense synthetic scene and renders
+# it from increasing distances, with all Gaussians and with the hierarchy cut
+# for several thresholds: Gaussians rendered, CPU render time, and PSNR of the
+# cut against the full render.
+# Run from the repository root: python -m benchmarks.lod
+
+import time
+import torch
+from argparse import ArgumentParser
+from benchmarks.morton import surface_model, make_camera
+from benchmarks.common import pipeline, timed
+from gaussian_renderer import render
+from utils.image_utils import psnr
+from utils.lod_utils import GaussianHierarchy
+
+def timed_render(camera, gaussians, pipe, background):
+    package, elapsed = timed(render, camera, gaussians, pipe, background)
+    return torch.clamp(package["render"], 0.0, 1.0), elapsed
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Level-of-detail benchmark")
+    parser.add_argument("--num_points", type=int, default=500_000)
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--render_size", type=int, default=256)
+    parser.add_argument("--distances", nargs="+", type=float, default=[10.0, 30.0, 100.0])
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[1.0, 2.0])
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    gaussians = surface_model(args.num_points, args.sh_degree, generator)
+    background = torch.zeros(3)
+
+    with torch.no_grad():
+        start = time.perf_counter()
+        gaussians.lod = GaussianHierarchy.build(gaussians)
+        print("{} Gaussians: hierarchy of {} parents built in {:.2f}s".format(
+            args.num_points, gaussians.lod.xyz.shape[0], time.perf_counter() - start))
+        for distance in args.distances:
+            camera = make_camera(args.render_size, args.render_size, distance)
+            reference, full_time = timed_render(camera, gaussians, pipeline(), background)
+            print("distance {:5.1f}: all Gaussians {:.3f}s".format(distance, full_time))
+            for threshold in args.thresholds:
+                image, lod_time = timed_render(camera, gaussians, pipeline(lod_threshold=threshold), background)
+                leaves, nodes = gaussians.lod.select(gaussians, camera, threshold)
+                print("  lod_threshold {:.1f}: {:7d} Gaussians ({:.1f}%), {:.3f}s ({:.2f}x), PSNR {:.2f} dB vs all".format(
+                    threshold, leaves.shape[0] + nodes.shape[0], 100.0 * (leaves.shape[0] + nodes.shape[0]) / args.num_points,
+                    lod_time, full_time / lod_time, float(psnr(image, reference).mean())))
@@ -0,0 +1,156 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Compares a Gaussian model stored in densification (random) order with the
+# same model sorted along the Morton curve: size of the gzip-compressed PLY and
+# of the point_cloud.npz format, and time of CPU workloads that touch the
+# Gaussians in spatial groups (gathering the attributes of box crops, and the
+# CPU rasterizer). First checks that reordering a model in the middle of
+# training, with pending gradients, permutes its Adam state and densification
+# statistics along: training continues exactly as in the original order.
+# Run from the repository root: python -m benchmarks.morton
+
+import os
+import gzip
+import math
+import tempfile
+import torch
+import numpy as np
+from torch import nn
+from argparse import ArgumentParser
+from scene.gaussian_model import GaussianModel
+from scene.cameras import MiniCam
+from gaussian_renderer import render
+from benchmarks.densify import TrainingArgs, simulate_step
+from benchmarks.common import pipeline, timed
+from utils.graphics_utils import getWorld2View2, getProjectionMatrix
+from utils.spatial_utils import morton_order
+
+def surface_model(num_points, sh_degree, generator):
+    # Gaussians on a few noisy spheres whose attributes vary smoothly in space, like a trained scene
+    centers = torch.randn((8, 3), generator=generator) * 2
+    surface = torch.nn.functional.normalize(torch.randn((num_points, 3), generator=generator), dim=1)
+    xyz = centers[torch.randint(0, 8, (num_points,), generator=generator)] + surface * (1 + 0.02 * torch.randn((num_points, 1), generator=generator))
+    noise = lambda *shape: 0.02 * torch.randn(shape, generator=generator)
+    num_rest = (sh_degree + 1) ** 2 - 1
+    gaussians = GaussianModel(sh_degree, device="cpu")
+    gaussians._xyz = nn.Parameter(xyz)
+    gaussians._features_dc = nn.Parameter(torch.sin(2 * xyz)[:, None, :] + noise(num_points, 1, 3))
+    gaussians._features_rest = nn.Parameter(0.1 * torch.cos(xyz[:, None, :] * torch.arange(1, num_rest + 1)[None, :, None]) + noise(num_points, num_rest, 3))
+    gaussians._opacity = nn.Parameter(torch.sin(xyz.sum(dim=1, keepdim=True)) + noise(num_points, 1))
+    gaussians._scaling = nn.Parameter(math.log(0.01) + 0.3 * torch.cos(xyz) + noise(num_points, 3))
+    gaussians._rotation = nn.Parameter(torch.cat((torch.ones((num_points, 1)), 0.3 * surface), dim=1) + noise(num_points, 4))
+    gaussians.active_sh_degree = sh_degree
+    # Densification leaves the Gaussians in no particular order
+    gaussians.reorder(torch.randperm(num_points, generator=generator))
+    return gaussians
+
+def make_camera(width, height, distance):
+    fov = math.radians(60)
+    world_view_transform = torch.tensor(getWorld2View2(np.eye(3), np.array([0, 0, distance]))).transpose(0, 1)
+    projection_matrix = getProjectionMatrix(0.01, 100.0, fov, fov).transpose(0, 1)
+    full_proj_transform = world_view_transform.unsqueeze(0).bmm(projection_matrix.unsqueeze(0)).squeeze(0)
+    return MiniCam(width, height, fov, fov, 0.01, 100.0, world_view_transform, full_proj_transform)
+
+def file_sizes(gaussians, tmp_dir):
+    ply_path = os.path.join(tmp_dir, "point_cloud.ply")
+    npz_path = os.path.join(tmp_dir, "point_cloud.npz")
+    gaussians.save_ply(ply_path)
+    gaussians.save_compressed(npz_path, kmeans_iters=3)
+    with open(ply_path, "rb") as fid:
+        ply_gzip = len(gzip.compress(fid.read(), compresslevel=6))
+    return os.path.getsize(ply_path), ply_gzip, os.path.getsize(npz_path)
+
+def crop_indices(gaussians, boxes):
+    xyz = gaussians.get_xyz.detach()
+    return [torch.logical_and(xyz >= low, xyz <= high).all(dim=1).nonzero().squeeze(-1) for low, high in boxes]
+
+def gather_crops(gaussians, crops):
+    # Gather every attribute of the Gaussians of each crop; finding them is a full scan in either order and not timed
+    total = 0.0
+    for idx in crops:
+        total += sum(float(getattr(gaussians, name).detach()[idx].sum()) for name in ("_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"))
+    return total
+
+def check_reorder(num_points, sh_degree, num_steps, generator):
+    models = []
+    for _ in range(2):
+        gaussians = surface_model(num_points, sh_degree, torch.Generator().manual_seed(1))
+        gaussians.spatial_lr_scale = 1.0
+        gaussians.max_radii2D = torch.zeros(num_points)
+        gaussians.training_setup(TrainingArgs)
+        models.append(gaussians)
+    reference, sorted_model = models
+    # Same steps and densification on both, so that the Adam state and spare buffer capacity are populated
+    for gaussians in models:
+        simulate_step(gaussians, torch.Generator().manual_seed(2))
+        torch.manual_seed(3)
+        gaussians.densify_and_prune(0.0002, 0.005, 5.0, 20)
+    order = torch.arange(reference.get_xyz.shape[0])
+    params = ("_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation")
+    for step in range(num_steps):
+        n = reference.get_xyz.shape[0]
+        grads = [torch.randn(getattr(reference, name).shape, generator=generator) for name in params]
+        visible = torch.rand(n, generator=generator) > 0.3
+        stats = torch.rand((n, 1), generator=generator) * visible[:, None]
+        for gaussians, rows in ((reference, torch.arange(n)), (sorted_model, order)):
+            for name, grad in zip(params, grads):
+                getattr(gaussians, name).grad = grad[rows].clone()
+            gaussians.xyz_gradient_accum += stats[rows]
+            gaussians.denom[visible[rows]] += 1
+            gaussians.max_radii2D.copy_(torch.max(gaussians.max_radii2D, 30 * stats[rows, 0]))
+        # Reorder between backward and the optimizer step
+        permutation = morton_order(sorted_model.get_xyz.detach()) if step % 2 == 0 else torch.randperm(n, generator=generator)
+        sorted_model.reorder(permutation)
+        order = order[permutation]
+        for gaussians in models:
+            gaussians.optimizer.step()
+            gaussians.optimizer.zero_grad(set_to_none=True)
+
+    for name in params + ("xyz_gradient_accum", "denom", "max_radii2D"):
+        assert torch.equal(getattr(reference, name)[order], getattr(sorted_model, name)), "{} does not follow the permutation".format(name)
+    for group, sorted_group in zip(reference.optimizer.param_groups, sorted_model.optimizer.param_groups):
+        state = reference.optimizer.state[group["params"][0]]
+        sorted_state = sorted_model.optimizer.state[sorted_group["params"][0]]
+        for key in ("exp_avg", "exp_avg_sq"):
+            assert torch.equal(state[key][order], sorted_state[key]), "Adam {} of {} does not follow the permutation".format(key, group["name"])
+        assert torch.equal(torch.as_tensor(state["step"]), torch.as_tensor(sorted_state["step"]))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Morton order benchmark")
+    parser.add_argument("--num_points", type=int, default=500_000)
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--num_boxes", type=int, default=200)
+    parser.add_argument("--render_size", type=int, default=400)
+    parser.add_argument("--check_points", type=int, default=5000)
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    check_reorder(args.check_points, args.sh_degree, 6, generator)
+    print("Reordering during training keeps the Adam state and statistics consistent")
+    gaussians = surface_model(args.num_points, args.sh_degree, generator)
+    boxes = []
+    for _ in range(args.num_boxes):
+        low = gaussians.get_xyz[torch.randint(0, args.num_points, (1,), generator=generator)].detach() - 0.25
+        boxes.append((low, low + 0.5))
+    camera = make_camera(args.render_size, args.render_size, 10.0)
+    background = torch.zeros(3)
+
+    with tempfile.TemporaryDirectory() as tmp_dir, torch.no_grad():
+        for name in ("random", "morton"):
+            if name == "morton":
+                gaussians.sort_morton()
+            ply_bytes, ply_gzip, npz_bytes = file_sizes(gaussians, tmp_dir)
+            _, crop_time = timed(gather_crops, gaussians, crop_indices(gaussians, boxes), repeat=3)
+            _, render_time = timed(render, camera, gaussians, pipeline(), background)
+            print("{:>7}: PLY {:.1f} MB, gzip {:.1f} MB ({:.2f}x), npz {:.1f} MB ({:.2f}x), {} crop gathers {:.3f}s, CPU render {:.3f}s".format(
+                name, ply_bytes / 2**20, ply_gzip / 2**20, ply_bytes / ply_gzip, npz_bytes / 2**20, ply_bytes / npz_bytes,
+                args.num_boxes, crop_time, render_time))
@@ -0,0 +1,62 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use 
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Times GaussianModel PLY serialization for growing point counts, then checks
+# that big-endian and ASCII files written by other tools load bitwise.
+# Run from the repository root: python -m benchmarks.ply_io
+
+import os
+import tempfile
+import torch
+from torch import nn
+from argparse import ArgumentParser
+from plyfile import PlyData
+from scene.gaussian_model import GaussianModel
+from benchmarks.common import timed
+
+def random_model(num_points, sh_degree):
+    gaussians = GaussianModel(sh_degree, device="cpu")
+    gaussians._xyz = nn.Parameter(torch.randn((num_points, 3)))
+    gaussians._features_dc = nn.Parameter(torch.randn((num_points, 1, 3)))
+    gaussians._features_rest = nn.Parameter(torch.randn((num_points, (sh_degree + 1) ** 2 - 1, 3)))
+    gaussians._opacity = nn.Parameter(torch.randn((num_points, 1)))
+    gaussians._scaling = nn.Parameter(torch.randn((num_points, 3)))
+    gaussians._rotation = nn.Parameter(torch.randn((num_points, 4)))
+    gaussians.active_sh_degree = sh_degree
+    return gaussians
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="PLY save/load benchmark")
+    parser.add_argument("--num_points", nargs="+", type=int, default=[250_000, 500_000, 1_000_000, 2_000_000])
+    parser.add_argument("--sh_degree", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "point_cloud.ply")
+        print("{:>10} {:>10} {:>10} {:>12}".format("points", "save [s]", "load [s]", "save [s/M]"))
+        for num_points in args.num_points:
+            gaussians = random_model(num_points, args.sh_degree)
+            _, save_time = timed(gaussians.save_ply, path)
+            _, load_time = timed(GaussianModel(args.sh_degree, device="cpu").load_ply, path)
+            print("{:>10} {:>10.3f} {:>10.3f} {:>12.3f}".format(num_points, save_time, load_time, save_time / num_points * 1e6))
+
+        gaussians = random_model(1000, args.sh_degree)
+        gaussians.save_ply(path)
+        elements = PlyData.read(path).elements
+        for name, text, byte_order in (("Big-endian", False, ">"), ("ASCII", True, "=")):
+            # A new file, elements may be memory-mapped from the old one
+            converted_path = os.path.join(tmp_dir, name + ".ply")
+            PlyData(elements, text=text, byte_order=byte_order).write(converted_path)
+            loaded = GaussianModel(args.sh_degree, device="cpu")
+            loaded.load_ply(converted_path)
+            for attribute in ("_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"):
+                assert torch.equal(getattr(loaded, attribute), getattr(gaussians, attribute)), "{} {} differs".format(name, attribute)
+            print("{} files load bitwise".format(name))
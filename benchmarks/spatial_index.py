@@ -0,0 +1,87 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Times building, updating and querying GaussianBVH and checks every query
+# against a brute-force test of all Gaussian boxes.
+# Run from the repository root: python -m benchmarks.spatial_index
+
+import torch
+from argparse import ArgumentParser
+from benchmarks.densify import TrainingArgs
+from benchmarks.morton import surface_model, make_camera
+from benchmarks.common import timed
+from utils.spatial_utils import GaussianBVH, boxes_overlap, boxes_in_frustum, boxes_hit_by_ray, frustum_planes
+
+def check(name, bvh, indices, brute_force_mask):
+    expected = brute_force_mask(bvh.boxes).nonzero().squeeze(-1)
+    assert torch.equal(indices, expected), "{}: BVH query differs from the brute-force test".format(name)
+
+def run_queries(bvh, gaussians, generator, num_queries):
+    xyz = gaussians.get_xyz.detach()
+    timings = {"box": [0.0, 0.0], "frustum": [0.0, 0.0], "ray": [0.0, 0.0]}
+    found = {"box": 0, "frustum": 0, "ray": 0}
+    for _ in range(num_queries):
+        low = xyz[torch.randint(0, xyz.shape[0], (1,), generator=generator)][0] - 0.2
+        high = low + 0.4
+        test = lambda boxes: boxes_overlap(boxes, low, high)
+        result, elapsed = timed(bvh.query_box, low, high)
+        timings["box"][0] += elapsed
+        timings["box"][1] += timed(test, bvh.boxes)[1]
+        check("box", bvh, result, test)
+        found["box"] += result.shape[0]
+
+        camera = make_camera(64, 64, 2.0 + 6.0 * float(torch.rand(1, generator=generator)))
+        planes = frustum_planes(camera.full_proj_transform)
+        test = lambda boxes: boxes_in_frustum(boxes, planes)
+        result, elapsed = timed(bvh.query_frustum, camera.full_proj_transform)
+        timings["frustum"][0] += elapsed
+        timings["frustum"][1] += timed(test, bvh.boxes)[1]
+        check("frustum", bvh, result, test)
+        found["frustum"] += result.shape[0]
+
+        origin = torch.randn(3, generator=generator) * 6
+        direction = torch.nn.functional.normalize(xyz[torch.randint(0, xyz.shape[0], (1,), generator=generator)][0] - origin, dim=0)
+        test = lambda boxes: boxes_hit_by_ray(boxes, origin, direction)
+        result, elapsed = timed(bvh.query_ray, origin, direction)
+        timings["ray"][0] += elapsed
+        timings["ray"][1] += timed(test, bvh.boxes)[1]
+        check("ray", bvh, result, test)
+        found["ray"] += result.shape[0]
+    for name, (bvh_time, brute_time) in timings.items():
+        print("  {:>7} queries: {:8.2f} ms BVH, {:8.2f} ms brute force, {:9.0f} Gaussians found on average".format(
+            name, 1000 * bvh_time / num_queries, 1000 * brute_time / num_queries, found[name] / num_queries))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Spatial index benchmark")
+    parser.add_argument("--num_points", type=int, default=1_000_000)
+    parser.add_argument("--sh_degree", type=int, default=1)
+    parser.add_argument("--num_queries", type=int, default=20)
+    parser.add_argument("--leaf_size", type=int, default=256)
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    torch.manual_seed(0)
+    gaussians = surface_model(args.num_points, args.sh_degree, generator)
+    bvh, elapsed = timed(GaussianBVH, gaussians, args.leaf_size)
+    print("{} Gaussians: build {:.3f}s, {} levels".format(args.num_points, elapsed, len(bvh.levels)))
+    run_queries(bvh, gaussians, generator, args.num_queries)
+
+    # Densify, then follow the change incrementally and compare with a rebuild
+    gaussians.spatial_lr_scale = 1.0
+    gaussians.max_radii2D = torch.zeros(args.num_points)
+    gaussians.training_setup(TrainingArgs)
+    gaussians.xyz_gradient_accum += 3e-4 * torch.rand((args.num_points, 1), generator=generator)
+    gaussians.denom += 1
+    sources = gaussians.densify_and_prune(0.0002, 0.005, 5.0, None)
+    _, update_time = timed(bvh.update, gaussians, sources)
+    _, rebuild_time = timed(GaussianBVH, gaussians, args.leaf_size)
+    print("densified to {} Gaussians: update {:.3f}s, rebuild {:.3f}s".format(gaussians.get_xyz.shape[0], update_time, rebuild_time))
+    run_queries(bvh, gaussians, generator, args.num_queries)
@@ -0,0 +1,84 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Compares the separable, cached-window SSIM with the direct 2D-window
+# implementation: values and gradients must agree within --tolerance, on the
+# benchmark image and on --num_cases random shapes, batch sizes, channel
+# counts and window sizes.
+# Run from the repository root: python -m benchmarks.ssim
+
+import time
+import torch
+from argparse import ArgumentParser
+from utils.loss_utils import ssim, reference_ssim
+
+def timed(func, repeats, device):
+    func()  # warm up, fills the window cache
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(repeats):
+        func()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.time() - start) / repeats
+
+def loss_and_grad(ssim_func, img1, img2):
+    img1 = img1.detach().requires_grad_(True)
+    loss = 1.0 - ssim_func(img1, img2)
+    loss.backward()
+    return loss.detach(), img1.grad
+
+def check(img1, img2, tolerance, **kwargs):
+    reference_loss, reference_grad = loss_and_grad(lambda a, b: reference_ssim(a, b, **kwargs).sum(), img1, img2)
+    loss, grad = loss_and_grad(lambda a, b: ssim(a, b, **kwargs).sum(), img1, img2)
+    loss_error = (loss - reference_loss).abs().item()
+    grad_error = (grad - reference_grad).abs().max().item()
+    assert loss_error <= tolerance and grad_error <= tolerance, \
+        "SSIM differs from the reference for shape {} and {}: loss {:.3e}, gradient {:.3e}".format(tuple(img1.shape), kwargs, loss_error, grad_error)
+    return loss_error, grad_error
+
+def random_cases(num_cases, tolerance, device, generator):
+    randint = lambda low, high: int(torch.randint(low, high, (1,), generator=generator))
+    for _ in range(num_cases):
+        shape = (randint(1, 5), randint(8, 64), randint(8, 64))
+        batched = randint(0, 2) == 1
+        if batched:
+            shape = (randint(1, 4),) + shape
+        gt = torch.rand(shape, generator=generator).to(device)
+        image = (gt + 0.2 * torch.randn(shape, generator=generator).to(device)).clamp(0.0, 1.0)
+        # Unbatched inputs only support the averaged loss
+        check(image, gt, tolerance, window_size=2 * randint(1, 7) + 1, size_average=not batched or randint(0, 2) == 1)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="SSIM benchmark")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    parser.add_argument("--num_cases", type=int, default=50)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+    device = torch.device(args.device)
+
+    torch.manual_seed(0)
+    gt = torch.rand((3, args.height, args.width), device=device)
+    image = (gt + 0.1 * torch.randn_like(gt)).clamp(0.0, 1.0)
+
+    loss_error, grad_error = check(image, gt, args.tolerance)
+    print("Max abs difference: loss {:.3e}, gradient {:.3e}".format(loss_error, grad_error))
+    random_cases(args.num_cases, args.tolerance, device, torch.Generator().manual_seed(0))
+    print("{} random cases agree within {:.0e}".format(args.num_cases, args.tolerance))
+
+    for name, func in (("reference", reference_ssim), ("separable", ssim)):
+        forward = timed(lambda: func(image, gt), args.repeats, device)
+        backward = timed(lambda: loss_and_grad(func, image, gt), args.repeats, device)
+        print("{:>9}: forward {:.2f} ms, forward+backward {:.2f} ms".format(name, 1000 * forward, 1000 * backward))
@@ -0,0 +1,66 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import json
+import torch
+from scene import Scene
+from utils.eval_utils import evaluate
+from utils.general_utils import safe_state
+from argparse import ArgumentParser
+from arguments import ModelParams, PipelineParams, get_combined_args
+from gaussian_renderer import GaussianModel
+
+def compress_model(dataset : ModelParams, iteration : int, pipeline : PipelineParams, codebook_size : int, kmeans_iters : int):
+    with torch.no_grad():
+        gaussians = GaussianModel(dataset.sh_degree, dataset.device)
+        scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+        point_cloud_path = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter))
+        ply_path = os.path.join(point_cloud_path, "point_cloud.ply")
+        compressed_path = os.path.join(point_cloud_path, "point_cloud.npz")
+
+        gaussians.save_compressed(compressed_path, codebook_size, kmeans_iters)
+        decoded = GaussianModel(dataset.sh_degree, dataset.device)
+        decoded.load_compressed(compressed_path)
+
+        bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
+        background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
+        eval_name, eval_views = ("test", scene.getTestCameras()) if scene.getTestCameras() else ("train", scene.getTrainCameras())
+        report = {"num_gaussians": gaussians.get_xyz.shape[0],
+                  "eval_set": eval_name,
+                  "ply_bytes": os.path.getsize(ply_path),
+                  "compressed_bytes": os.path.getsize(compressed_path),
+                  "psnr": evaluate(eval_views, gaussians, pipeline, background),
+                  "compressed_psnr": evaluate(eval_views, decoded, pipeline, background)}
+
+    print("{} Gaussians: {:.1f} MB -> {:.1f} MB ({:.1f}x smaller), {} PSNR {:.3f} -> {:.3f} ({:+.3f})".format(
+        report["num_gaussians"], report["ply_bytes"] / 2**20, report["compressed_bytes"] / 2**20,
+        report["ply_bytes"] / report["compressed_bytes"], eval_name, report["psnr"], report["compressed_psnr"],
+        report["compressed_psnr"] - report["psnr"]))
+    with open(os.path.join(point_cloud_path, "compression.json"), 'w') as fp:
+        json.dump(report, fp, indent=True)
+
+if __name__ == "__main__":
+    # Set up command line argument parser
+    parser = ArgumentParser(description="Compression script parameters")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--codebook_size", default=4096, type=int)
+    parser.add_argument("--kmeans_iters", default=10, type=int)
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Compressing " + args.model_path)
+
+    # Initialize system state (RNG)
+    safe_state(args.quiet)
+
+    compress_model(model.extract(args), args.iteration, pipeline.extract(args), args.codebook_size, args.kmeans_iters)
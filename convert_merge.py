@@ -6,6 +6,7 @@ import sqlite3
 import struct
 from PIL import Image
 import numpy as np
+from scene.colmap_loader import read_points3D_binary_arrays
 import cv2
 
 # Argument parser
@@ -37,38 +38,12 @@ def read_next_bytes(fid, num_bytes, format_char_sequence, endian_character="<"):
     return struct.unpack(endian_character + format_char_sequence, data)
 
 def read_points3D_bin(path_to_model_file):
-    points3D = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_points):
-            point_line = read_next_bytes(fid, 43, "QdddBBBd")
-            point_id = point_line[0]
-            xyz = np.array(point_line[1:4])
-            rgb = np.array(point_line[4:7])
-            error = point_line[7]
-            track_length = read_next_bytes(fid, 8, "Q")[0]
-            track_flat = read_next_bytes(fid, 8 * track_length, "ii" * track_length)
-            track = [(track_flat[i], track_flat[i + 1]) for i in range(0, len(track_flat), 2)]
-            points3D[point_id] = {
-                "xyz": xyz,
-                "rgb": rgb,
-                "error": error,
-                "tracks": track
-            }
-    return points3D
+    # Struct-of-arrays model: per-point arrays plus CSR tracks, indexed by point id
+    return read_points3D_binary_arrays(path_to_model_file)
 
-# Function to write points3D.bin in chunks
+# Function to write points3D.bin
 def write_points3D_bin(file_path, points3D):
-    with open(file_path, "wb") as f:
-        f.write(struct.pack("Q", len(points3D)))
-        for point_id, data in points3D.items():
-            f.write(struct.pack("Q", point_id))
-            f.write(struct.pack("ddd", *data["xyz"]))
-            f.write(struct.pack("BBB", *data["rgb"]))
-            f.write(struct.pack("d", data["error"]))
-            f.write(struct.pack("Q", len(data["tracks"])))
-            for track in data["tracks"]:
-                f.write(struct.pack("ii", *track))
+    points3D.write_binary(file_path)
 
 # Function to update image colors in points3D
 def update_image_colors(database_path, color_paths):
@@ -121,47 +96,48 @@ def extract_color_from_image(image_path, coordinates):
     return color
 
 def update_point_colors(points3D, color_paths, image_names):
-    image_id_to_name = {v: k for k, v in image_names.items()}
     missing_image_ids = set()
-
-    for point_id, point in points3D.items():
-        if 'tracks' not in point:
+    track_rows = np.repeat(np.arange(len(points3D)), points3D.track_lengths)
+    track_colors = np.zeros((points3D.track_image_ids.shape[0], 3), dtype=np.uint8)
+    valid = np.zeros(points3D.track_image_ids.shape[0], dtype=bool)
+
+    # Each image is opened once and sampled for all track elements observing it
+    for image_id in np.unique(points3D.track_image_ids).tolist():
+        if image_id not in image_names:
+            missing_image_ids.add(image_id)
             continue
-
-        for track in point['tracks']:
-            image_id = track[0]
-            feature_id = track[1]
-            if image_id in image_id_to_name:
-                image_name = image_id_to_name[image_id]
-                for color_path in color_paths:
-                    image_path = os.path.join(color_path, image_name)
-                    if os.path.exists(image_path):
-                        img = Image.open(image_path)
-                        color = extract_color_from_image(image_path, (feature_id % img.width, feature_id // img.width))
-                        point['rgb'] = color
-                        break
-                else:
-                    missing_image_ids.add(image_id)
-            else:
-                missing_image_ids.add(image_id)
+        image_path = next((os.path.join(color_path, image_names[image_id]) for color_path in color_paths
+                           if os.path.exists(os.path.join(color_path, image_names[image_id]))), None)
+        if image_path is None:
+            missing_image_ids.add(image_id)
+            continue
+        img = np.asarray(Image.open(image_path).convert("RGB"))
+        height, width = img.shape[:2]
+        elements = np.flatnonzero(points3D.track_image_ids == image_id)
+        feature_ids = points3D.track_point2D_idxs[elements].astype(np.int64)
+        inside = (feature_ids >= 0) & (feature_ids < width * height)
+        elements, feature_ids = elements[inside], feature_ids[inside]
+        track_colors[elements] = img[feature_ids // width, feature_ids % width]
+        valid[elements] = True
+
+    # The last valid track element of a point decides its color
+    valid = np.flatnonzero(valid)[::-1]
+    _, first = np.unique(track_rows[valid], return_index=True)
+    chosen = valid[first]
+    rgb = points3D.rgb.copy()
+    rgb[track_rows[chosen]] = track_colors[chosen]
+    points3D = points3D.replace(rgb=rgb)
 
     logging.debug(f"Missing image IDs: {missing_image_ids}")
 
-    for i, (point_id, point) in enumerate(points3D.items()):
-        logging.debug(f"Point {point_id}: Color {point.get('rgb', 'No color assigned')}")
-        if i >= 10:
-            break
+    for i in range(min(len(points3D), 11)):
+        logging.debug(f"Point {points3D.ids[i]}: Color {points3D.rgb[i]}")
 
     return points3D
 
 def merge_points3D(points3D_1, points3D_2):
-    merged_points3D = points3D_1.copy()
-    offset = max(merged_points3D.keys(), default=0) + 1
-
-    for point_id, data in points3D_2.items():
-        merged_points3D[offset + point_id] = data
-
-    return merged_points3D
+    offset = int(points3D_1.ids.max(initial=0)) + 1
+    return points3D_1.concatenate(points3D_2, id_offset=offset)
 
 def write_ply(points3D, file_path):
     with open(file_path, 'w') as ply_file:
@@ -176,9 +152,7 @@ def write_ply(points3D, file_path):
         ply_file.write("property uchar blue\n")
         ply_file.write("end_header\n")
 
-        for point_id, data in points3D.items():
-            xyz = data["xyz"]
-            rgb = data["rgb"]
+        for xyz, rgb in zip(points3D.xyz.tolist(), points3D.rgb.tolist()):
             ply_file.write(f"{xyz[0]} {xyz[1]} {xyz[2]} {int(rgb[0])} {int(rgb[1])} {int(rgb[2])}\n")
 
 # Ensure necessary directories exist
@@ -244,10 +218,7 @@ def get_images_and_features_from_db(database_path):
     return image_features
 
 def extract_points(points3D):
-    points = []
-    for data in points3D.values():
-        points.append(data["xyz"])
-    return np.array(points)
+    return points3D.xyz
 
 def perform_icp(source_points, target_points, max_iterations=50, tolerance=1e-6):
     # Create an ICP object
@@ -263,17 +234,8 @@ def perform_icp(source_points, target_points, max_iterations=50, tolerance=1e-6)
         exit(1)
 
 def apply_transformation(points3D, transform):
-    transformed_points3D = {}
-    for point_id, data in points3D.items():
-        xyz = np.append(data["xyz"], 1)  # Convert to homogeneous coordinates
-        transformed_xyz = transform.dot(xyz)[:3]  # Apply transformation
-        transformed_points3D[point_id] = {
-            "xyz": transformed_xyz,
-            "rgb": data["rgb"],
-            "error": data["error"],
-            "tracks": data["tracks"]
-        }
-    return transformed_points3D
+    transformed_xyz = points3D.xyz @ transform[:3, :3].T + transform[:3, 3]
+    return points3D.replace(xyz=transformed_xyz)
 
 if __name__ == "__main__":
     # Run convert.py on color and structure datasets
@@ -6,6 +6,7 @@ import sqlite3
 import struct
 from PIL import Image, ImageEnhance
 import numpy as np
+from scene.colmap_loader import read_points3D_binary_arrays
 
 # Argument parser
 parser = ArgumentParser("Colmap converter")
@@ -36,77 +37,50 @@ def read_next_bytes(fid, num_bytes, format_char_sequence, endian_character="<"):
     return struct.unpack(endian_character + format_char_sequence, data)
 
 def read_points3D_bin(path_to_model_file):
-    points3D = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_points):
-            point_line = read_next_bytes(fid, 43, "QdddBBBd")
-            point_id = point_line[0]
-            xyz = np.array(point_line[1:4])
-            rgb = np.array(point_line[4:7])
-            error = point_line[7]
-            track_length = read_next_bytes(fid, 8, "Q")[0]
-            track_flat = read_next_bytes(fid, 8 * track_length, "ii" * track_length)
-            track = [(track_flat[i], track_flat[i + 1]) for i in range(0, len(track_flat), 2)]
-            points3D[point_id] = {
-                "xyz": xyz,
-                "rgb": rgb,
-                "error": error,
-                "tracks": track  # Ensure the key is 'tracks'
-            }
-    return points3D
+    # Struct-of-arrays model: per-point arrays plus CSR tracks, indexed by point id
+    return read_points3D_binary_arrays(path_to_model_file)
 
-# Function to write points3D.bin in chunks
+# Function to write points3D.bin
 def write_points3D_bin(file_path, points3D):
-    with open(file_path, "wb") as f:
-        f.write(struct.pack("Q", len(points3D)))
-        for point_id, data in points3D.items():
-            f.write(struct.pack("Q", point_id))
-            f.write(struct.pack("ddd", *data["xyz"]))
-            f.write(struct.pack("BBB", *data["rgb"]))
-            f.write(struct.pack("d", data["error"]))
-            f.write(struct.pack("Q", len(data["tracks"])))
-            for track in data["tracks"]:
-                f.write(struct.pack("ii", *track))
-
-# Function to extract color from an image
-def extract_color_from_image(image_path, coordinates):
-    img = Image.open(image_path)
-    x, y = coordinates
-    color = img.getpixel((x, y))
-    return color
+    points3D.write_binary(file_path)
 
 # Function to update colors in points3D
 def update_point_colors(points3D, color_path, image_names):
-    image_id_to_name = {v: k for k, v in image_names.items()}
     missing_image_ids = set()
-
-    for point_id, point in points3D.items():
-        if 'tracks' not in point:
+    track_rows = np.repeat(np.arange(len(points3D)), points3D.track_lengths)
+    track_colors = np.zeros((points3D.track_image_ids.shape[0], 3), dtype=np.uint8)
+    valid = np.zeros(points3D.track_image_ids.shape[0], dtype=bool)
+
+    # Each image is opened once and sampled for all track elements observing it
+    for image_id in np.unique(points3D.track_image_ids).tolist():
+        if image_id not in image_names:
+            missing_image_ids.add(image_id)
             continue
-
-        for track in point['tracks']:
-            image_id = track[0]
-            feature_id = track[1]  # Assuming track stores image_id and feature_id
-            if image_id in image_id_to_name:
-                image_name = image_id_to_name[image_id]
-                image_path = os.path.join(color_path, image_name)
-                if os.path.exists(image_path):
-                    color = extract_color_from_image(image_path, (feature_id % img.width, feature_id // img.width))
-                    point['rgb'] = color
-                    break
-                else:
-                    missing_image_ids.add(image_id)
-            else:
-                missing_image_ids.add(image_id)
+        image_path = os.path.join(color_path, image_names[image_id])
+        if not os.path.exists(image_path):
+            missing_image_ids.add(image_id)
+            continue
+        img = np.asarray(Image.open(image_path).convert("RGB"))
+        height, width = img.shape[:2]
+        elements = np.flatnonzero(points3D.track_image_ids == image_id)
+        feature_ids = points3D.track_point2D_idxs[elements].astype(np.int64)
+        inside = (feature_ids >= 0) & (feature_ids < width * height)
+        elements, feature_ids = elements[inside], feature_ids[inside]
+        track_colors[elements] = img[feature_ids // width, feature_ids % width]
+        valid[elements] = True
+
+    # The first valid track element of a point decides its color
+    valid = np.flatnonzero(valid)
+    _, first = np.unique(track_rows[valid], return_index=True)
+    chosen = valid[first]
+    rgb = points3D.rgb.copy()
+    rgb[track_rows[chosen]] = track_colors[chosen]
+    points3D = points3D.replace(rgb=rgb)
 
     logging.debug(f"Missing image IDs: {missing_image_ids}")
 
-    # Print a few sample points for debugging
-    for i, (point_id, point) in enumerate(points3D.items()):
-        logging.debug(f"Point {point_id}: Color {point.get('rgb', 'No color assigned')}")
-        if i >= 10:
-            break
+    for i in range(min(len(points3D), 11)):
+        logging.debug(f"Point {points3D.ids[i]}: Color {points3D.rgb[i]}")
 
     return points3D
 
@@ -146,9 +120,7 @@ def write_ply(points3D, file_path):
         ply_file.write("property uchar blue\n")
         ply_file.write("end_header\n")
 
-        for point_id, data in points3D.items():
-            xyz = data["xyz"]
-            rgb = data["rgb"]
+        for xyz, rgb in zip(points3D.xyz.tolist(), points3D.rgb.tolist()):
             ply_file.write(f"{xyz[0]} {xyz[1]} {xyz[2]} {int(rgb[0])} {int(rgb[1])} {int(rgb[2])}\n")
 
 # Function to blend two images with a given alpha value
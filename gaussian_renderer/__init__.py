@@ -11,19 +11,51 @@
 
 import torch
 import math
-from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
 from scene.gaussian_model import GaussianModel
 from utils.sh_utils import eval_sh
+from utils.spatial_utils import spheres_in_view, CUTOFF_SIGMAS
+from gaussian_renderer import cpu_rasterizer
+try:
+    import diff_gaussian_rasterization
+    CUDA_RASTERIZER_FOUND = True
+except ImportError:
+    CUDA_RASTERIZER_FOUND = False
+
+def get_rasterizer_backend(pipe):
+    if pipe.rasterizer == "cpu":
+        return cpu_rasterizer.GaussianRasterizationSettings, cpu_rasterizer.GaussianRasterizer
+    assert pipe.rasterizer == "cuda", "Unknown rasterizer backend: {}".format(pipe.rasterizer)
+    assert CUDA_RASTERIZER_FOUND, "diff_gaussian_rasterization is not installed, use '--rasterizer cpu'"
+    return diff_gaussian_rasterization.GaussianRasterizationSettings, diff_gaussian_rasterization.GaussianRasterizer
+
+def frustum_cull(viewpoint_camera, pc : GaussianModel, scaling_modifier = 1.0):
+    """
+    Indices of the Gaussians whose bounding spheres (CUTOFF_SIGMAS times the
+    largest scale) may reach the image, or None if all of them may.
+    """
+    radii = CUTOFF_SIGMAS * scaling_modifier * pc.scaling_activation(pc._scaling.detach().max(dim=1).values)
+    visible = spheres_in_view(pc.get_xyz.detach(), radii, viewpoint_camera.full_proj_transform,
+                              int(viewpoint_camera.image_width), int(viewpoint_camera.image_height))
+    if bool(visible.all()):
+        return None
+    return visible.nonzero().squeeze(-1)
 
 def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None):
     """
     Render the scene. 
     
     Background tensor (bg_color) must be on GPU!
+    With pipe.rasterizer == "cpu" everything may live on the CPU instead.
+    With pipe.frustum_culling only the Gaussians that may reach the image are
+    passed to the rasterizer; radii and visibility_filter keep one entry per
+    Gaussian. With pipe.lod_threshold > 0, which requires a hierarchy in
+    pc.lod, a cut of the hierarchy replaces groups of Gaussians that project
+    to at most that many pixels with their merged parents.
     """
+    GaussianRasterizationSettings, GaussianRasterizer = get_rasterizer_backend(pipe)
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device=pc.get_xyz.device) + 0
     try:
         screenspace_points.retain_grad()
     except:
@@ -50,9 +82,26 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
 
     rasterizer = GaussianRasterizer(raster_settings=raster_settings)
 
+    lod_nodes = None
+    if pipe.lod_threshold > 0:
+        assert pc.lod is not None, "lod_threshold is set but the model has no level-of-detail hierarchy, build its lod.npz with lod.py"
+        assert override_color is None, "Colors cannot be overridden when rendering a level-of-detail cut"
+        indices, lod_nodes = pc.lod.select(pc, viewpoint_camera, pipe.lod_threshold, pipe.frustum_culling, scaling_modifier)
+    else:
+        indices = frustum_cull(viewpoint_camera, pc, scaling_modifier) if pipe.frustum_culling else None
+
+    def with_lod(values, name):
+        # The parents of the cut are rasterized after the selected Gaussians
+        return values if lod_nodes is None else torch.cat((values, getattr(pc.lod, name)[lod_nodes]))
+
     means3D = pc.get_xyz
     means2D = screenspace_points
     opacity = pc.get_opacity
+    if indices is not None:
+        means3D, means2D, opacity = means3D[indices], means2D[indices], opacity[indices]
+    if lod_nodes is not None:
+        means3D, opacity = with_lod(means3D, "xyz"), with_lod(opacity, "opacity")
+        means2D = torch.cat((means2D, torch.zeros_like(pc.lod.xyz[lod_nodes])))
 
     # If precomputed 3d covariance is provided, use it. If not, then it will be computed from
     # scaling / rotation by the rasterizer.
@@ -60,26 +109,33 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
     rotations = None
     cov3D_precomp = None
     if pipe.compute_cov3D_python:
-        cov3D_precomp = pc.get_covariance(scaling_modifier)
+        cov3D_precomp = pc.get_covariance(scaling_modifier, indices)
+        if lod_nodes is not None:
+            cov3D_precomp = torch.cat((cov3D_precomp, pc.covariance_activation(pc.lod.scaling[lod_nodes], scaling_modifier, pc.lod.rotation[lod_nodes])))
     else:
         scales = pc.get_scaling
         rotations = pc.get_rotation
+        if indices is not None:
+            scales, rotations = scales[indices], rotations[indices]
+        scales, rotations = with_lod(scales, "scaling"), with_lod(rotations, "rotation")
 
     # If precomputed colors are provided, use them. Otherwise, if it is desired to precompute colors
     # from SHs in Python, do it. If not, then SH -> RGB conversion will be done by rasterizer.
     shs = None
     colors_precomp = None
     if override_color is None:
+        features = pc.get_features if indices is None else pc.get_features_of(indices)
+        features = with_lod(features, "features")
         if pipe.convert_SHs_python:
-            shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree+1)**2)
-            dir_pp = (pc.get_xyz - viewpoint_camera.camera_center.repeat(pc.get_features.shape[0], 1))
+            shs_view = features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree+1)**2)
+            dir_pp = (means3D - viewpoint_camera.camera_center.repeat(features.shape[0], 1))
             dir_pp_normalized = dir_pp/dir_pp.norm(dim=1, keepdim=True)
             sh2rgb = eval_sh(pc.active_sh_degree, shs_view, dir_pp_normalized)
             colors_precomp = torch.clamp_min(sh2rgb + 0.5, 0.0)
         else:
-            shs = pc.get_features
+            shs = features
     else:
-        colors_precomp = override_color
+        colors_precomp = override_color if indices is None else override_color[indices]
 
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
     rendered_image, radii = rasterizer(
@@ -92,6 +148,11 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
         rotations = rotations,
         cov3D_precomp = cov3D_precomp)
 
+    if indices is not None:
+        all_radii = torch.zeros(pc.get_xyz.shape[0], dtype=radii.dtype, device=radii.device)
+        all_radii[indices] = radii[:indices.shape[0]]
+        radii = all_radii
+
     # Those Gaussians that were frustum culled or had a radius of 0 were not visible.
     # They will be excluded from value updates used in the splitting criteria.
     return {"render": rendered_image,
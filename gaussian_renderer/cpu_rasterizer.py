@@ -0,0 +1,273 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import torch
+from torch import nn
+from typing import NamedTuple
+from utils.sh_utils import eval_sh
+
+# Same tile size as the CUDA rasterizer (BLOCK_X x BLOCK_Y)
+BLOCK_X = 16
+BLOCK_Y = 16
+# Number of depth-sorted Gaussians blended per tile before checking for saturation
+CHUNK_SIZE = 256
+
+class GaussianRasterizationSettings(NamedTuple):
+    image_height: int
+    image_width: int
+    tanfovx : float
+    tanfovy : float
+    bg : torch.Tensor
+    scale_modifier : float
+    viewmatrix : torch.Tensor
+    projmatrix : torch.Tensor
+    sh_degree : int
+    campos : torch.Tensor
+    prefiltered : bool
+    debug : bool
+
+def compute_cov3D(scales, rotations, scale_modifier):
+    """
+    3D covariances R S S^T R^T as 6 upper-triangular entries, allocated on the
+    device of the inputs.
+    """
+    q = rotations / rotations.norm(dim=1, keepdim=True)
+    r, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    R = torch.stack((1 - 2 * (y*y + z*z), 2 * (x*y - r*z), 2 * (x*z + r*y),
+                     2 * (x*y + r*z), 1 - 2 * (x*x + z*z), 2 * (y*z - r*x),
+                     2 * (x*z - r*y), 2 * (y*z + r*x), 1 - 2 * (x*x + y*y)), dim=1).view(-1, 3, 3)
+    M = R * (scale_modifier * scales)[:, None, :]
+    Sigma = M @ M.transpose(1, 2)
+    return torch.stack((Sigma[:, 0, 0], Sigma[:, 0, 1], Sigma[:, 0, 2],
+                        Sigma[:, 1, 1], Sigma[:, 1, 2], Sigma[:, 2, 2]), dim=1)
+
+def compute_cov2D(p_view, cov3D, viewmatrix, focal_x, focal_y, tanfovx, tanfovy):
+    """
+    EWA splatting of the 3D covariances (stored as 6 upper-triangular entries)
+    into screen space, following computeCov2D of the CUDA rasterizer.
+    """
+    limx = 1.3 * tanfovx
+    limy = 1.3 * tanfovy
+    tz = p_view[:, 2]
+    tx = (p_view[:, 0] / tz).clamp(-limx, limx) * tz
+    ty = (p_view[:, 1] / tz).clamp(-limy, limy) * tz
+
+    J = torch.zeros((p_view.shape[0], 2, 3), dtype=p_view.dtype, device=p_view.device)
+    J[:, 0, 0] = focal_x / tz
+    J[:, 0, 2] = -(focal_x * tx) / (tz * tz)
+    J[:, 1, 1] = focal_y / tz
+    J[:, 1, 2] = -(focal_y * ty) / (tz * tz)
+
+    # viewmatrix is stored transposed (row-vector convention)
+    W = viewmatrix[:3, :3].t()
+    T = J @ W
+
+    Vrk = torch.stack((cov3D[:, 0], cov3D[:, 1], cov3D[:, 2],
+                       cov3D[:, 1], cov3D[:, 3], cov3D[:, 4],
+                       cov3D[:, 2], cov3D[:, 4], cov3D[:, 5]), dim=1).view(-1, 3, 3)
+    cov = T @ Vrk @ T.transpose(1, 2)
+
+    # Apply low-pass filter: every Gaussian should be at least one pixel wide/high
+    a = cov[:, 0, 0] + 0.3
+    b = cov[:, 0, 1]
+    c = cov[:, 1, 1] + 0.3
+    return a, b, c
+
+def preprocess(means3D, cov3D, raster_settings):
+    """
+    Project all Gaussians, returning their pixel-space means, conics, radii,
+    depths and the tile rectangles they touch. Culled Gaussians get radius 0.
+    """
+    H = raster_settings.image_height
+    W = raster_settings.image_width
+    viewmatrix = raster_settings.viewmatrix.to(means3D.device, means3D.dtype)
+    projmatrix = raster_settings.projmatrix.to(means3D.device, means3D.dtype)
+
+    ones = torch.ones((means3D.shape[0], 1), dtype=means3D.dtype, device=means3D.device)
+    p_hom = torch.cat((means3D, ones), dim=1)
+    p_view = p_hom @ viewmatrix
+    p_proj = p_hom @ projmatrix
+    p_proj = p_proj[:, :3] / (p_proj[:, 3:4] + 0.0000001)
+
+    in_frustum = p_view[:, 2] > 0.2
+
+    focal_x = W / (2.0 * raster_settings.tanfovx)
+    focal_y = H / (2.0 * raster_settings.tanfovy)
+    a, b, c = compute_cov2D(p_view[:, :3], cov3D, viewmatrix, focal_x, focal_y,
+                            raster_settings.tanfovx, raster_settings.tanfovy)
+    det = a * c - b * b
+    valid = torch.logical_and(in_frustum, det != 0.0)
+    det_inv = 1.0 / torch.where(valid, det, torch.ones_like(det))
+    conic = torch.stack((c * det_inv, -b * det_inv, a * det_inv), dim=1)
+
+    # Extent in screen space (by finding eigenvalues of 2D covariance matrix)
+    mid = 0.5 * (a + c)
+    lambda1 = mid + torch.sqrt(torch.clamp_min(mid * mid - det, 0.1))
+    lambda2 = mid - torch.sqrt(torch.clamp_min(mid * mid - det, 0.1))
+    radii = torch.ceil(3.0 * torch.sqrt(torch.max(lambda1, lambda2))).detach()
+
+    means2D = torch.stack((((p_proj[:, 0] + 1.0) * W - 1.0) * 0.5,
+                           ((p_proj[:, 1] + 1.0) * H - 1.0) * 0.5), dim=1)
+
+    grid_x = (W + BLOCK_X - 1) // BLOCK_X
+    grid_y = (H + BLOCK_Y - 1) // BLOCK_Y
+    px = means2D[:, 0].detach()
+    py = means2D[:, 1].detach()
+    rect_min_x = ((px - radii) / BLOCK_X).floor().clamp(0, grid_x).long()
+    rect_min_y = ((py - radii) / BLOCK_Y).floor().clamp(0, grid_y).long()
+    rect_max_x = ((px + radii + BLOCK_X - 1) / BLOCK_X).floor().clamp(0, grid_x).long()
+    rect_max_y = ((py + radii + BLOCK_Y - 1) / BLOCK_Y).floor().clamp(0, grid_y).long()
+    tiles_touched = (rect_max_x - rect_min_x) * (rect_max_y - rect_min_y)
+    valid = torch.logical_and(valid, tiles_touched > 0)
+
+    radii = torch.where(valid, radii, torch.zeros_like(radii)).int()
+    rects = torch.stack((rect_min_x, rect_min_y, rect_max_x, rect_max_y), dim=1)
+    return means2D, conic, radii, p_view[:, 2], rects, valid
+
+def bin_gaussians(depths, rects, valid, grid_x, grid_y):
+    """
+    Duplicate every visible Gaussian once per tile it overlaps and sort the
+    instances by (tile, depth). Returns the sorted Gaussian indices and the
+    [start, end) range of each tile in that list.
+    """
+    idx = torch.nonzero(valid, as_tuple=True)[0]
+    # Sort by depth once; the stable sort by tile below keeps this order per tile
+    idx = idx[torch.sort(depths[idx].detach(), stable=True)[1]]
+    rects = rects[idx]
+
+    w = rects[:, 2] - rects[:, 0]
+    h = rects[:, 3] - rects[:, 1]
+    counts = w * h
+    total = int(counts.sum())
+
+    gaussian_ids = torch.repeat_interleave(idx, counts)
+    owner = torch.repeat_interleave(torch.arange(idx.shape[0], device=idx.device), counts)
+    offsets = torch.cumsum(counts, dim=0) - counts
+    local = torch.arange(total, device=idx.device) - offsets[owner]
+    tile_x = rects[owner, 0] + local % w[owner]
+    tile_y = rects[owner, 1] + torch.div(local, w[owner], rounding_mode="floor")
+    tile_ids = tile_y * grid_x + tile_x
+
+    order = torch.sort(tile_ids, stable=True)[1]
+    gaussian_ids = gaussian_ids[order]
+    tile_counts = torch.bincount(tile_ids, minlength=grid_x * grid_y)
+    tile_ends = torch.cumsum(tile_counts, dim=0)
+    tile_starts = tile_ends - tile_counts
+    return gaussian_ids, tile_starts, tile_ends
+
+def blend_tile(pix_feats, origin, ids, means2D, conic, opacities, colors):
+    """
+    Front-to-back alpha compositing of the depth-sorted Gaussians `ids` over one
+    tile. `pix_feats` holds the monomials (u^2, v^2, uv, u, v, 1) of the pixel
+    centres relative to `origin`, so that the Gaussian exponents of a whole
+    chunk come out of a single matrix product. Returns accumulated color and
+    final transmittance.
+    """
+    P = pix_feats.shape[0]
+    C = torch.zeros((P, colors.shape[1]), dtype=colors.dtype, device=colors.device)
+    T = torch.ones((P, 1), dtype=colors.dtype, device=colors.device)
+    active = torch.ones((P, 1), dtype=torch.bool, device=colors.device)
+    for start in range(0, ids.shape[0], CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        m = means2D[chunk] - origin
+        mx, my = m[:, 0], m[:, 1]
+        con_a, con_b, con_c = conic[chunk].unbind(dim=1)
+        # power = -0.5 * (a dx^2 + c dy^2) - b dx dy, expanded in the pixel coordinates
+        coeffs = torch.stack((-0.5 * con_a, -0.5 * con_c, -con_b,
+                              con_a * mx + con_b * my, con_c * my + con_b * mx,
+                              -0.5 * (con_a * mx * mx + con_c * my * my) - con_b * mx * my), dim=1)
+        power = torch.clamp_max(pix_feats @ coeffs.t(), 0.0)
+        alpha = torch.clamp_max(opacities[chunk, 0] * torch.exp(power), 0.99)
+        alpha = alpha.masked_fill(alpha < 1.0 / 255.0, 0.0)
+
+        # Transmittance after each Gaussian; blending stops (excluding the
+        # Gaussian that would cross the threshold) once it drops below 1e-4
+        T_incl = T * torch.cumprod(1.0 - alpha, dim=1)
+        keep = torch.logical_and(T_incl >= 0.0001, active)
+        T_excl = torch.cat((T, T_incl[:, :-1]), dim=1)
+        weights = (alpha * T_excl).masked_fill(~keep, 0.0)
+
+        C = C + weights @ colors[chunk]
+        T = T - weights.sum(dim=1, keepdim=True)
+        active = keep[:, -1:]
+        if not bool(active.any()):
+            break
+    return C, T
+
+class GaussianRasterizer(nn.Module):
+    """
+    Pure-PyTorch reference implementation of diff_gaussian_rasterization's
+    GaussianRasterizer. Runs on any device (in particular CPU) and is fully
+    differentiable through autograd, but is meant for previews and testing.
+    """
+    def __init__(self, raster_settings):
+        super().__init__()
+        self.raster_settings = raster_settings
+
+    def markVisible(self, positions):
+        with torch.no_grad():
+            viewmatrix = self.raster_settings.viewmatrix.to(positions.device, positions.dtype)
+            ones = torch.ones((positions.shape[0], 1), dtype=positions.dtype, device=positions.device)
+            p_view = torch.cat((positions, ones), dim=1) @ viewmatrix
+            return p_view[:, 2] > 0.2
+
+    def forward(self, means3D, means2D, opacities, shs = None, colors_precomp = None, scales = None, rotations = None, cov3D_precomp = None):
+        raster_settings = self.raster_settings
+
+        if (shs is None and colors_precomp is None) or (shs is not None and colors_precomp is not None):
+            raise Exception('Please provide excatly one of either SHs or precomputed colors!')
+        if ((scales is None or rotations is None) and cov3D_precomp is None) or ((scales is not None or rotations is not None) and cov3D_precomp is not None):
+            raise Exception('Please provide exactly one of either scale/rotation pair or precomputed 3D covariance!')
+
+        if cov3D_precomp is None:
+            cov3D_precomp = compute_cov3D(scales, rotations, raster_settings.scale_modifier)
+
+        if colors_precomp is None:
+            campos = raster_settings.campos.to(means3D.device, means3D.dtype)
+            dirs = means3D - campos
+            dirs = dirs / dirs.norm(dim=1, keepdim=True)
+            sh2rgb = eval_sh(raster_settings.sh_degree, shs.transpose(1, 2), dirs)
+            colors_precomp = torch.clamp_min(sh2rgb + 0.5, 0.0)
+
+        H = raster_settings.image_height
+        W = raster_settings.image_width
+        grid_x = (W + BLOCK_X - 1) // BLOCK_X
+        grid_y = (H + BLOCK_Y - 1) // BLOCK_Y
+
+        pix_means2D, conic, radii, depths, rects, valid = preprocess(means3D, cov3D_precomp, raster_settings)
+        # Route the (NDC-space) screen-space gradient through means2D like the CUDA backward
+        pix_means2D = pix_means2D + means2D[:, :2] * means2D.new_tensor([0.5 * W, 0.5 * H])
+
+        gaussian_ids, tile_starts, tile_ends = bin_gaussians(depths, rects, valid, grid_x, grid_y)
+        tile_starts = tile_starts.tolist()
+        tile_ends = tile_ends.tolist()
+
+        bg = raster_settings.bg.to(means3D.device, colors_precomp.dtype)
+        num_channels = colors_precomp.shape[1]
+        image = bg[:, None, None].repeat(1, grid_y * BLOCK_Y, grid_x * BLOCK_X)
+        # Pixel centres relative to the tile centre, which keeps the expanded
+        # exponent well conditioned
+        u, v = torch.meshgrid(torch.arange(BLOCK_X, device=means3D.device, dtype=means3D.dtype) - 0.5 * (BLOCK_X - 1),
+                              torch.arange(BLOCK_Y, device=means3D.device, dtype=means3D.dtype) - 0.5 * (BLOCK_Y - 1), indexing="xy")
+        u, v = u.flatten(), v.flatten()
+        pix_feats = torch.stack((u * u, v * v, u * v, u, v, torch.ones_like(u)), dim=1)
+
+        for tile in range(grid_x * grid_y):
+            start, end = tile_starts[tile], tile_ends[tile]
+            if start == end:
+                continue
+            ty, tx = divmod(tile, grid_x)
+            origin = pix_feats.new_tensor([tx * BLOCK_X + 0.5 * (BLOCK_X - 1), ty * BLOCK_Y + 0.5 * (BLOCK_Y - 1)])
+            C, T = blend_tile(pix_feats, origin, gaussian_ids[start:end], pix_means2D, conic, opacities, colors_precomp)
+            out = C + T * bg[None, :]
+            image[:, ty * BLOCK_Y:(ty + 1) * BLOCK_Y, tx * BLOCK_X:(tx + 1) * BLOCK_X] = out.t().reshape(num_channels, BLOCK_Y, BLOCK_X)
+
+        return image[:, :H, :W], radii
@@ -0,0 +1,75 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import json
+import time
+import torch
+from scene import Scene
+from utils.eval_utils import evaluate
+from utils.general_utils import safe_state
+from utils.lod_utils import GaussianHierarchy
+from argparse import ArgumentParser
+from arguments import ModelParams, PipelineParams, get_combined_args
+from gaussian_renderer import GaussianModel
+
+def mean_cut_size(views, gaussians, pipeline):
+    total = 0
+    for view in views:
+        leaves, nodes = gaussians.lod.select(gaussians, view, pipeline.lod_threshold, pipeline.frustum_culling)
+        total += leaves.shape[0] + nodes.shape[0]
+    return total / len(views)
+
+def build_lod(dataset : ModelParams, iteration : int, pipeline : PipelineParams, report_thresholds):
+    with torch.no_grad():
+        gaussians = GaussianModel(dataset.sh_degree, dataset.device)
+        scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+        point_cloud_path = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter))
+
+        start = time.perf_counter()
+        gaussians.lod = GaussianHierarchy.build(gaussians)
+        build_time = time.perf_counter() - start
+        gaussians.lod.save(os.path.join(point_cloud_path, "lod.npz"))
+        print("Built a hierarchy of {} parents over {} Gaussians in {:.2f}s".format(
+            gaussians.lod.xyz.shape[0], gaussians.get_xyz.shape[0], build_time))
+
+        bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
+        background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
+        eval_name, eval_views = ("test", scene.getTestCameras()) if scene.getTestCameras() else ("train", scene.getTrainCameras())
+        report = {"num_gaussians": gaussians.get_xyz.shape[0], "num_parents": gaussians.lod.xyz.shape[0], "eval_set": eval_name, "cuts": []}
+        for threshold in sorted(set([0.0] + list(report_thresholds))):
+            pipeline.lod_threshold = threshold
+            start = time.perf_counter()
+            psnr = evaluate(eval_views, gaussians, pipeline, background)
+            elapsed = time.perf_counter() - start
+            cut_size = mean_cut_size(eval_views, gaussians, pipeline) if threshold > 0 else gaussians.get_xyz.shape[0]
+            report["cuts"].append({"lod_threshold": threshold, "mean_rendered": cut_size, "psnr": psnr, "seconds_per_view": elapsed / len(eval_views)})
+            print("lod_threshold {:.2f}: {:.0f} Gaussians rendered on average, {} PSNR {:.3f}, {:.3f}s per view".format(
+                threshold, cut_size, eval_name, psnr, elapsed / len(eval_views)))
+
+    with open(os.path.join(point_cloud_path, "lod.json"), 'w') as fp:
+        json.dump(report, fp, indent=True)
+
+if __name__ == "__main__":
+    # Set up command line argument parser
+    parser = ArgumentParser(description="Level-of-detail script parameters")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--report_thresholds", nargs="+", type=float, default=[0.5, 1.0, 2.0, 4.0])
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Building level of detail for " + args.model_path)
+
+    # Initialize system state (RNG)
+    safe_state(args.quiet)
+
+    build_lod(model.extract(args), args.iteration, pipeline.extract(args), args.report_thresholds)
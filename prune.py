@@ -0,0 +1,107 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import json
+import shutil
+import torch
+from torch import nn
+from scene import Scene
+from tqdm import tqdm
+from gaussian_renderer import render
+from utils.general_utils import safe_state
+from utils.eval_utils import evaluate
+from argparse import ArgumentParser
+from arguments import ModelParams, PipelineParams, get_combined_args
+from gaussian_renderer import GaussianModel
+
+def accumulate_contributions(views, gaussians, pipeline, background):
+    """
+    Total blending weight (alpha times transmittance) of every Gaussian over
+    all pixels of all views. With unit colors on a black background each
+    pixel is the sum of these weights, so the gradient of the image sum with
+    respect to a Gaussian's color is its contribution, for either rasterizer.
+    """
+    contributions = torch.zeros(gaussians.get_xyz.shape[0], dtype=gaussians.dtype, device=gaussians.device)
+    black = torch.zeros_like(background)
+    for view in tqdm(views, desc="Accumulating contributions"):
+        colors = torch.ones((gaussians.get_xyz.shape[0], 3), dtype=gaussians.dtype, device=gaussians.device, requires_grad=True)
+        render(view, gaussians, pipeline, black, override_color=colors)["render"].sum().backward()
+        contributions += colors.grad[:, 0]
+    return contributions
+
+def importance_mask(contributions, prune_ratio):
+    # Keeps all but the prune_ratio fraction of Gaussians with the smallest contributions
+    mask = torch.ones_like(contributions, dtype=torch.bool)
+    mask[torch.argsort(contributions)[:int(prune_ratio * contributions.shape[0])]] = False
+    return mask
+
+def select_gaussians(gaussians, mask):
+    selected = GaussianModel(gaussians.max_sh_degree, gaussians.device, gaussians.dtype)
+    selected.active_sh_degree = gaussians.active_sh_degree
+    selected.spatial_lr_scale = gaussians.spatial_lr_scale
+    for name in ("_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"):
+        setattr(selected, name, nn.Parameter(getattr(gaussians, name).detach()[mask], requires_grad=False))
+    return selected
+
+def prune_model(dataset : ModelParams, iteration : int, pipeline : PipelineParams, prune_ratio : float, report_ratios, output_path : str):
+    gaussians = GaussianModel(dataset.sh_degree, dataset.device)
+    scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+    for param in (gaussians._xyz, gaussians._features_dc, gaussians._features_rest, gaussians._opacity, gaussians._scaling, gaussians._rotation):
+        param.requires_grad_(False)
+
+    bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
+    background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
+
+    contributions = accumulate_contributions(scene.getTrainCameras(), gaussians, pipeline, background)
+
+    eval_name, eval_views = ("test", scene.getTestCameras()) if scene.getTestCameras() else ("train", scene.getTrainCameras())
+    report = []
+    with torch.no_grad():
+        for ratio in sorted(set([0.0, prune_ratio] + list(report_ratios))):
+            pruned = select_gaussians(gaussians, importance_mask(contributions, ratio))
+            report.append({"prune_ratio": ratio,
+                           "num_gaussians": pruned.get_xyz.shape[0],
+                           "psnr": evaluate(eval_views, pruned, pipeline, background)})
+    for entry in report:
+        print("Pruned {:5.1%}: {:>9} Gaussians, {} PSNR {:.3f} ({:+.3f})".format(
+            entry["prune_ratio"], entry["num_gaussians"], eval_name, entry["psnr"], entry["psnr"] - report[0]["psnr"]))
+
+    # The pruned model is a regular model directory that render.py and metrics.py accept
+    os.makedirs(output_path, exist_ok=True)
+    for fname in ("cfg_args", "cameras.json"):
+        if os.path.exists(os.path.join(dataset.model_path, fname)):
+            shutil.copyfile(os.path.join(dataset.model_path, fname), os.path.join(output_path, fname))
+    pruned = select_gaussians(gaussians, importance_mask(contributions, prune_ratio))
+    pruned.save_ply(os.path.join(output_path, "point_cloud", "iteration_{}".format(scene.loaded_iter), "point_cloud.ply"))
+    with open(os.path.join(output_path, "pruning.json"), 'w') as fp:
+        json.dump({"source": dataset.model_path, "iteration": scene.loaded_iter, "eval_set": eval_name, "results": report}, fp, indent=True)
+    print("Saved {} of {} Gaussians to {}".format(pruned.get_xyz.shape[0], gaussians.get_xyz.shape[0], output_path))
+
+if __name__ == "__main__":
+    # Set up command line argument parser
+    parser = ArgumentParser(description="Importance pruning script parameters")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--prune_ratio", default=0.5, type=float)
+    parser.add_argument("--report_ratios", nargs="+", type=float, default=[0.1, 0.25, 0.5, 0.75, 0.9])
+    parser.add_argument("--output_path", default="", type=str)
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    assert 0.0 <= args.prune_ratio < 1.0, "--prune_ratio must be in [0, 1)"
+    output_path = args.output_path if args.output_path else os.path.normpath(args.model_path) + "_pruned"
+    print("Pruning " + args.model_path)
+
+    # Initialize system state (RNG)
+    safe_state(args.quiet)
+
+    prune_model(model.extract(args), args.iteration, pipeline.extract(args), args.prune_ratio, args.report_ratios, output_path)
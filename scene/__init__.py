@@ -12,11 +12,14 @@
 import os
 import random
 import json
-from utils.system_utils import searchForMaxIteration
+from utils.system_utils import searchForMaxIteration, mkdir_p, BackgroundWriter
+from utils.ply_utils import write_ply_vertices
 from scene.dataset_readers import sceneLoadTypeCallbacks
 from scene.gaussian_model import GaussianModel
+from utils.lod_utils import GaussianHierarchy
 from arguments import ModelParams
 from utils.camera_utils import cameraList_from_camInfos, camera_to_JSON
+from utils.image_cache import ImageLRU
 
 class Scene:
 
@@ -41,10 +44,10 @@ class Scene:
         self.test_cameras = {}
 
         if os.path.exists(os.path.join(args.source_path, "sparse")):
-            scene_info = sceneLoadTypeCallbacks["Colmap"](args.source_path, args.images, args.eval)
+            scene_info = sceneLoadTypeCallbacks["Colmap"](args.source_path, args.images, args.eval, num_workers=args.load_workers, lazy=bool(args.image_cache) or args.lazy_images)
         elif os.path.exists(os.path.join(args.source_path, "transforms_train.json")):
             print("Found transforms_train.json file, assuming Blender data set!")
-            scene_info = sceneLoadTypeCallbacks["Blender"](args.source_path, args.white_background, args.eval)
+            scene_info = sceneLoadTypeCallbacks["Blender"](args.source_path, args.white_background, args.eval, num_workers=args.load_workers, lazy=bool(args.image_cache) or args.lazy_images)
         else:
             assert False, "Could not recognize scene type!"
 
@@ -68,23 +71,49 @@ class Scene:
 
         self.cameras_extent = scene_info.nerf_normalization["radius"]
 
+        self.morton_order = args.morton_order
+        # Point clouds are written on a background thread unless max_pending_saves is 0
+        self.ply_writer = BackgroundWriter(args.max_pending_saves) if args.max_pending_saves > 0 else None
+
+        # With lazy images all cameras of all scales share one bounded set of resident images
+        self.image_lru = ImageLRU(int(args.image_memory_mb * 1024 * 1024)) if args.lazy_images else None
+
         for resolution_scale in resolution_scales:
             print("Loading Training Cameras")
-            self.train_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.train_cameras, resolution_scale, args)
+            self.train_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.train_cameras, resolution_scale, args, self.image_lru)
             print("Loading Test Cameras")
-            self.test_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.test_cameras, resolution_scale, args)
+            self.test_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.test_cameras, resolution_scale, args, self.image_lru)
 
         if self.loaded_iter:
-            self.gaussians.load_ply(os.path.join(self.model_path,
-                                                           "point_cloud",
-                                                           "iteration_" + str(self.loaded_iter),
-                                                           "point_cloud.ply"))
+            point_cloud_path = os.path.join(self.model_path, "point_cloud", "iteration_" + str(self.loaded_iter))
+            if os.path.exists(os.path.join(point_cloud_path, "point_cloud.ply")):
+                self.gaussians.load_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
+            else:
+                # Models may ship only the compressed format, see GaussianModel.save_compressed
+                self.gaussians.load_compressed(os.path.join(point_cloud_path, "point_cloud.npz"))
+            # Level-of-detail hierarchy written by lod.py; it refers to the rows as stored, so it is loaded before sorting
+            if os.path.exists(os.path.join(point_cloud_path, "lod.npz")):
+                self.gaussians.lod = GaussianHierarchy.load(os.path.join(point_cloud_path, "lod.npz"), self.gaussians.device, self.gaussians.dtype)
+            if args.morton_order:
+                self.gaussians.sort_morton()
         else:
             self.gaussians.create_from_pcd(scene_info.point_cloud, self.cameras_extent)
 
     def save(self, iteration):
         point_cloud_path = os.path.join(self.model_path, "point_cloud/iteration_{}".format(iteration))
-        self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
+        if self.morton_order:
+            self.gaussians.sort_morton()
+        if self.ply_writer is None:
+            self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
+            return
+        # Only the copy to host happens here, training continues while the file is written
+        mkdir_p(point_cloud_path)
+        self.ply_writer.submit(write_ply_vertices, os.path.join(point_cloud_path, "point_cloud.ply"),
+                               self.gaussians.construct_list_of_attributes(), self.gaussians.ply_arrays())
+
+    def wait_for_saves(self):
+        if self.ply_writer is not None:
+            self.ply_writer.wait()
 
     def getTrainCameras(self, scale=1.0):
         return self.train_cameras[scale]
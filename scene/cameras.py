@@ -17,8 +17,16 @@ from utils.graphics_utils import getWorld2View2, getProjectionMatrix
 class Camera(nn.Module):
     def __init__(self, colmap_id, R, T, FoVx, FoVy, image, gt_alpha_mask,
                  image_name, uid,
-                 trans=np.array([0.0, 0.0, 0.0]), scale=1.0, data_device = "cuda"
+                 trans=np.array([0.0, 0.0, 0.0]), scale=1.0, data_device = "cuda", device = "cuda",
+                 image_loader=None, image_lru=None, width=None, height=None
                  ):
+        """
+        image (3, H, W) and gt_alpha_mask (1, H, W) are uint8 tensors and are
+        stored as such; original_image converts them to float on access.
+        If image is None the ground truth is loaded on first access through
+        image_loader, which returns (image, gt_alpha_mask), and is kept in the
+        shared, byte-bounded image_lru. width and height must be given then.
+        """
         super(Camera, self).__init__()
 
         self.uid = uid
@@ -33,17 +41,20 @@ class Camera(nn.Module):
             self.data_device = torch.device(data_device)
         except Exception as e:
             print(e)
-            print(f"[Warning] Custom device {data_device} failed, fallback to default cuda device" )
-            self.data_device = torch.device("cuda")
+            print(f"[Warning] Custom device {data_device} failed, fallback to device {device}" )
+            self.data_device = torch.device(device)
 
-        self.original_image = image.clamp(0.0, 1.0).to(self.data_device)
-        self.image_width = self.original_image.shape[2]
-        self.image_height = self.original_image.shape[1]
-
-        if gt_alpha_mask is not None:
-            self.original_image *= gt_alpha_mask.to(self.data_device)
+        self.image_loader = image_loader
+        self.image_lru = image_lru
+        if image is not None:
+            self._raw_image = self.prepare_image(image, gt_alpha_mask)
+            self.image_width = image.shape[2]
+            self.image_height = image.shape[1]
         else:
-            self.original_image *= torch.ones((1, self.image_height, self.image_width), device=self.data_device)
+            assert image_loader is not None and image_lru is not None, "Lazy cameras need an image loader and an LRU"
+            self._raw_image = None
+            self.image_width = width
+            self.image_height = height
 
         self.zfar = 100.0
         self.znear = 0.01
@@ -51,11 +62,40 @@ class Camera(nn.Module):
         self.trans = trans
         self.scale = scale
 
-        self.world_view_transform = torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1).cuda()
-        self.projection_matrix = getProjectionMatrix(znear=self.znear, zfar=self.zfar, fovX=self.FoVx, fovY=self.FoVy).transpose(0,1).cuda()
+        # Transforms live with the Gaussians (device), the ground truth image on data_device
+        self.device = torch.device(device)
+        self.world_view_transform = torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1).to(self.device)
+        self.projection_matrix = getProjectionMatrix(znear=self.znear, zfar=self.zfar, fovX=self.FoVx, fovY=self.FoVy).transpose(0,1).to(self.device)
         self.full_proj_transform = (self.world_view_transform.unsqueeze(0).bmm(self.projection_matrix.unsqueeze(0))).squeeze(0)
         self.camera_center = self.world_view_transform.inverse()[3, :3]
 
+    def prepare_image(self, image, gt_alpha_mask):
+        assert image.dtype == torch.uint8, "Camera images are stored as uint8"
+        image = image.to(self.data_device)
+        if gt_alpha_mask is not None:
+            gt_alpha_mask = gt_alpha_mask.to(self.data_device)
+        return image, gt_alpha_mask
+
+    @property
+    def raw_image(self):
+        """
+        The stored (uint8 image, uint8 alpha mask or None) pair.
+        """
+        if self._raw_image is not None:
+            return self._raw_image
+        return self.image_lru.get(self, lambda: self.prepare_image(*self.image_loader()))
+
+    @property
+    def original_image(self):
+        return normalize_image(*self.raw_image)
+
+def normalize_image(image, gt_alpha_mask=None):
+    # uint8 image and mask to the float ground truth in [0, 1] used by the losses
+    original_image = image / 255.0
+    if gt_alpha_mask is not None:
+        original_image *= gt_alpha_mask / 255.0
+    return original_image
+
 class MiniCam:
     def __init__(self, width, height, fovy, fovx, znear, zfar, world_view_transform, full_proj_transform):
         self.image_width = width
@@ -122,37 +122,255 @@ def read_points3D_text(path):
 
     return xyzs, rgbs, errors
 
+# Fixed-size part of a points3D.bin record: point3D_id, xyz, rgb, error
+POINT3D_RECORD_DTYPE = np.dtype([("id", "<u8"), ("xyz", "<f8", (3,)), ("rgb", "u1", (3,)), ("error", "<f8")])
+# One keypoint of an images.bin record: x, y, point3D_id
+POINT2D_RECORD_DTYPE = np.dtype([("xy", "<f8", (2,)), ("point3D_id", "<i8")])
+# One track element of a points3D.bin record
+TRACK_ELEMENT_DTYPE = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+
+def gather_records(buffer, offsets, dtype, chunk_size=65536):
+    """
+    Copy the fixed-size records starting at the given byte offsets of a uint8
+    buffer into one structured array, in chunks to bound the index arrays.
+    """
+    records = np.empty(offsets.shape[0], dtype=dtype)
+    record_bytes = records.view(np.uint8).reshape(offsets.shape[0], dtype.itemsize)
+    byte_range = np.arange(dtype.itemsize)
+    for start in range(0, offsets.shape[0], chunk_size):
+        chunk = offsets[start:start + chunk_size]
+        record_bytes[start:start + chunk.shape[0]] = buffer[chunk[:, None] + byte_range]
+    return records
+
+def scatter_records(buffer, offsets, records, chunk_size=65536):
+    """
+    Inverse of gather_records: write each record to its byte offset.
+    """
+    record_bytes = np.ascontiguousarray(records).view(np.uint8).reshape(offsets.shape[0], records.dtype.itemsize)
+    byte_range = np.arange(records.dtype.itemsize)
+    for start in range(0, offsets.shape[0], chunk_size):
+        chunk = offsets[start:start + chunk_size]
+        buffer[chunk[:, None] + byte_range] = record_bytes[start:start + chunk.shape[0]]
+
+def build_id_lookup(ids):
+    # Dense id -> row table, COLMAP ids are small positive integers
+    lookup = np.full(int(ids.max()) + 1 if ids.shape[0] > 0 else 0, -1, dtype=np.int64)
+    lookup[ids] = np.arange(ids.shape[0])
+    return lookup
+
+def track_element_offsets(record_offsets, track_ptr):
+    # Byte offset of every track element, given the offset of its point record
+    track_lengths = np.diff(track_ptr)
+    first = np.repeat(record_offsets + POINT3D_RECORD_DTYPE.itemsize + 8, track_lengths)
+    local = np.arange(track_ptr[-1]) - np.repeat(track_ptr[:-1], track_lengths)
+    return first + TRACK_ELEMENT_DTYPE.itemsize * local
+
+def scan_points3D_binary(data):
+    """
+    First pass over the contents of a points3D.bin file: byte offset of every
+    record and the length of its track. Only the track lengths are decoded.
+    """
+    num_points = struct.unpack_from("<Q", data, 0)[0]
+    unpack_track_length = struct.Struct("<Q").unpack_from
+    track_length_offset = POINT3D_RECORD_DTYPE.itemsize
+    offsets = []
+    track_lengths = []
+    pos = 8
+    for _ in range(num_points):
+        track_length = unpack_track_length(data, pos + track_length_offset)[0]
+        offsets.append(pos)
+        track_lengths.append(track_length)
+        pos += track_length_offset + 8 + 8 * track_length
+    return np.array(offsets, dtype=np.int64), np.array(track_lengths, dtype=np.int64)
+
 def read_points3D_binary(path_to_model_file):
     """
     see: src/base/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
+    with open(path_to_model_file, "rb") as fid:
+        data = fid.read()
 
+    # Pass 1 locates the variable-length records, pass 2 decodes them in bulk
+    offsets, _ = scan_points3D_binary(data)
+    records = gather_records(np.frombuffer(data, dtype=np.uint8), offsets, POINT3D_RECORD_DTYPE)
 
-    with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-
-        xyzs = np.empty((num_points, 3))
-        rgbs = np.empty((num_points, 3))
-        errors = np.empty((num_points, 1))
-
-        for p_id in range(num_points):
-            binary_point_line_properties = read_next_bytes(
-                fid, num_bytes=43, format_char_sequence="QdddBBBd")
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q")[0]
-            track_elems = read_next_bytes(
-                fid, num_bytes=8*track_length,
-                format_char_sequence="ii"*track_length)
-            xyzs[p_id] = xyz
-            rgbs[p_id] = rgb
-            errors[p_id] = error
+    xyzs = records["xyz"].astype(np.float64)
+    rgbs = records["rgb"].astype(np.float64)
+    errors = records["error"].astype(np.float64)[:, None]
     return xyzs, rgbs, errors
 
+class ColmapPoints3D:
+    """
+    Struct-of-arrays representation of points3D.bin. Row i holds the point with
+    id ids[i]; its track is the CSR slice track_ptr[i]:track_ptr[i + 1] of
+    track_image_ids / track_point2D_idxs.
+    """
+    def __init__(self, ids, xyz, rgb, error, track_ptr, track_image_ids, track_point2D_idxs):
+        self.ids = ids
+        self.xyz = xyz
+        self.rgb = rgb
+        self.error = error
+        self.track_ptr = track_ptr
+        self.track_image_ids = track_image_ids
+        self.track_point2D_idxs = track_point2D_idxs
+        self.row_of_id = build_id_lookup(ids)
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def __contains__(self, point3D_id):
+        return 0 <= point3D_id < self.row_of_id.shape[0] and self.row_of_id[point3D_id] >= 0
+
+    def row(self, point3D_id):
+        if point3D_id not in self:
+            raise KeyError(point3D_id)
+        return int(self.row_of_id[point3D_id])
+
+    def __getitem__(self, point3D_id):
+        row = self.row(point3D_id)
+        track = slice(self.track_ptr[row], self.track_ptr[row + 1])
+        return Point3D(id=point3D_id, xyz=self.xyz[row], rgb=self.rgb[row], error=self.error[row],
+                       image_ids=self.track_image_ids[track], point2D_idxs=self.track_point2D_idxs[track])
+
+    @property
+    def track_lengths(self):
+        return np.diff(self.track_ptr)
+
+    def replace(self, **arrays):
+        fields = dict(ids=self.ids, xyz=self.xyz, rgb=self.rgb, error=self.error, track_ptr=self.track_ptr,
+                      track_image_ids=self.track_image_ids, track_point2D_idxs=self.track_point2D_idxs)
+        fields.update(arrays)
+        return ColmapPoints3D(**fields)
+
+    def concatenate(self, other, id_offset=0):
+        """
+        Append the points of other, shifting their ids by id_offset.
+        """
+        return ColmapPoints3D(ids=np.concatenate((self.ids, other.ids + id_offset)),
+                              xyz=np.concatenate((self.xyz, other.xyz)),
+                              rgb=np.concatenate((self.rgb, other.rgb)),
+                              error=np.concatenate((self.error, other.error)),
+                              track_ptr=np.concatenate((self.track_ptr, other.track_ptr[1:] + self.track_ptr[-1])),
+                              track_image_ids=np.concatenate((self.track_image_ids, other.track_image_ids)),
+                              track_point2D_idxs=np.concatenate((self.track_point2D_idxs, other.track_point2D_idxs)))
+
+    def write_binary(self, path_to_model_file):
+        """
+        see: src/base/reconstruction.cc
+            void Reconstruction::WritePoints3DBinary(const std::string& path)
+        """
+        track_lengths = self.track_lengths
+        record_size = POINT3D_RECORD_DTYPE.itemsize + 8
+        record_offsets = 8 + record_size * np.arange(len(self)) + TRACK_ELEMENT_DTYPE.itemsize * self.track_ptr[:-1]
+        buffer = np.empty(8 + record_size * len(self) + TRACK_ELEMENT_DTYPE.itemsize * int(self.track_ptr[-1]), dtype=np.uint8)
+        buffer[:8] = np.array([len(self)], dtype="<u8").view(np.uint8)
+
+        records = np.empty(len(self), dtype=np.dtype(POINT3D_RECORD_DTYPE.descr + [("track_length", "<u8")]))
+        records["id"] = self.ids
+        records["xyz"] = self.xyz
+        records["rgb"] = self.rgb
+        records["error"] = self.error
+        records["track_length"] = track_lengths
+        scatter_records(buffer, record_offsets, records)
+
+        track = np.empty(int(self.track_ptr[-1]), dtype=TRACK_ELEMENT_DTYPE)
+        track["image_id"] = self.track_image_ids
+        track["point2D_idx"] = self.track_point2D_idxs
+        scatter_records(buffer, track_element_offsets(record_offsets, self.track_ptr), track)
+        buffer.tofile(path_to_model_file)
+
+def read_points3D_binary_arrays(path_to_model_file):
+    """
+    Like read_points3D_binary, but keeps ids and tracks in a ColmapPoints3D.
+    """
+    with open(path_to_model_file, "rb") as fid:
+        data = fid.read()
+    buffer = np.frombuffer(data, dtype=np.uint8)
+
+    offsets, track_lengths = scan_points3D_binary(data)
+    records = gather_records(buffer, offsets, POINT3D_RECORD_DTYPE)
+    track_ptr = np.concatenate(([0], np.cumsum(track_lengths))).astype(np.int64)
+    track = gather_records(buffer, track_element_offsets(offsets, track_ptr), TRACK_ELEMENT_DTYPE)
+
+    return ColmapPoints3D(ids=records["id"].astype(np.int64), xyz=records["xyz"].copy(), rgb=records["rgb"].copy(),
+                          error=records["error"].copy(), track_ptr=track_ptr,
+                          track_image_ids=track["image_id"].copy(), track_point2D_idxs=track["point2D_idx"].copy())
+
+class ColmapImages:
+    """
+    Struct-of-arrays representation of images.bin. The keypoints of all images
+    are concatenated; those of row i are points2D_ptr[i]:points2D_ptr[i + 1].
+    """
+    def __init__(self, ids, qvecs, tvecs, camera_ids, names, points2D_ptr, xys, point3D_ids):
+        self.ids = ids
+        self.qvecs = qvecs
+        self.tvecs = tvecs
+        self.camera_ids = camera_ids
+        self.names = names
+        self.points2D_ptr = points2D_ptr
+        self.xys = xys
+        self.point3D_ids = point3D_ids
+        self.row_of_id = build_id_lookup(ids)
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def __contains__(self, image_id):
+        return 0 <= image_id < self.row_of_id.shape[0] and self.row_of_id[image_id] >= 0
+
+    def row(self, image_id):
+        if image_id not in self:
+            raise KeyError(image_id)
+        return int(self.row_of_id[image_id])
+
+    def __getitem__(self, image_id):
+        row = self.row(image_id)
+        points2D = slice(self.points2D_ptr[row], self.points2D_ptr[row + 1])
+        return Image(id=image_id, qvec=self.qvecs[row], tvec=self.tvecs[row],
+                     camera_id=int(self.camera_ids[row]), name=self.names[row],
+                     xys=self.xys[points2D], point3D_ids=self.point3D_ids[points2D])
+
+def read_images_binary_arrays(path_to_model_file):
+    """
+    see: src/base/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+        void Reconstruction::WriteImagesBinary(const std::string& path)
+    """
+    with open(path_to_model_file, "rb") as fid:
+        data = fid.read()
+
+    unpack_properties = struct.Struct("<idddddddi").unpack_from
+    unpack_num_points2D = struct.Struct("<Q").unpack_from
+    num_reg_images = unpack_num_points2D(data, 0)[0]
+    properties = []
+    names = []
+    points2D_blocks = []
+    pos = 8
+    for _ in range(num_reg_images):
+        properties.append(unpack_properties(data, pos))
+        pos += 64
+        name_end = data.index(b"\x00", pos)   # look for the ASCII 0 entry
+        names.append(data[pos:name_end].decode("utf-8"))
+        pos = name_end + 1
+        num_points2D = unpack_num_points2D(data, pos)[0]
+        pos += 8
+        points2D_blocks.append((pos, num_points2D))
+        pos += POINT2D_RECORD_DTYPE.itemsize * num_points2D
+
+    # Keypoints of all images are copied block by block into one array
+    points2D_ptr = np.zeros(num_reg_images + 1, dtype=np.int64)
+    points2D_ptr[1:] = np.cumsum([count for _, count in points2D_blocks])
+    points2D = np.empty(int(points2D_ptr[-1]), dtype=POINT2D_RECORD_DTYPE)
+    for row, (offset, count) in enumerate(points2D_blocks):
+        points2D[points2D_ptr[row]:points2D_ptr[row + 1]] = np.frombuffer(data, dtype=POINT2D_RECORD_DTYPE, count=count, offset=offset)
+
+    properties = np.array(properties, dtype=np.float64).reshape(num_reg_images, 9)
+    return ColmapImages(ids=properties[:, 0].astype(np.int64), qvecs=properties[:, 1:5], tvecs=properties[:, 5:8],
+                        camera_ids=properties[:, 8].astype(np.int64), names=names, points2D_ptr=points2D_ptr,
+                        xys=points2D["xy"], point3D_ids=points2D["point3D_id"])
+
 def read_intrinsics_text(path):
     """
     Taken from https://github.com/colmap/colmap/blob/dev/scripts/python/read_write_model.py
@@ -183,33 +401,9 @@ def read_extrinsics_binary(path_to_model_file):
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
-    images = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_reg_images):
-            binary_image_properties = read_next_bytes(
-                fid, num_bytes=64, format_char_sequence="idddddddi")
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            image_name = ""
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            while current_char != b"\x00":   # look for the ASCII 0 entry
-                image_name += current_char.decode("utf-8")
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            num_points2D = read_next_bytes(fid, num_bytes=8,
-                                           format_char_sequence="Q")[0]
-            x_y_id_s = read_next_bytes(fid, num_bytes=24*num_points2D,
-                                       format_char_sequence="ddq"*num_points2D)
-            xys = np.column_stack([tuple(map(float, x_y_id_s[0::3])),
-                                   tuple(map(float, x_y_id_s[1::3]))])
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id, qvec=qvec, tvec=tvec,
-                camera_id=camera_id, name=image_name,
-                xys=xys, point3D_ids=point3D_ids)
-    return images
+    # Images hold views into the concatenated keypoint arrays
+    images = read_images_binary_arrays(path_to_model_file)
+    return {int(image_id): images[int(image_id)] for image_id in images.ids}
 
 
 def read_intrinsics_binary(path_to_model_file):
@@ -11,6 +11,7 @@
 
 import os
 import sys
+from functools import partial
 from PIL import Image
 from typing import NamedTuple
 from scene.colmap_loader import read_extrinsics_text, read_intrinsics_text, qvec2rotmat, \
@@ -21,6 +22,7 @@ import json
 from pathlib import Path
 from plyfile import PlyData, PlyElement
 from utils.sh_utils import SH2RGB
+from utils.general_utils import parallel_map
 from scene.gaussian_model import BasicPointCloud
 
 class CameraInfo(NamedTuple):
@@ -34,6 +36,8 @@ class CameraInfo(NamedTuple):
     image_name: str
     width: int
     height: int
+    image_loader: object = None  # decodes the image on demand when image is None
+    cache_variant: str = ""  # distinguishes preprocessed images of one file in the image cache, e.g. by background
 
 class SceneInfo(NamedTuple):
     point_cloud: BasicPointCloud
@@ -65,14 +69,20 @@ def getNerfppNorm(cam_info):
 
     return {"translate": translate, "radius": radius}
 
-def readColmapCameras(cam_extrinsics, cam_intrinsics, images_folder):
-    cam_infos = []
-    for idx, key in enumerate(cam_extrinsics):
-        sys.stdout.write('\r')
-        # the exact output you're looking for:
-        sys.stdout.write("Reading camera {}/{}".format(idx+1, len(cam_extrinsics)))
-        sys.stdout.flush()
+def readImageSize(image_path):
+    # Only parses the header
+    with Image.open(image_path) as image:
+        return image.size
+
+def loadImage(image_path):
+    # Decode right away so that the work happens on the loader thread
+    image = Image.open(image_path)
+    image.load()
+    return image
 
+def readColmapCameras(cam_extrinsics, cam_intrinsics, images_folder, num_workers=8, lazy=False):
+    cam_infos = []
+    for key in cam_extrinsics:
         extr = cam_extrinsics[key]
         intr = cam_intrinsics[extr.camera_id]
         height = intr.height
@@ -96,13 +106,16 @@ def readColmapCameras(cam_extrinsics, cam_intrinsics, images_folder):
 
         image_path = os.path.join(images_folder, os.path.basename(extr.name))
         image_name = os.path.basename(image_path).split(".")[0]
-        image = Image.open(image_path)
 
-        cam_info = CameraInfo(uid=uid, R=R, T=T, FovY=FovY, FovX=FovX, image=image,
-                              image_path=image_path, image_name=image_name, width=width, height=height)
+        cam_info = CameraInfo(uid=uid, R=R, T=T, FovY=FovY, FovX=FovX, image=None,
+                              image_path=image_path, image_name=image_name, width=width, height=height,
+                              image_loader=partial(loadImage, image_path))
         cam_infos.append(cam_info)
-    sys.stdout.write('\n')
-    return cam_infos
+
+    if lazy:
+        return cam_infos
+    images = parallel_map(loadImage, [cam_info.image_path for cam_info in cam_infos], num_workers, "Reading camera")
+    return [cam_info._replace(image=image) for cam_info, image in zip(cam_infos, images)]
 
 def fetchPly(path):
     plydata = PlyData.read(path)
@@ -121,15 +134,17 @@ def storePly(path, xyz, rgb):
     normals = np.zeros_like(xyz)
 
     elements = np.empty(xyz.shape[0], dtype=dtype)
-    attributes = np.concatenate((xyz, normals, rgb), axis=1)
-    elements[:] = list(map(tuple, attributes))
+    # Fill the records one property (column) at a time instead of one tuple per point
+    attributes = (xyz, normals, rgb)
+    for idx, (name, _) in enumerate(dtype):
+        elements[name] = attributes[idx // 3][:, idx % 3]
 
     # Create the PlyData object and write to file
     vertex_element = PlyElement.describe(elements, 'vertex')
     ply_data = PlyData([vertex_element])
     ply_data.write(path)
 
-def readColmapSceneInfo(path, images, eval, llffhold=8):
+def readColmapSceneInfo(path, images, eval, llffhold=8, num_workers=8, lazy=False):
     try:
         cameras_extrinsic_file = os.path.join(path, "sparse/0", "images.bin")
         cameras_intrinsic_file = os.path.join(path, "sparse/0", "cameras.bin")
@@ -142,7 +157,7 @@ def readColmapSceneInfo(path, images, eval, llffhold=8):
         cam_intrinsics = read_intrinsics_text(cameras_intrinsic_file)
 
     reading_dir = "images" if images == None else images
-    cam_infos_unsorted = readColmapCameras(cam_extrinsics=cam_extrinsics, cam_intrinsics=cam_intrinsics, images_folder=os.path.join(path, reading_dir))
+    cam_infos_unsorted = readColmapCameras(cam_extrinsics=cam_extrinsics, cam_intrinsics=cam_intrinsics, images_folder=os.path.join(path, reading_dir), num_workers=num_workers, lazy=lazy)
     cam_infos = sorted(cam_infos_unsorted.copy(), key = lambda x : x.image_name)
 
     if eval:
@@ -176,15 +191,36 @@ def readColmapSceneInfo(path, images, eval, llffhold=8):
                            ply_path=ply_path)
     return scene_info
 
-def readCamerasFromTransforms(path, transformsfile, white_background, extension=".png"):
+def loadCompositedImage(image_path, bg):
+    image = Image.open(image_path)
+
+    im_data = np.array(image.convert("RGBA"))
+
+    norm_data = im_data / 255.0
+    arr = norm_data[:,:,:3] * norm_data[:, :, 3:4] + bg * (1 - norm_data[:, :, 3:4])
+    return Image.fromarray(np.array(arr*255.0, dtype=np.uint8), "RGB")
+
+def readCamerasFromTransforms(path, transformsfile, white_background, extension=".png", num_workers=8, lazy=False):
     cam_infos = []
 
     with open(os.path.join(path, transformsfile)) as json_file:
         contents = json.load(json_file)
         fovx = contents["camera_angle_x"]
 
+        bg = np.array([1,1,1]) if white_background else np.array([0, 0, 0])
+
         frames = contents["frames"]
-        for idx, frame in enumerate(frames):
+        image_paths = [os.path.join(path, os.path.join(path, frame["file_path"] + extension)) for frame in frames]
+        if lazy:
+            # Decoding is left to image_loader, only the image sizes are needed here
+            images = [None] * len(frames)
+            sizes = parallel_map(readImageSize, image_paths, num_workers, "Reading frame size")
+        else:
+            # Decoding and alpha compositing run concurrently, the poses below are cheap
+            images = parallel_map(lambda image_path: loadCompositedImage(image_path, bg), image_paths, num_workers, "Reading frame")
+            sizes = [image.size for image in images]
+
+        for idx, (frame, image_path, image, size) in enumerate(zip(frames, image_paths, images, sizes)):
             cam_name = os.path.join(path, frame["file_path"] + extension)
 
             # NeRF 'transform_matrix' is a camera-to-world transform
@@ -197,32 +233,24 @@ def readCamerasFromTransforms(path, transformsfile, white_background, extension=
             R = np.transpose(w2c[:3,:3])  # R is stored transposed due to 'glm' in CUDA code
             T = w2c[:3, 3]
 
-            image_path = os.path.join(path, cam_name)
             image_name = Path(cam_name).stem
-            image = Image.open(image_path)
-
-            im_data = np.array(image.convert("RGBA"))
-
-            bg = np.array([1,1,1]) if white_background else np.array([0, 0, 0])
-
-            norm_data = im_data / 255.0
-            arr = norm_data[:,:,:3] * norm_data[:, :, 3:4] + bg * (1 - norm_data[:, :, 3:4])
-            image = Image.fromarray(np.array(arr*255.0, dtype=np.byte), "RGB")
 
-            fovy = focal2fov(fov2focal(fovx, image.size[0]), image.size[1])
+            fovy = focal2fov(fov2focal(fovx, size[0]), size[1])
             FovY = fovy 
             FovX = fovx
 
             cam_infos.append(CameraInfo(uid=idx, R=R, T=T, FovY=FovY, FovX=FovX, image=image,
-                            image_path=image_path, image_name=image_name, width=image.size[0], height=image.size[1]))
+                            image_path=image_path, image_name=image_name, width=size[0], height=size[1],
+                            image_loader=partial(loadCompositedImage, image_path, bg),
+                            cache_variant="white" if white_background else "black"))
             
     return cam_infos
 
-def readNerfSyntheticInfo(path, white_background, eval, extension=".png"):
+def readNerfSyntheticInfo(path, white_background, eval, extension=".png", num_workers=8, lazy=False):
     print("Reading Training Transforms")
-    train_cam_infos = readCamerasFromTransforms(path, "transforms_train.json", white_background, extension)
+    train_cam_infos = readCamerasFromTransforms(path, "transforms_train.json", white_background, extension, num_workers, lazy)
     print("Reading Test Transforms")
-    test_cam_infos = readCamerasFromTransforms(path, "transforms_test.json", white_background, extension)
+    test_cam_infos = readCamerasFromTransforms(path, "transforms_test.json", white_background, extension, num_workers, lazy)
     
     if not eval:
         train_cam_infos.extend(test_cam_infos)
@@ -15,11 +15,19 @@ from utils.general_utils import inverse_sigmoid, get_expon_lr_func, build_rotati
 from torch import nn
 import os
 from utils.system_utils import mkdir_p
-from plyfile import PlyData, PlyElement
+from plyfile import PlyData
 from utils.sh_utils import RGB2SH
-from simple_knn._C import distCUDA2
+try:
+    from simple_knn._C import distCUDA2
+    SIMPLE_KNN_FOUND = True
+except ImportError:
+    SIMPLE_KNN_FOUND = False
 from utils.graphics_utils import BasicPointCloud
 from utils.general_utils import strip_symmetric, build_scaling_rotation
+from utils.ply_utils import memmap_ply_vertices, property_columns, sorted_property_names, write_ply_vertices
+from utils.checkpoint_utils import load_checkpoint
+from utils.compression_utils import quantize_range, dequantize_range, kmeans, pack_quaternions, unpack_quaternions
+from utils.spatial_utils import morton_order, distCPU2
 
 class GaussianModel:
 
@@ -41,7 +49,10 @@ class GaussianModel:
         self.rotation_activation = torch.nn.functional.normalize
 
 
-    def __init__(self, sh_degree : int):
+    def __init__(self, sh_degree : int, device = "cuda", dtype = torch.float):
+        # All parameters and densification statistics are allocated with this device and dtype
+        self.device = torch.device(device)
+        self.dtype = dtype
         self.active_sh_degree = 0
         self.max_sh_degree = sh_degree  
         self._xyz = torch.empty(0)
@@ -55,10 +66,18 @@ class GaussianModel:
         self.denom = torch.empty(0)
         self.optimizer = None
         self.percent_dense = 0
+        self.max_gaussians = 0
         self.spatial_lr_scale = 0
+        # Preallocated rows behind the per-Gaussian tensors, see reserve()
+        self._buffers = {}
+        self._capacity = 0
+        # Optional level-of-detail hierarchy for rendering, see utils.lod_utils
+        self.lod = None
         self.setup_functions()
 
     def capture(self):
+        # The per-Gaussian tensors are views of the first rows of the buffers (see reserve),
+        # CheckpointWriter copies only those rows while torch.save stores the spare rows too
         return (
             self.active_sh_degree,
             self._xyz,
@@ -75,6 +94,9 @@ class GaussianModel:
         )
     
     def restore(self, model_args, training_args):
+        if isinstance(model_args, str):
+            # Path of a checkpoint written by utils.checkpoint_utils.CheckpointWriter
+            model_args, _ = load_checkpoint(model_args, self.device)
         (self.active_sh_degree, 
         self._xyz, 
         self._features_dc, 
@@ -114,8 +136,14 @@ class GaussianModel:
     def get_opacity(self):
         return self.opacity_activation(self._opacity)
     
-    def get_covariance(self, scaling_modifier = 1):
-        return self.covariance_activation(self.get_scaling, scaling_modifier, self._rotation)
+    def get_features_of(self, indices):
+        # get_features of a subset, without assembling the features of all Gaussians
+        return torch.cat((self._features_dc[indices], self._features_rest[indices]), dim=1)
+
+    def get_covariance(self, scaling_modifier = 1, indices = None):
+        if indices is None:
+            return self.covariance_activation(self.get_scaling, scaling_modifier, self._rotation)
+        return self.covariance_activation(self.scaling_activation(self._scaling[indices]), scaling_modifier, self._rotation[indices])
 
     def oneupSHdegree(self):
         if self.active_sh_degree < self.max_sh_degree:
@@ -123,20 +151,24 @@ class GaussianModel:
 
     def create_from_pcd(self, pcd : BasicPointCloud, spatial_lr_scale : float):
         self.spatial_lr_scale = spatial_lr_scale
-        fused_point_cloud = torch.tensor(np.asarray(pcd.points)).float().cuda()
-        fused_color = RGB2SH(torch.tensor(np.asarray(pcd.colors)).float().cuda())
-        features = torch.zeros((fused_color.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().cuda()
+        fused_point_cloud = torch.tensor(np.asarray(pcd.points), dtype=self.dtype, device=self.device)
+        fused_color = RGB2SH(torch.tensor(np.asarray(pcd.colors), dtype=self.dtype, device=self.device))
+        features = torch.zeros((fused_color.shape[0], 3, (self.max_sh_degree + 1) ** 2), dtype=self.dtype, device=self.device)
         features[:, :3, 0 ] = fused_color
         features[:, 3:, 1:] = 0.0
 
         print("Number of points at initialisation : ", fused_point_cloud.shape[0])
 
-        dist2 = torch.clamp_min(distCUDA2(torch.from_numpy(np.asarray(pcd.points)).float().cuda()), 0.0000001)
+        if SIMPLE_KNN_FOUND and self.device.type == "cuda":
+            dist2 = distCUDA2(torch.from_numpy(np.asarray(pcd.points)).float().to(self.device)).to(self.dtype)
+        else:
+            dist2 = distCPU2(fused_point_cloud)
+        dist2 = torch.clamp_min(dist2, 0.0000001)
         scales = torch.log(torch.sqrt(dist2))[...,None].repeat(1, 3)
-        rots = torch.zeros((fused_point_cloud.shape[0], 4), device="cuda")
+        rots = torch.zeros((fused_point_cloud.shape[0], 4), dtype=self.dtype, device=self.device)
         rots[:, 0] = 1
 
-        opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device="cuda"))
+        opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=self.dtype, device=self.device))
 
         self._xyz = nn.Parameter(fused_point_cloud.requires_grad_(True))
         self._features_dc = nn.Parameter(features[:,:,0:1].transpose(1, 2).contiguous().requires_grad_(True))
@@ -144,12 +176,15 @@ class GaussianModel:
         self._scaling = nn.Parameter(scales.requires_grad_(True))
         self._rotation = nn.Parameter(rots.requires_grad_(True))
         self._opacity = nn.Parameter(opacities.requires_grad_(True))
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), dtype=self.dtype, device=self.device)
 
     def training_setup(self, training_args):
         self.percent_dense = training_args.percent_dense
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
+        self.max_gaussians = self.gaussian_budget(training_args.max_gaussians, training_args.gaussian_memory_mb)
+        if self.max_gaussians and self.get_xyz.shape[0] > self.max_gaussians:
+            print("{} Gaussians exceed the budget of {}, the first densification prunes the most transparent ones".format(self.get_xyz.shape[0], self.max_gaussians))
+        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), dtype=self.dtype, device=self.device)
+        self.denom = torch.zeros((self.get_xyz.shape[0], 1), dtype=self.dtype, device=self.device)
 
         l = [
             {'params': [self._xyz], 'lr': training_args.position_lr_init * self.spatial_lr_scale, "name": "xyz"},
@@ -166,6 +201,16 @@ class GaussianModel:
                                                     lr_delay_mult=training_args.position_lr_delay_mult,
                                                     max_steps=training_args.position_lr_max_steps)
 
+    def bytes_per_gaussian(self):
+        # Parameters, their gradients and both Adam moments, plus the densification statistics
+        num_params = 3 + 3 * (self.max_sh_degree + 1) ** 2 + 1 + 3 + 4
+        return (4 * num_params + 3) * torch.tensor([], dtype=self.dtype).element_size()
+
+    def gaussian_budget(self, max_gaussians=0, memory_mb=0):
+        # Densification never grows the model past this many Gaussians, 0 means unbounded
+        budgets = [budget for budget in (max_gaussians, int(memory_mb * 2**20) // self.bytes_per_gaussian() if memory_mb else 0) if budget > 0]
+        return min(budgets) if budgets else 0
+
     def update_learning_rate(self, iteration):
         ''' Learning rate scheduling per step '''
         for param_group in self.optimizer.param_groups:
@@ -188,144 +233,271 @@ class GaussianModel:
             l.append('rot_{}'.format(i))
         return l
 
-    def save_ply(self, path):
-        mkdir_p(os.path.dirname(path))
-
-        xyz = self._xyz.detach().cpu().numpy()
+    def ply_arrays(self):
+        # Host copies of the attributes save_ply writes, in the order of construct_list_of_attributes.
+        # They do not share memory with the parameters, so they can be written while training continues.
+        xyz = self._xyz.detach().to("cpu", copy=True).numpy()
         normals = np.zeros_like(xyz)
-        f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        f_rest = self._features_rest.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        opacities = self._opacity.detach().cpu().numpy()
-        scale = self._scaling.detach().cpu().numpy()
-        rotation = self._rotation.detach().cpu().numpy()
-
-        dtype_full = [(attribute, 'f4') for attribute in self.construct_list_of_attributes()]
-
-        elements = np.empty(xyz.shape[0], dtype=dtype_full)
-        attributes = np.concatenate((xyz, normals, f_dc, f_rest, opacities, scale, rotation), axis=1)
-        elements[:] = list(map(tuple, attributes))
-        el = PlyElement.describe(elements, 'vertex')
-        PlyData([el]).write(path)
+        f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).to("cpu", copy=True).numpy()
+        f_rest = self._features_rest.detach().transpose(1, 2).flatten(start_dim=1).to("cpu", copy=True).numpy()
+        opacities = self._opacity.detach().to("cpu", copy=True).numpy()
+        scale = self._scaling.detach().to("cpu", copy=True).numpy()
+        rotation = self._rotation.detach().to("cpu", copy=True).numpy()
+        return (xyz, normals, f_dc, f_rest, opacities, scale, rotation)
+
+    def save_ply(self, path, morton=False):
+        # With morton, the model itself is first sorted along the Z-order curve, see sort_morton
+        if morton:
+            self.sort_morton()
+        mkdir_p(os.path.dirname(path))
+        write_ply_vertices(path, self.construct_list_of_attributes(), self.ply_arrays())
 
     def reset_opacity(self):
         opacities_new = inverse_sigmoid(torch.min(self.get_opacity, torch.ones_like(self.get_opacity)*0.01))
         optimizable_tensors = self.replace_tensor_to_optimizer(opacities_new, "opacity")
         self._opacity = optimizable_tensors["opacity"]
 
-    def load_ply(self, path):
-        plydata = PlyData.read(path)
+    def load_ply(self, path, morton=False):
+        # Binary files are memory-mapped; every attribute group below is then a
+        # strided view into the mapping that is copied exactly once into its tensor
+        vertices = memmap_ply_vertices(path)
+        if vertices is None:
+            vertices = PlyData.read(path).elements[0].data
+        names = vertices.dtype.names
+        num_points = vertices.shape[0]
 
-        xyz = np.stack((np.asarray(plydata.elements[0]["x"]),
-                        np.asarray(plydata.elements[0]["y"]),
-                        np.asarray(plydata.elements[0]["z"])),  axis=1)
-        opacities = np.asarray(plydata.elements[0]["opacity"])[..., np.newaxis]
+        xyz = property_columns(vertices, ["x", "y", "z"])
+        opacities = property_columns(vertices, ["opacity"])
+        features_dc = property_columns(vertices, ["f_dc_0", "f_dc_1", "f_dc_2"])
 
-        features_dc = np.zeros((xyz.shape[0], 3, 1))
-        features_dc[:, 0, 0] = np.asarray(plydata.elements[0]["f_dc_0"])
-        features_dc[:, 1, 0] = np.asarray(plydata.elements[0]["f_dc_1"])
-        features_dc[:, 2, 0] = np.asarray(plydata.elements[0]["f_dc_2"])
-
-        extra_f_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("f_rest_")]
-        extra_f_names = sorted(extra_f_names, key = lambda x: int(x.split('_')[-1]))
+        extra_f_names = sorted_property_names(names, "f_rest_")
         assert len(extra_f_names)==3*(self.max_sh_degree + 1) ** 2 - 3
-        features_extra = np.zeros((xyz.shape[0], len(extra_f_names)))
-        for idx, attr_name in enumerate(extra_f_names):
-            features_extra[:, idx] = np.asarray(plydata.elements[0][attr_name])
-        # Reshape (P,F*SH_coeffs) to (P, F, SH_coeffs except DC)
-        features_extra = features_extra.reshape((features_extra.shape[0], 3, (self.max_sh_degree + 1) ** 2 - 1))
-
-        scale_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("scale_")]
-        scale_names = sorted(scale_names, key = lambda x: int(x.split('_')[-1]))
-        scales = np.zeros((xyz.shape[0], len(scale_names)))
-        for idx, attr_name in enumerate(scale_names):
-            scales[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        rot_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("rot")]
-        rot_names = sorted(rot_names, key = lambda x: int(x.split('_')[-1]))
-        rots = np.zeros((xyz.shape[0], len(rot_names)))
-        for idx, attr_name in enumerate(rot_names):
-            rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._features_dc = nn.Parameter(torch.tensor(features_dc, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._features_rest = nn.Parameter(torch.tensor(features_extra, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True))
+        features_extra = property_columns(vertices, extra_f_names)
+        # Reshape (P,F*SH_coeffs) to (P, SH_coeffs except DC, F)
+        features_extra = features_extra.reshape((num_points, 3, (self.max_sh_degree + 1) ** 2 - 1)).transpose(0, 2, 1)
 
-        self.active_sh_degree = self.max_sh_degree
+        scales = property_columns(vertices, sorted_property_names(names, "scale_"))
+        rots = property_columns(vertices, sorted_property_names(names, "rot"))
 
-    def replace_tensor_to_optimizer(self, tensor, name):
-        optimizable_tensors = {}
-        for group in self.optimizer.param_groups:
-            if group["name"] == name:
-                stored_state = self.optimizer.state.get(group['params'][0], None)
-                stored_state["exp_avg"] = torch.zeros_like(tensor)
-                stored_state["exp_avg_sq"] = torch.zeros_like(tensor)
+        def to_parameter(array):
+            # from_numpy wraps the (strided) view, contiguous() makes the single copy
+            return nn.Parameter(torch.from_numpy(array).to(device=self.device, dtype=self.dtype).contiguous().requires_grad_(True))
 
-                del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter(tensor.requires_grad_(True))
-                self.optimizer.state[group['params'][0]] = stored_state
+        self._xyz = to_parameter(xyz)
+        self._features_dc = to_parameter(features_dc[:, None, :])
+        self._features_rest = to_parameter(features_extra)
+        self._opacity = to_parameter(opacities)
+        self._scaling = to_parameter(scales)
+        self._rotation = to_parameter(rots)
 
-                optimizable_tensors[group["name"]] = group["params"][0]
-        return optimizable_tensors
+        self.active_sh_degree = self.max_sh_degree
+        if morton:
+            self.sort_morton()
+
+    def save_compressed(self, path, codebook_size=4096, kmeans_iters=10):
+        """
+        Write the model as a compact .npz: positions quantized to 16 bits within
+        their bounding box, float16 DC colors and log-scales, a k-means codebook
+        with one label per Gaussian for the remaining SH coefficients, 8-bit
+        opacities and quaternions packed into 32 bits. Normals are not stored.
+        """
+        assert self.get_xyz.shape[0] > 0, "Cannot compress an empty model"
+        assert codebook_size <= 2**16, "Codebook labels are stored as 16 bits"
+        mkdir_p(os.path.dirname(path))
+        with torch.no_grad():
+            xyz = self._xyz.detach().float()
+            xyz_min = xyz.min(dim=0, keepdim=True).values
+            xyz_max = xyz.max(dim=0, keepdim=True).values
+            opacity = torch.round(self.get_opacity.detach().float() * 255)
+            arrays = {"sh_degree": np.array(self.max_sh_degree),
+                      "xyz": quantize_range(xyz, xyz_min, xyz_max, 16).cpu().numpy().astype(np.uint16),
+                      "xyz_min": xyz_min.cpu().numpy(),
+                      "xyz_max": xyz_max.cpu().numpy(),
+                      "f_dc": self._features_dc.detach().flatten(start_dim=1).cpu().numpy().astype(np.float16),
+                      "opacity": opacity.cpu().numpy().astype(np.uint8),
+                      "scaling": self._scaling.detach().cpu().numpy().astype(np.float16),
+                      "rotation": pack_quaternions(self._rotation.detach().float()).cpu().numpy().astype(np.uint32)}
+            f_rest = self._features_rest.detach().float().flatten(start_dim=1)
+            if f_rest.shape[1] > 0:
+                codebook, labels = kmeans(f_rest, codebook_size, kmeans_iters)
+                arrays["f_rest_codebook"] = codebook.cpu().numpy().astype(np.float16)
+                arrays["f_rest_labels"] = labels.cpu().numpy().astype(np.uint16)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fid:
+            np.savez_compressed(fid, **arrays)
+        os.replace(tmp_path, path)
+
+    def load_compressed(self, path):
+        data = np.load(path)
+        assert int(data["sh_degree"]) == self.max_sh_degree, "Model has SH degree {}, expected {}".format(int(data["sh_degree"]), self.max_sh_degree)
+        num_points = data["xyz"].shape[0]
+
+        def to_tensor(array):
+            return torch.from_numpy(array).to(self.device)
+
+        def to_parameter(tensor):
+            return nn.Parameter(tensor.to(device=self.device, dtype=self.dtype).contiguous().requires_grad_(True))
+
+        xyz = dequantize_range(to_tensor(data["xyz"].astype(np.int64)), to_tensor(data["xyz_min"]), to_tensor(data["xyz_max"]), 16)
+        if "f_rest_codebook" in data:
+            features_extra = to_tensor(data["f_rest_codebook"]).float()[to_tensor(data["f_rest_labels"].astype(np.int64))]
+        else:
+            features_extra = torch.zeros((num_points, 0), device=self.device)
+        # Opacities were rounded to multiples of 1/255, keep them inside (0, 1) for the inverse sigmoid
+        opacities = torch.clamp(to_tensor(data["opacity"]).float() / 255, 0.5 / 255, 1.0 - 0.5 / 255)
+
+        self._xyz = to_parameter(xyz)
+        self._features_dc = to_parameter(to_tensor(data["f_dc"]).float().view(num_points, 1, 3))
+        self._features_rest = to_parameter(features_extra.view(num_points, (self.max_sh_degree + 1) ** 2 - 1, 3))
+        self._opacity = to_parameter(inverse_sigmoid(opacities))
+        self._scaling = to_parameter(to_tensor(data["scaling"]).float())
+        self._rotation = to_parameter(unpack_quaternions(to_tensor(data["rotation"].astype(np.int64))))
 
-    def _prune_optimizer(self, mask):
-        optimizable_tensors = {}
+        self.active_sh_degree = self.max_sh_degree
+
+    def reorder(self, order):
+        """
+        Permute the Gaussians. During training their Adam state, densification
+        statistics and pending gradients are permuted along, so that training
+        continues as if nothing happened.
+        """
+        n = self.get_xyz.shape[0]
+        if self.lod is not None:
+            self.lod.remap(order)
+        if self.optimizer is None:
+            for name in ("_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"):
+                param = getattr(self, name)
+                setattr(self, name, nn.Parameter(param.detach()[order].requires_grad_(param.requires_grad)))
+            if self.max_radii2D.shape[0] == n:
+                self.max_radii2D = self.max_radii2D[order]
+            return
+
+        grads = [group["params"][0].grad for group in self.optimizer.param_groups]
+        self.reserve(n)
+        for buffer in self._buffers.values():
+            buffer[:n] = buffer[:n][order]
+        self._bind(n)
+        for group, grad in zip(self.optimizer.param_groups, grads):
+            if grad is not None:
+                group["params"][0].grad = grad[order]
+
+    def sort_morton(self):
+        # Neighbouring Gaussians in space become neighbours in memory
+        with torch.no_grad():
+            self.reorder(morton_order(self.get_xyz.detach()))
+
+    def _live_tensors(self):
+        # Every tensor with one row per Gaussian: parameters, Adam moments and densification statistics
         for group in self.optimizer.param_groups:
-            stored_state = self.optimizer.state.get(group['params'][0], None)
+            assert len(group["params"]) == 1
+            param = group["params"][0]
+            yield (group["name"], "param"), param.data
+            stored_state = self.optimizer.state.get(param, None)
             if stored_state is not None:
-                stored_state["exp_avg"] = stored_state["exp_avg"][mask]
-                stored_state["exp_avg_sq"] = stored_state["exp_avg_sq"][mask]
-
-                del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter((group["params"][0][mask].requires_grad_(True)))
+                yield (group["name"], "exp_avg"), stored_state["exp_avg"]
+                yield (group["name"], "exp_avg_sq"), stored_state["exp_avg_sq"]
+        yield ("stats", "xyz_gradient_accum"), self.xyz_gradient_accum
+        yield ("stats", "denom"), self.denom
+        yield ("stats", "max_radii2D"), self.max_radii2D
+
+    def _replace_live_tensor(self, key, tensor):
+        # Swap the storage behind one of the _live_tensors, keeping the Parameter the optimizer state belongs to
+        name, kind = key
+        if name == "stats":
+            setattr(self, kind, tensor)
+            return
+        param = next(group["params"][0] for group in self.optimizer.param_groups if group["name"] == name)
+        if kind == "param":
+            param.data = tensor
+        else:
+            self.optimizer.state[param][kind] = tensor
+
+    def reserve(self, num_points):
+        """
+        Make sure every per-Gaussian tensor is a view of the first rows of a
+        buffer with room for num_points Gaussians. Buffers grow by half their
+        size, so densification mostly writes in place instead of reallocating
+        the parameters and both Adam moments on every step, while the spare
+        rows stay smaller than with doubling. A reallocation moves one tensor
+        at a time, so only one old buffer is alive next to the new ones.
+        Tensors replaced from outside (training_setup, restore, Adam's lazy
+        state) are adopted here.
+        """
+        n = self.get_xyz.shape[0]
+        capacity = self._capacity if num_points <= self._capacity else max(num_points, self._capacity + self._capacity // 2)
+        if self.max_gaussians:
+            # Buffers stop at the Gaussian budget, they only hold more rows while the model
+            # itself exceeds it (see plan_densification) and shrink back afterwards
+            capacity = max(num_points, min(capacity, self.max_gaussians))
+        buffers = {}
+        for key, tensor in self._live_tensors():
+            buffer = self._buffers.pop(key, None)
+            if buffer is None or capacity != self._capacity or buffer.data_ptr() != tensor.data_ptr():
+                buffer = torch.empty((capacity,) + tuple(tensor.shape[1:]), dtype=tensor.dtype, device=tensor.device)
+                buffer[:n] = tensor
+                # Drop the last reference to the old storage before allocating the next buffer
+                self._replace_live_tensor(key, buffer[:n])
+            buffers[key] = buffer
+        self._buffers = buffers
+        self._capacity = capacity
+
+    def _bind(self, num_points, names=None):
+        # Point the parameters (and their optimizer state) and the statistics at the first num_points buffer rows
+        for group in self.optimizer.param_groups:
+            if names is not None and group["name"] not in names:
+                continue
+            stored_state = self.optimizer.state.pop(group['params'][0], None)
+            group["params"][0] = nn.Parameter(self._buffers[(group["name"], "param")][:num_points])
+            if stored_state is not None:
+                stored_state["exp_avg"] = self._buffers[(group["name"], "exp_avg")][:num_points]
+                stored_state["exp_avg_sq"] = self._buffers[(group["name"], "exp_avg_sq")][:num_points]
                 self.optimizer.state[group['params'][0]] = stored_state
 
-                optimizable_tensors[group["name"]] = group["params"][0]
-            else:
-                group["params"][0] = nn.Parameter(group["params"][0][mask].requires_grad_(True))
-                optimizable_tensors[group["name"]] = group["params"][0]
-        return optimizable_tensors
-
-    def prune_points(self, mask):
-        valid_points_mask = ~mask
-        optimizable_tensors = self._prune_optimizer(valid_points_mask)
-
-        self._xyz = optimizable_tensors["xyz"]
-        self._features_dc = optimizable_tensors["f_dc"]
-        self._features_rest = optimizable_tensors["f_rest"]
-        self._opacity = optimizable_tensors["opacity"]
-        self._scaling = optimizable_tensors["scaling"]
-        self._rotation = optimizable_tensors["rotation"]
-
-        self.xyz_gradient_accum = self.xyz_gradient_accum[valid_points_mask]
+            if group["name"] == "xyz":
+                self._xyz = group["params"][0]
+            elif group["name"] == "f_dc":
+                self._features_dc = group["params"][0]
+            elif group["name"] == "f_rest":
+                self._features_rest = group["params"][0]
+            elif group["name"] == "opacity":
+                self._opacity = group["params"][0]
+            elif group["name"] == "scaling":
+                self._scaling = group["params"][0]
+            elif group["name"] == "rotation":
+                self._rotation = group["params"][0]
+
+        if names is None:
+            self.xyz_gradient_accum = self._buffers[("stats", "xyz_gradient_accum")][:num_points]
+            self.denom = self._buffers[("stats", "denom")][:num_points]
+            self.max_radii2D = self._buffers[("stats", "max_radii2D")][:num_points]
 
-        self.denom = self.denom[valid_points_mask]
-        self.max_radii2D = self.max_radii2D[valid_points_mask]
+    def replace_tensor_to_optimizer(self, tensor, name):
+        n = self.get_xyz.shape[0]
+        self.reserve(n)
+        self._buffers[(name, "param")][:n] = tensor
+        for moment in ("exp_avg", "exp_avg_sq"):
+            if (name, moment) in self._buffers:
+                self._buffers[(name, moment)][:n] = 0.0
+        self._bind(n, names=[name])
 
-    def cat_tensors_to_optimizer(self, tensors_dict):
         optimizable_tensors = {}
         for group in self.optimizer.param_groups:
-            assert len(group["params"]) == 1
-            extension_tensor = tensors_dict[group["name"]]
-            stored_state = self.optimizer.state.get(group['params'][0], None)
-            if stored_state is not None:
-
-                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor)), dim=0)
-                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor)), dim=0)
-
-                del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
-                self.optimizer.state[group['params'][0]] = stored_state
-
-                optimizable_tensors[group["name"]] = group["params"][0]
-            else:
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+            if group["name"] == name:
                 optimizable_tensors[group["name"]] = group["params"][0]
-
         return optimizable_tensors
 
+    def prune_points(self, mask):
+        valid_points_mask = ~mask
+        n = self.get_xyz.shape[0]
+        self.reserve(n)
+
+        # Compact the surviving rows to the front of every buffer
+        num_valid = int(valid_points_mask.sum())
+        for buffer in self._buffers.values():
+            buffer[:num_valid] = buffer[:n][valid_points_mask]
+        self._bind(num_valid)
+
     def densification_postfix(self, new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation):
         d = {"xyz": new_xyz,
         "f_dc": new_features_dc,
@@ -334,29 +506,33 @@ class GaussianModel:
         "scaling" : new_scaling,
         "rotation" : new_rotation}
 
-        optimizable_tensors = self.cat_tensors_to_optimizer(d)
-        self._xyz = optimizable_tensors["xyz"]
-        self._features_dc = optimizable_tensors["f_dc"]
-        self._features_rest = optimizable_tensors["f_rest"]
-        self._opacity = optimizable_tensors["opacity"]
-        self._scaling = optimizable_tensors["scaling"]
-        self._rotation = optimizable_tensors["rotation"]
+        n = self.get_xyz.shape[0]
+        m = new_xyz.shape[0]
+        self.reserve(n + m)
 
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        # New Gaussians are written after the live rows and start with zero Adam moments
+        for name, tensor in d.items():
+            self._buffers[(name, "param")][n:n + m] = tensor
+            for moment in ("exp_avg", "exp_avg_sq"):
+                if (name, moment) in self._buffers:
+                    self._buffers[(name, moment)][n:n + m] = 0.0
+        self._bind(n + m)
+
+        self.xyz_gradient_accum.zero_()
+        self.denom.zero_()
+        self.max_radii2D.zero_()
 
     def densify_and_split(self, grads, grad_threshold, scene_extent, N=2):
         n_init_points = self.get_xyz.shape[0]
         # Extract points that satisfy the gradient condition
-        padded_grad = torch.zeros((n_init_points), device="cuda")
+        padded_grad = torch.zeros((n_init_points), dtype=self.dtype, device=self.device)
         padded_grad[:grads.shape[0]] = grads.squeeze()
         selected_pts_mask = torch.where(padded_grad >= grad_threshold, True, False)
         selected_pts_mask = torch.logical_and(selected_pts_mask,
                                               torch.max(self.get_scaling, dim=1).values > self.percent_dense*scene_extent)
 
         stds = self.get_scaling[selected_pts_mask].repeat(N,1)
-        means =torch.zeros((stds.size(0), 3),device="cuda")
+        means =torch.zeros((stds.size(0), 3), dtype=self.dtype, device=self.device)
         samples = torch.normal(mean=means, std=stds)
         rots = build_rotation(self._rotation[selected_pts_mask]).repeat(N,1,1)
         new_xyz = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + self.get_xyz[selected_pts_mask].repeat(N, 1)
@@ -368,7 +544,7 @@ class GaussianModel:
 
         self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacity, new_scaling, new_rotation)
 
-        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device="cuda", dtype=bool)))
+        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device=self.device, dtype=bool)))
         self.prune_points(prune_filter)
 
     def densify_and_clone(self, grads, grad_threshold, scene_extent):
@@ -386,22 +562,117 @@ class GaussianModel:
 
         self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation)
 
+    def plan_densification(self, grads, max_grad, min_opacity, extent, max_screen_size, N=2, max_points=0):
+        """
+        Decide the whole densification step up front, with the same criteria
+        as running densify_and_clone, densify_and_split and a final prune in
+        sequence. Returns the indices of the original Gaussians that are kept,
+        of those that are cloned, and the parameters of the kept children of
+        split Gaussians. The surviving model is, in order, the kept originals,
+        the kept clones and the kept children. children["parent"] holds the
+        original index of each child.
+
+        With max_points, only the candidates with the largest gradients are
+        densified, as many as fit without exceeding max_points Gaussians. A
+        model that is already larger, e.g. initialized from a large SfM point
+        cloud or restored with a smaller budget, first loses its most
+        transparent Gaussians, so the result never exceeds max_points.
+        """
+        grads = grads.squeeze(-1)
+        max_scaling = torch.max(self.get_scaling, dim=1).values
+        clone_mask = torch.logical_and(grads >= max_grad, max_scaling <= self.percent_dense*extent)
+        split_mask = torch.logical_and(grads >= max_grad, max_scaling > self.percent_dense*extent)
+
+        def prune_condition(opacity, scaling):
+            # Densification resets max_radii2D before the prune, so only the world-space size test can apply
+            prune_mask = (self.opacity_activation(opacity) < min_opacity).squeeze(-1)
+            if max_screen_size:
+                prune_mask = torch.logical_or(prune_mask, self.scaling_activation(scaling).max(dim=1).values > 0.1 * extent)
+            return prune_mask
+
+        pruned = prune_condition(self._opacity, self._scaling)
+        survivors = (~pruned).nonzero().squeeze(-1)
+        if max_points and survivors.shape[0] > max_points:
+            order = torch.sort(self._opacity[survivors].squeeze(-1), stable=True).indices
+            pruned[survivors[order[:survivors.shape[0] - max_points]]] = True
+        keep = torch.logical_and(~split_mask, ~pruned).nonzero().squeeze(-1)
+        clone = torch.logical_and(clone_mask, ~pruned).nonzero().squeeze(-1)
+
+        stds = self.get_scaling[split_mask].repeat(N,1)
+        means = torch.zeros((stds.size(0), 3), dtype=self.dtype, device=self.device)
+        samples = torch.normal(mean=means, std=stds)
+        rots = build_rotation(self._rotation[split_mask]).repeat(N,1,1)
+        children = {"xyz": torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + self.get_xyz[split_mask].repeat(N, 1),
+                    "f_dc": self._features_dc[split_mask].repeat(N,1,1),
+                    "f_rest": self._features_rest[split_mask].repeat(N,1,1),
+                    "opacity": self._opacity[split_mask].repeat(N,1),
+                    "scaling": self.scaling_inverse_activation(stds / (0.8*N)),
+                    "rotation": self._rotation[split_mask].repeat(N,1),
+                    "parent": split_mask.nonzero().squeeze(-1).repeat(N)}
+        kept_children = ~prune_condition(children["opacity"], children["scaling"])
+
+        if max_points:
+            # Net number of Gaussians each candidate adds, counted against the pruned model
+            growth = torch.zeros(grads.shape[0], dtype=torch.long, device=self.device)
+            growth[torch.logical_and(clone_mask, ~pruned)] = 1
+            growth[split_mask] = kept_children.view(N, -1).sum(dim=0) - (~pruned[split_mask]).long()
+            candidates = torch.logical_or(clone_mask, split_mask).nonzero().squeeze(-1)
+            candidates = candidates[torch.argsort(grads[candidates], descending=True)]
+            over_budget = (torch.cumsum(growth[candidates], dim=0) > max_points - int((~pruned).sum())).nonzero()
+            if over_budget.shape[0] > 0:
+                selected = torch.zeros_like(clone_mask)
+                selected[candidates[:int(over_budget[0])]] = True
+                kept_children = torch.logical_and(kept_children, selected[split_mask].repeat(N))
+                split_mask = torch.logical_and(split_mask, selected)
+                clone_mask = torch.logical_and(clone_mask, selected)
+                keep = torch.logical_and(~split_mask, ~pruned).nonzero().squeeze(-1)
+                clone = torch.logical_and(clone_mask, ~pruned).nonzero().squeeze(-1)
+
+        children = {name: tensor[kept_children] for name, tensor in children.items()}
+        return keep, clone, children
+
+    def apply_densification(self, keep, clone, children):
+        """
+        Single gather per buffer: kept originals and clones, then the children
+        of split Gaussians. Returns the previous index of every new row, or of
+        its parent for children (see GaussianBVH.update).
+        """
+        n = self.get_xyz.shape[0]
+        num_keep = keep.shape[0]
+        num_copied = num_keep + clone.shape[0]
+        num_points = num_copied + children["xyz"].shape[0]
+        self.reserve(max(n, num_points))
+
+        source = torch.cat((keep, clone))
+        for (name, kind), buffer in self._buffers.items():
+            if name == "stats":
+                buffer[:num_points] = 0.0
+            elif kind == "param":
+                buffer[:num_copied] = buffer[:n][source]
+                buffer[num_copied:num_points] = children[name]
+            else:
+                # Clones and children start with zero Adam moments
+                buffer[:num_keep] = buffer[:n][keep]
+                buffer[num_keep:num_points] = 0.0
+        self._bind(num_points)
+        return torch.cat((keep, clone, children["parent"]))
+
     def densify_and_prune(self, max_grad, min_opacity, extent, max_screen_size):
         grads = self.xyz_gradient_accum / self.denom
         grads[grads.isnan()] = 0.0
 
-        self.densify_and_clone(grads, max_grad, extent)
-        self.densify_and_split(grads, max_grad, extent)
-
-        prune_mask = (self.get_opacity < min_opacity).squeeze()
-        if max_screen_size:
-            big_points_vs = self.max_radii2D > max_screen_size
-            big_points_ws = self.get_scaling.max(dim=1).values > 0.1 * extent
-            prune_mask = torch.logical_or(torch.logical_or(prune_mask, big_points_vs), big_points_ws)
-        self.prune_points(prune_mask)
+        plan = self.plan_densification(grads, max_grad, min_opacity, extent, max_screen_size, max_points=self.max_gaussians)
+        sources = self.apply_densification(*plan)
+        if self.max_gaussians and self._capacity > self.max_gaussians:
+            # The model was over budget before this step, release the extra rows
+            self.reserve(self.get_xyz.shape[0])
+            self._bind(self.get_xyz.shape[0])
 
-        torch.cuda.empty_cache()
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+        return sources
 
-    def add_densification_stats(self, viewspace_point_tensor, update_filter):
-        self.xyz_gradient_accum[update_filter] += torch.norm(viewspace_point_tensor.grad[update_filter,:2], dim=-1, keepdim=True)
+    def add_densification_stats(self, viewspace_point_tensor, update_filter, grad_scale=1.0):
+        # grad_scale undoes a scaling of the loss, e.g. averaging over a batch of views
+        self.xyz_gradient_accum[update_filter] += grad_scale * torch.norm(viewspace_point_tensor.grad[update_filter,:2], dim=-1, keepdim=True)
         self.denom[update_filter] += 1
@@ -0,0 +1,148 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import shutil
+import itertools
+import numpy as np
+from typing import NamedTuple
+from utils.system_utils import mkdir_p
+from utils.ply_utils import read_ply_header, element_dtype, property_columns, sorted_property_names, PLY_TYPES
+
+class GaussianChunk(NamedTuple):
+    # Raw (not activated) parameters laid out like the GaussianModel tensors
+    start: int
+    xyz: np.array
+    features_dc: np.array
+    features_rest: np.array
+    opacity: np.array
+    scaling: np.array
+    rotation: np.array
+
+    def __len__(self):
+        return self.xyz.shape[0]
+
+    def select(self, mask):
+        return GaussianChunk(self.start, self.xyz[mask], self.features_dc[mask], self.features_rest[mask],
+                             self.opacity[mask], self.scaling[mask], self.rotation[mask])
+
+def count_ply_vertices(path):
+    return read_ply_header(path).elements[0].count
+
+def iter_ply_vertices(path, chunk_size=1_000_000):
+    """
+    Yield the vertex records of a PLY file as structured arrays of at most
+    chunk_size entries, reading the file sequentially so that only one chunk
+    is resident at a time.
+    """
+    header = read_ply_header(path)
+    vertex = header.elements[0]
+    assert vertex.name == "vertex", "Expected the first PLY element to be 'vertex'"
+    dtype = element_dtype(vertex, header.format)
+    with open(path, "rb") as fid:
+        fid.seek(header.header_size)
+        if header.format == "ascii":
+            dtype = np.dtype([(name, PLY_TYPES[ply_type]) for name, ply_type in vertex.properties])
+            for start in range(0, vertex.count, chunk_size):
+                lines = itertools.islice(fid, min(chunk_size, vertex.count - start))
+                yield np.atleast_1d(np.loadtxt(lines, dtype=dtype))
+        else:
+            assert dtype is not None, "Streaming is not supported for PLY list properties"
+            for start in range(0, vertex.count, chunk_size):
+                count = min(chunk_size, vertex.count - start)
+                records = np.fromfile(fid, dtype=dtype, count=count)
+                assert records.shape[0] == count, "Truncated PLY file: {}".format(path)
+                yield records
+
+def iter_gaussian_chunks(path, chunk_size=1_000_000):
+    """
+    Stream a point_cloud.ply written by GaussianModel.save_ply as GaussianChunks.
+    """
+    start = 0
+    for vertices in iter_ply_vertices(path, chunk_size):
+        names = vertices.dtype.names
+        extra_f_names = sorted_property_names(names, "f_rest_")
+        features_rest = property_columns(vertices, extra_f_names).astype(np.float32)
+        # (P, F*SH_coeffs) to (P, SH_coeffs except DC, F)
+        features_rest = features_rest.reshape((vertices.shape[0], 3, len(extra_f_names) // 3)).transpose(0, 2, 1)
+        chunk = GaussianChunk(start=start,
+                              xyz=property_columns(vertices, ["x", "y", "z"]).astype(np.float32),
+                              features_dc=property_columns(vertices, ["f_dc_0", "f_dc_1", "f_dc_2"]).astype(np.float32)[:, None, :],
+                              features_rest=np.ascontiguousarray(features_rest),
+                              opacity=property_columns(vertices, ["opacity"]).astype(np.float32),
+                              scaling=property_columns(vertices, sorted_property_names(names, "scale_")).astype(np.float32),
+                              rotation=property_columns(vertices, sorted_property_names(names, "rot")).astype(np.float32))
+        start += len(chunk)
+        yield chunk
+
+def gaussian_attribute_names(num_rest, num_scale=3, num_rot=4):
+    # Same property layout as GaussianModel.construct_list_of_attributes
+    l = ['x', 'y', 'z', 'nx', 'ny', 'nz']
+    l += ['f_dc_{}'.format(i) for i in range(3)]
+    l += ['f_rest_{}'.format(i) for i in range(num_rest)]
+    l.append('opacity')
+    l += ['scale_{}'.format(i) for i in range(num_scale)]
+    l += ['rot_{}'.format(i) for i in range(num_rot)]
+    return l
+
+class GaussianPlyWriter:
+    """
+    Incrementally write GaussianChunks to a PLY file readable by
+    GaussianModel.load_ply. The number of Gaussians does not need to be known
+    in advance: records are appended to a temporary body file and the header
+    is written once the writer is closed.
+
+        with GaussianPlyWriter(out_path) as writer:
+            for chunk in iter_gaussian_chunks(in_path):
+                writer.write(chunk.select(chunk.opacity[:, 0] > 0))
+    """
+    def __init__(self, path):
+        mkdir_p(os.path.dirname(os.path.abspath(path)))
+        self.path = path
+        self.body_path = path + ".body"
+        self.body = open(self.body_path, "wb")
+        self.attributes = None
+        self.count = 0
+
+    def write(self, chunk : GaussianChunk):
+        n = len(chunk)
+        f_rest = chunk.features_rest.transpose(0, 2, 1).reshape(n, -1)
+        if self.attributes is None:
+            self.attributes = gaussian_attribute_names(f_rest.shape[1], chunk.scaling.shape[1], chunk.rotation.shape[1])
+        columns = np.zeros((n, len(self.attributes)), dtype='<f4')
+        start = 0
+        for attribute in (chunk.xyz, np.zeros_like(chunk.xyz), chunk.features_dc.reshape(n, -1), f_rest,
+                          chunk.opacity, chunk.scaling, chunk.rotation):
+            columns[:, start:start + attribute.shape[1]] = attribute
+            start += attribute.shape[1]
+        columns.tofile(self.body)
+        self.count += n
+
+    def close(self):
+        self.body.close()
+        attributes = self.attributes if self.attributes is not None else gaussian_attribute_names(0)
+        header = ["ply", "format binary_little_endian 1.0", "element vertex {}".format(self.count)]
+        header += ["property float {}".format(name) for name in attributes]
+        header.append("end_header")
+        with open(self.path, "wb") as fid, open(self.body_path, "rb") as body:
+            fid.write(("\n".join(header) + "\n").encode("ascii"))
+            shutil.copyfileobj(body, fid)
+        os.remove(self.body_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.body.close()
+            os.remove(self.body_path)
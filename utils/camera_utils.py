@@ -11,13 +11,19 @@
 
 from scene.cameras import Camera
 import numpy as np
-from utils.general_utils import PILtoTorch
+from PIL import Image
+from utils.general_utils import NumpyToTorch, parallel_map
 from utils.graphics_utils import fov2focal
+from utils.image_cache import ImageCache
 
 WARNED = False
 
-def loadCam(args, id, cam_info, resolution_scale):
-    orig_w, orig_h = cam_info.image.size
+def loadCam(args, id, cam_info, resolution_scale, image_cache=None, image_lru=None):
+    if cam_info.image is not None:
+        orig_w, orig_h = cam_info.image.size
+    else:
+        with Image.open(cam_info.image_path) as image:
+            orig_w, orig_h = image.size
 
     if args.resolution in [1, 2, 4, 8]:
         resolution = round(orig_w/(resolution_scale * args.resolution)), round(orig_h/(resolution_scale * args.resolution))
@@ -38,25 +44,49 @@ def loadCam(args, id, cam_info, resolution_scale):
         scale = float(global_down) * float(resolution_scale)
         resolution = (int(orig_w / scale), int(orig_h / scale))
 
-    resized_image_rgb = PILtoTorch(cam_info.image, resolution)
+    def decode():
+        image = cam_info.image if cam_info.image is not None else cam_info.image_loader()
+        return np.array(image.resize(resolution))
 
-    gt_image = resized_image_rgb[:3, ...]
-    loaded_mask = None
+    def load_image():
+        if image_cache is not None:
+            # Composited images depend on the background as well, see CameraInfo.cache_variant
+            resized_image_rgb = NumpyToTorch(image_cache.fetch(cam_info.image_path, resolution, decode, cam_info.cache_variant), normalize=False)
+        else:
+            resized_image_rgb = NumpyToTorch(decode(), normalize=False)
+
+        gt_image = resized_image_rgb[:3, ...]
+        loaded_mask = None
+
+        if resized_image_rgb.shape[1] == 4:
+            loaded_mask = resized_image_rgb[3:4, ...]
+        return gt_image, loaded_mask
 
-    if resized_image_rgb.shape[1] == 4:
-        loaded_mask = resized_image_rgb[3:4, ...]
+    if image_lru is not None:
+        # The ground truth is only loaded when the camera's original_image is first used
+        return Camera(colmap_id=cam_info.uid, R=cam_info.R, T=cam_info.T,
+                      FoVx=cam_info.FovX, FoVy=cam_info.FovY,
+                      image=None, gt_alpha_mask=None,
+                      image_name=cam_info.image_name, uid=id, data_device=args.data_device,
+                      device=args.device, image_loader=load_image, image_lru=image_lru,
+                      width=resolution[0], height=resolution[1])
 
+    gt_image, loaded_mask = load_image()
     return Camera(colmap_id=cam_info.uid, R=cam_info.R, T=cam_info.T, 
                   FoVx=cam_info.FovX, FoVy=cam_info.FovY, 
                   image=gt_image, gt_alpha_mask=loaded_mask,
-                  image_name=cam_info.image_name, uid=id, data_device=args.data_device)
+                  image_name=cam_info.image_name, uid=id, data_device=args.data_device,
+                  device=args.device)
 
-def cameraList_from_camInfos(cam_infos, resolution_scale, args):
-    camera_list = []
+def cameraList_from_camInfos(cam_infos, resolution_scale, args, image_lru=None):
+    image_cache = ImageCache(args.image_cache) if args.image_cache else None
 
-    for id, c in enumerate(cam_infos):
-        camera_list.append(loadCam(args, id, c, resolution_scale))
+    # Resizing and the host-to-device copies of different cameras run concurrently
+    camera_list = parallel_map(lambda item: loadCam(args, item[0], item[1], resolution_scale, image_cache, image_lru),
+                               enumerate(cam_infos), args.load_workers, "Loading camera")
 
+    if image_cache is not None:
+        print("Image cache: {} hits, {} misses".format(image_cache.hits, image_cache.misses))
     return camera_list
 
 def camera_to_JSON(id, camera : Camera):
@@ -0,0 +1,160 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import glob
+import shutil
+import torch
+from torch import nn
+from utils.system_utils import BackgroundWriter
+
+def snapshot(obj, num_rows, rows, path=""):
+    """
+    Copy every tensor of a nested tuple/list/dict structure (such as
+    GaussianModel.capture()) to host memory. Tensors with num_rows rows are
+    moved into rows and replaced by a placeholder, everything else stays in
+    place. Device tensors are copied asynchronously into pinned memory, the
+    caller must synchronize before reading them.
+    """
+    if isinstance(obj, torch.Tensor):
+        tensor = obj.detach()
+        if tensor.is_cuda:
+            host = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+            host.copy_(tensor, non_blocking=True)
+        else:
+            host = tensor.clone()
+        if tensor.dim() > 0 and tensor.shape[0] == num_rows:
+            rows[path] = host
+            return {"rows": path, "parameter": isinstance(obj, nn.Parameter)}
+        return host
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(snapshot(item, num_rows, rows, "{}/{}".format(path, idx)) for idx, item in enumerate(obj))
+    if isinstance(obj, dict):
+        return {key: snapshot(value, num_rows, rows, "{}/{}".format(path, key)) for key, value in obj.items()}
+    return obj
+
+def restore_rows(obj, rows):
+    # Inverse of snapshot: put the row tensors back in place of their placeholders
+    if isinstance(obj, dict) and set(obj.keys()) == {"rows", "parameter"}:
+        tensor = rows[obj["rows"]]
+        return nn.Parameter(tensor.requires_grad_(True)) if obj["parameter"] else tensor
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(restore_rows(item, rows) for item in obj)
+    if isinstance(obj, dict):
+        return {key: restore_rows(value, rows) for key, value in obj.items()}
+    return obj
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+def previous_checkpoints(path):
+    # Copies that write_checkpoint moved aside while replacing path, newest first
+    return sorted(glob.glob(glob.escape(path) + ".old*"), key=os.path.getmtime, reverse=True)
+
+def write_checkpoint(path, meta, rows, num_rows, shard_bytes):
+    """
+    Shards are written into a temporary directory that is renamed to path
+    once complete. An existing checkpoint at path is first moved aside to
+    path.old<pid> and deleted after the rename. If the process dies between
+    the two renames, path is missing and load_checkpoint falls back to the
+    moved copy, so an interrupted write never loses the previous checkpoint.
+    """
+    tmp_path = "{}.tmp{}".format(path, os.getpid())
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    row_bytes = sum(tensor[0].nelement() * tensor.element_size() for tensor in rows.values()) if num_rows > 0 else 0
+    rows_per_shard = max(1, shard_bytes // max(row_bytes, 1))
+    shards = []
+    for start in range(0, max(num_rows, 1), rows_per_shard):
+        name = "shard_{:05d}.pth".format(len(shards))
+        # Slices are cloned, torch.save would otherwise serialize their whole storage
+        torch.save({key: tensor[start:start + rows_per_shard].clone() for key, tensor in rows.items()}, os.path.join(tmp_path, name))
+        shards.append(name)
+    meta = dict(meta, shards=shards, num_rows=num_rows)
+    torch.save(meta, os.path.join(tmp_path, "meta.pth"))
+
+    if os.path.exists(path):
+        os.replace(path, "{}.old{}".format(path, os.getpid()))
+    os.replace(tmp_path, path)
+    # Also drops copies left behind by an earlier interrupted write
+    for old_path in previous_checkpoints(path):
+        remove_path(old_path)
+
+def load_checkpoint(path, device):
+    """
+    Returns (model_args, iteration) of a checkpoint, either a directory
+    written by CheckpointWriter or a single file written with
+    torch.save((gaussians.capture(), iteration), path). If a write that
+    replaced path was interrupted, the previous checkpoint is loaded from
+    where write_checkpoint moved it.
+    """
+    if not os.path.exists(path):
+        old_paths = previous_checkpoints(path)
+        assert old_paths, "Checkpoint {} not found".format(path)
+        print("Checkpoint {} was being replaced, loading the previous one from {}".format(path, old_paths[0]))
+        path = old_paths[0]
+    if not os.path.isdir(path):
+        return torch.load(path, map_location=device)
+    meta = torch.load(os.path.join(path, "meta.pth"), map_location=device)
+    rows = {}
+    start = 0
+    for name in meta["shards"]:
+        shard = torch.load(os.path.join(path, name), map_location=device)
+        shard_rows = 0
+        for key, tensor in shard.items():
+            if key not in rows:
+                rows[key] = torch.empty((meta["num_rows"],) + tuple(tensor.shape[1:]), dtype=tensor.dtype, device=tensor.device)
+            rows[key][start:start + tensor.shape[0]] = tensor
+            shard_rows = tensor.shape[0]
+        start += shard_rows
+    return restore_rows(meta["model_args"], rows), meta["iteration"]
+
+class CheckpointWriter:
+    """
+    Writes training checkpoints on a background thread. save() only takes a
+    host memory snapshot of the model and optimizer state (through pinned
+    memory for device tensors), so training continues while the checkpoint is
+    serialized. Each checkpoint is a directory holding the per-Gaussian
+    tensors in row shards of about shard_size_mb and a meta.pth with the rest.
+    At most max_pending snapshots are held in host memory at a time.
+
+        writer = CheckpointWriter(shard_size_mb=256)
+        writer.save(scene.model_path + "/chkpnt7000", gaussians, 7000)
+        writer.close()
+    """
+    def __init__(self, shard_size_mb=256, max_pending=2):
+        self.shard_bytes = int(shard_size_mb * 2**20)
+        self.writer = BackgroundWriter(max_pending)
+
+    def save(self, path, gaussians, iteration):
+        model_args = gaussians.capture()
+        num_rows = gaussians.get_xyz.shape[0]
+        rows = {}
+        meta = {"model_args": snapshot(model_args, num_rows, rows), "iteration": iteration}
+        ready = None
+        if gaussians.device.type == "cuda":
+            # The copies were queued on the current stream, ahead of any later update of the parameters
+            ready = torch.cuda.Event()
+            ready.record()
+        self.writer.submit(self._write, path, meta, rows, num_rows, ready)
+
+    def _write(self, path, meta, rows, num_rows, ready):
+        if ready is not None:
+            ready.synchronize()
+        write_checkpoint(path, meta, rows, num_rows, self.shard_bytes)
+
+    def close(self):
+        self.writer.wait()
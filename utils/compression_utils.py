@@ -0,0 +1,75 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import math
+import torch
+
+def quantize_range(values, low, high, bits):
+    # Uniform quantization of values in [low, high] (per column) to unsigned integers of the given bit width
+    levels = 2 ** bits - 1
+    extent = torch.clamp(high - low, min=1e-12)
+    return torch.round((values - low) / extent * levels).clamp(0, levels).long()
+
+def dequantize_range(codes, low, high, bits):
+    levels = 2 ** bits - 1
+    return low + codes.to(low.dtype) / levels * (high - low)
+
+def nearest_centroids(data, codebook, batch_size=16384):
+    # argmin_k |x - c_k|^2 = argmin_k |c_k|^2 - 2 x.c_k, evaluated batch by batch to bound memory
+    codebook_sq = (codebook * codebook).sum(dim=1)
+    labels = torch.empty(data.shape[0], dtype=torch.long, device=data.device)
+    for start in range(0, data.shape[0], batch_size):
+        batch = data[start:start + batch_size]
+        labels[start:start + batch_size] = torch.argmin(codebook_sq - 2.0 * batch @ codebook.t(), dim=1)
+    return labels
+
+def kmeans(data, num_clusters, num_iters=10, batch_size=16384, seed=0):
+    """
+    Lloyd's k-means of the rows of data, initialized with randomly chosen rows.
+    Returns the (num_clusters, D) codebook and the label of every row.
+    """
+    num_clusters = min(num_clusters, data.shape[0])
+    generator = torch.Generator().manual_seed(seed)
+    codebook = data[torch.randperm(data.shape[0], generator=generator)[:num_clusters].to(data.device)].clone()
+    for _ in range(num_iters):
+        labels = nearest_centroids(data, codebook, batch_size)
+        sums = torch.zeros_like(codebook).index_add_(0, labels, data)
+        counts = torch.bincount(labels, minlength=num_clusters)
+        # Empty clusters keep their previous centroid
+        nonempty = counts > 0
+        codebook[nonempty] = sums[nonempty] / counts[nonempty].unsqueeze(1).to(data.dtype)
+    return codebook, nearest_centroids(data, codebook, batch_size)
+
+def pack_quaternions(quaternions):
+    """
+    Pack unit quaternions into 32 bits each ("smallest three"): 2 bits for the
+    index of the largest component, which is made positive and dropped, and
+    10 bits for each of the other three, which lie in [-1/sqrt(2), 1/sqrt(2)].
+    """
+    q = torch.nn.functional.normalize(quaternions, dim=1)
+    largest = q.abs().argmax(dim=1)
+    sign = torch.sign(q.gather(1, largest[:, None]))
+    q = q * torch.where(sign == 0, torch.ones_like(sign), sign)
+    others = q[torch.arange(4, device=q.device)[None, :] != largest[:, None]].view(-1, 3)
+    bound = torch.full((1, 3), 1.0 / math.sqrt(2.0), dtype=q.dtype, device=q.device)
+    codes = quantize_range(others, -bound, bound, 10)
+    return (largest << 30) | (codes[:, 0] << 20) | (codes[:, 1] << 10) | codes[:, 2]
+
+def unpack_quaternions(packed, dtype=torch.float):
+    packed = packed.long()
+    largest = (packed >> 30) & 3
+    codes = torch.stack(((packed >> 20) & 1023, (packed >> 10) & 1023, packed & 1023), dim=1)
+    bound = torch.full((1, 3), 1.0 / math.sqrt(2.0), dtype=dtype, device=packed.device)
+    others = dequantize_range(codes, -bound, bound, 10)
+    q = torch.empty((packed.shape[0], 4), dtype=dtype, device=packed.device)
+    q[torch.arange(4, device=packed.device)[None, :] != largest[:, None]] = others.reshape(-1)
+    q.scatter_(1, largest[:, None], torch.sqrt(torch.clamp(1.0 - (others * others).sum(dim=1, keepdim=True), min=0.0)))
+    return q
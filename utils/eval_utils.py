@@ -0,0 +1,23 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import torch
+from gaussian_renderer import render
+from utils.image_utils import psnr
+
+def evaluate(views, gaussians, pipeline, background):
+    # Mean PSNR of the clamped renders of gaussians over views
+    psnr_total = 0.0
+    for view in views:
+        image = torch.clamp(render(view, gaussians, pipeline, background)["render"], 0.0, 1.0)
+        gt_image = torch.clamp(view.original_image.to(gaussians.device), 0.0, 1.0)
+        psnr_total += psnr(image, gt_image).mean().double()
+    return float(psnr_total / len(views))
@@ -11,7 +11,9 @@
 
 import torch
 import sys
+import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import random
 
@@ -20,12 +22,47 @@ def inverse_sigmoid(x):
 
 def PILtoTorch(pil_image, resolution):
     resized_image_PIL = pil_image.resize(resolution)
-    resized_image = torch.from_numpy(np.array(resized_image_PIL)) / 255.0
+    return NumpyToTorch(np.array(resized_image_PIL))
+
+def NumpyToTorch(image, normalize=True):
+    # (H, W) or (H, W, C) uint8 array to a (C, H, W) float tensor in [0, 1], or uint8 if not normalize
+    resized_image = torch.from_numpy(image) / 255.0 if normalize else torch.from_numpy(np.ascontiguousarray(image))
     if len(resized_image.shape) == 3:
         return resized_image.permute(2, 0, 1)
     else:
         return resized_image.unsqueeze(dim=-1).permute(2, 0, 1)
 
+def parallel_map(func, items, num_workers, desc="Loading"):
+    """
+    Apply func to every item, in order, on a pool of num_workers threads, and
+    report progress and throughput. PIL decoding/resizing and torch copies
+    release the GIL, so image loading scales with the worker count.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    start = time.time()
+
+    def report(done):
+        sys.stdout.write('\r')
+        sys.stdout.write("{} {}/{}".format(desc, done, len(items)))
+        sys.stdout.flush()
+
+    if num_workers <= 1:
+        for idx, item in enumerate(items):
+            results[idx] = func(item)
+            report(idx + 1)
+    else:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            futures = {pool.submit(func, item): idx for idx, item in enumerate(items)}
+            for done, future in enumerate(as_completed(futures)):
+                results[futures[future]] = future.result()
+                report(done + 1)
+
+    elapsed = time.time() - start
+    sys.stdout.write("\nDone in {:.2f}s ({:.1f}/s with {} workers)\n".format(
+        elapsed, len(items) / max(elapsed, 1e-9), max(num_workers, 1)))
+    return results
+
 def get_expon_lr_func(
     lr_init, lr_final, lr_delay_steps=0, lr_delay_mult=1.0, max_steps=1000000
 ):
@@ -62,7 +99,7 @@ def get_expon_lr_func(
     return helper
 
 def strip_lowerdiag(L):
-    uncertainty = torch.zeros((L.shape[0], 6), dtype=torch.float, device="cuda")
+    uncertainty = torch.zeros((L.shape[0], 6), dtype=L.dtype, device=L.device)
 
     uncertainty[:, 0] = L[:, 0, 0]
     uncertainty[:, 1] = L[:, 0, 1]
@@ -80,7 +117,7 @@ def build_rotation(r):
 
     q = r / norm[:, None]
 
-    R = torch.zeros((q.size(0), 3, 3), device='cuda')
+    R = torch.zeros((q.size(0), 3, 3), dtype=q.dtype, device=q.device)
 
     r = q[:, 0]
     x = q[:, 1]
@@ -98,8 +135,24 @@ def build_rotation(r):
     R[:, 2, 2] = 1 - 2 * (x*x + y*y)
     return R
 
+def rotation_to_quaternion(R):
+    """
+    Inverse of build_rotation: unit quaternions (r, x, y, z) of rotation
+    matrices. Each row of candidates is 4 q_i q for one component q_i; the
+    row with the largest q_i is the numerically stable one.
+    """
+    R00, R11, R22 = R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]
+    candidates = torch.stack((
+        torch.stack((1 + R00 + R11 + R22, R[:, 2, 1] - R[:, 1, 2], R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] - R[:, 0, 1]), dim=1),
+        torch.stack((R[:, 2, 1] - R[:, 1, 2], 1 + R00 - R11 - R22, R[:, 1, 0] + R[:, 0, 1], R[:, 0, 2] + R[:, 2, 0]), dim=1),
+        torch.stack((R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] + R[:, 0, 1], 1 - R00 + R11 - R22, R[:, 2, 1] + R[:, 1, 2]), dim=1),
+        torch.stack((R[:, 1, 0] - R[:, 0, 1], R[:, 0, 2] + R[:, 2, 0], R[:, 2, 1] + R[:, 1, 2], 1 - R00 - R11 + R22), dim=1)), dim=1)
+    best = torch.argmax(torch.stack((R00 + R11 + R22, R00, R11, R22), dim=1), dim=1)
+    q = candidates[torch.arange(R.shape[0], device=R.device), best]
+    return q / q.norm(dim=1, keepdim=True)
+
 def build_scaling_rotation(s, r):
-    L = torch.zeros((s.shape[0], 3, 3), dtype=torch.float, device="cuda")
+    L = torch.zeros((s.shape[0], 3, 3), dtype=s.dtype, device=s.device)
     R = build_rotation(r)
 
     L[:,0,0] = s[:,0]
@@ -130,4 +183,5 @@ def safe_state(silent):
     random.seed(0)
     np.random.seed(0)
     torch.manual_seed(0)
-    torch.cuda.set_device(torch.device("cuda:0"))
+    if torch.cuda.is_available():
+        torch.cuda.set_device(torch.device("cuda:0"))
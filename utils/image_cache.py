@@ -0,0 +1,107 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from utils.system_utils import mkdir_p
+
+class ImageCache:
+    """
+    On-disk store of preprocessed (decoded, composited and resized) uint8
+    images. Each entry is a .npy file named after the source image path, its
+    modification time and size, the target resolution and a variant string,
+    so editing a source image or changing the resolution simply misses.
+    Entries are memory-mapped when read.
+    """
+    def __init__(self, cache_dir):
+        mkdir_p(cache_dir)
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def entry_path(self, image_path, resolution, variant=""):
+        stat = os.stat(image_path)
+        key = "{}|{}|{}|{}x{}|{}".format(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size,
+                                         resolution[0], resolution[1], variant)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy")
+
+    def fetch(self, image_path, resolution, produce, variant=""):
+        """
+        Return the cached array for this image and resolution, calling
+        produce() to build (and store) it on a miss.
+        """
+        entry = self.entry_path(image_path, resolution, variant)
+        if os.path.exists(entry):
+            try:
+                # Copy-on-write so that torch gets a writable buffer
+                array = np.load(entry, mmap_mode="c")
+                with self._lock:
+                    self.hits += 1
+                return array
+            except (ValueError, OSError):
+                pass  # Truncated or foreign entry, rebuild it
+
+        array = np.ascontiguousarray(produce(), dtype=np.uint8)
+        # Write under a unique name and rename, readers never see partial entries
+        tmp_path = "{}.{}.{}.tmp".format(entry, os.getpid(), threading.get_ident())
+        with open(tmp_path, "wb") as fid:
+            np.save(fid, array)
+        os.replace(tmp_path, entry)
+        with self._lock:
+            self.misses += 1
+        return array
+
+def tensor_bytes(item):
+    # Size of a tensor or of a tuple of tensors (None entries allowed)
+    if isinstance(item, tuple):
+        return sum(tensor_bytes(x) for x in item)
+    return 0 if item is None else item.element_size() * item.nelement()
+
+class ImageLRU:
+    """
+    Least-recently-used set of loaded images bounded by their total size in
+    bytes. Shared by all lazily loaded cameras of a scene so that resident
+    image memory stays below max_bytes however many views there are.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Loading happens outside the lock so that several views can load at once
+        image = load()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = image
+                self.resident_bytes += tensor_bytes(image)
+            # Evict the least recently used views, but always keep the one just requested
+            while self.resident_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.resident_bytes -= tensor_bytes(evicted)
+        return image
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,167 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import math
+import torch
+import numpy as np
+from utils.general_utils import build_scaling_rotation, rotation_to_quaternion
+from utils.spatial_utils import morton_order, spheres_in_view, CUTOFF_SIGMAS
+
+def merge_pairs(xyz, covariance, weight, features, bound, transparency):
+    """
+    Moment-matched parents of consecutive pairs of Gaussians (an odd last one
+    becomes the single child of its parent). Children are weighted by opacity
+    times surface area; the parent mean and covariance match the weighted
+    mixture, its SH coefficients are the weighted average and its bounding
+    sphere contains the spheres of both children. Also returns the total
+    weight and the product of the children's transparencies (1 - opacity).
+    """
+    count = xyz.shape[0]
+    pad = count % 2
+    valid = torch.ones(count + pad, dtype=torch.bool, device=xyz.device)
+    if pad:
+        valid[-1] = False
+        xyz, covariance, weight, features, bound = [torch.cat((t, torch.zeros_like(t[:1]))) for t in (xyz, covariance, weight, features, bound)]
+        transparency = torch.cat((transparency, torch.ones_like(transparency[:1])))
+    pairs = lambda t: t.view(-1, 2, *t.shape[1:])
+    xyz, covariance, weight, features, bound, transparency, valid = [pairs(t) for t in (xyz, covariance, weight, features, bound, transparency, valid)]
+
+    w = weight / weight.sum(dim=1, keepdim=True)
+    parent_xyz = (w[..., None] * xyz).sum(dim=1)
+    offset = xyz - parent_xyz[:, None]
+    parent_covariance = (w[..., None, None] * (covariance + offset[..., :, None] * offset[..., None, :])).sum(dim=1)
+    parent_features = (w[..., None, None] * features).sum(dim=1)
+    child_reach = torch.where(valid, offset.norm(dim=2) + bound, torch.zeros_like(bound))
+    return parent_xyz, parent_covariance, parent_features, child_reach.max(dim=1).values, weight.sum(dim=1), transparency.prod(dim=1)
+
+def covariance_to_scaling_rotation(covariance):
+    eigenvalues, eigenvectors = torch.linalg.eigh(covariance)
+    # eigh may return a reflection; flipping one axis makes it a rotation
+    flip = torch.linalg.det(eigenvectors) < 0
+    eigenvectors[:, :, 0] = torch.where(flip[:, None], -eigenvectors[:, :, 0], eigenvectors[:, :, 0])
+    return torch.sqrt(torch.clamp(eigenvalues, min=1e-20)), rotation_to_quaternion(eigenvectors)
+
+class GaussianHierarchy:
+    """
+    Level-of-detail tree over a GaussianModel. The Gaussians (leaves, level 0)
+    are ordered along the Morton curve and merged pairwise, level by level,
+    into coarser parent Gaussians up to a single root, as in GaussianBVH:
+    node j of level k has the children 2j and 2j + 1 of level k - 1. The
+    parents are stored with activated attributes (opacity in [0, 1], linear
+    scales, unit quaternions, features as in get_features) and level by level
+    from level 1 upwards.
+
+        gaussians.lod = GaussianHierarchy.build(gaussians)
+        leaves, nodes = gaussians.lod.select(gaussians, camera, 1.0)
+    """
+    def __init__(self, leaf_rows, xyz, features, opacity, scaling, rotation, bound):
+        self.leaf_rows = leaf_rows
+        self.xyz = xyz
+        self.features = features
+        self.opacity = opacity
+        self.scaling = scaling
+        self.rotation = rotation
+        self.bound = bound
+        # Offsets of the levels 1, 2, ... in the node arrays
+        counts = []
+        count = leaf_rows.shape[0]
+        while count > 1:
+            count = (count + 1) // 2
+            counts.append(count)
+        self.level_offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64))).tolist()
+        assert self.level_offsets[-1] == xyz.shape[0], "Node count does not match the number of leaves"
+
+    @classmethod
+    @torch.no_grad()
+    def build(cls, gaussians):
+        leaf_rows = morton_order(gaussians.get_xyz.detach())
+        xyz = gaussians.get_xyz.detach()[leaf_rows]
+        scaling = gaussians.get_scaling.detach()[leaf_rows]
+        opacity = gaussians.get_opacity.detach()[leaf_rows, 0]
+        L = build_scaling_rotation(scaling, gaussians.get_rotation.detach()[leaf_rows])
+        covariance = L @ L.transpose(1, 2)
+        features = gaussians.get_features.detach()[leaf_rows]
+        bound = CUTOFF_SIGMAS * scaling.max(dim=1).values
+        # Surface area up to a constant, so that merged opacity spreads over the parent's larger area
+        area = torch.clamp(torch.linalg.det(covariance), min=0.0) ** (1.0 / 3.0)
+        transparency = 1.0 - opacity
+
+        levels = []
+        while xyz.shape[0] > 1:
+            xyz, covariance, features, bound, weight, transparency = merge_pairs(xyz, covariance, opacity * area + 1e-12, features, bound, transparency)
+            scaling, rotation = covariance_to_scaling_rotation(covariance)
+            area = torch.clamp(torch.linalg.det(covariance), min=1e-30) ** (1.0 / 3.0)
+            # Spread the children's opacity over the parent's area, but never above the opacity of all children stacked
+            opacity = torch.minimum(weight / area, 1.0 - transparency)
+            bound = torch.maximum(bound, CUTOFF_SIGMAS * scaling.max(dim=1).values)
+            levels.append((xyz, features, opacity[:, None], scaling, rotation, bound))
+
+        device = gaussians.get_xyz.device
+        if not levels:
+            empty = lambda *shape: torch.zeros((0,) + shape, dtype=gaussians.get_xyz.dtype, device=device)
+            return cls(leaf_rows, empty(3), empty(*gaussians.get_features.shape[1:]), empty(1), empty(3), empty(4), empty())
+        return cls(leaf_rows, *[torch.cat(level) for level in zip(*levels)])
+
+    def save(self, path):
+        arrays = {"leaf_rows": self.leaf_rows.int(), "xyz": self.xyz, "features": self.features, "opacity": self.opacity,
+                  "scaling": self.scaling, "rotation": self.rotation, "bound": self.bound}
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, **{name: tensor.detach().cpu().numpy() for name, tensor in arrays.items()})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, device="cuda", dtype=torch.float):
+        with np.load(path) as data:
+            tensor = lambda name: torch.from_numpy(data[name]).to(device=device, dtype=dtype)
+            return cls(torch.from_numpy(data["leaf_rows"]).to(device=device, dtype=torch.long),
+                       tensor("xyz"), tensor("features"), tensor("opacity"), tensor("scaling"), tensor("rotation"), tensor("bound"))
+
+    def remap(self, order):
+        # Follow GaussianModel.reorder: new row i of the model is the old row order[i]
+        new_rows = torch.empty_like(order)
+        new_rows[order] = torch.arange(order.shape[0], device=order.device)
+        self.leaf_rows = new_rows[self.leaf_rows]
+
+    def select(self, gaussians, viewpoint_camera, threshold, cull=False, scaling_modifier=1.0):
+        """
+        Cut of the hierarchy for a view: descending from the root, a node is
+        kept once its largest standard deviation projects to at most threshold
+        pixels, otherwise its children are visited. Returns the model rows of
+        the kept leaves and the indices of the kept parent nodes. With cull,
+        subtrees whose bounding spheres cannot reach the image are dropped.
+        """
+        assert self.leaf_rows.shape[0] == gaussians.get_xyz.shape[0], "The hierarchy was built for a different model"
+        device = self.xyz.device
+        width, height = int(viewpoint_camera.image_width), int(viewpoint_camera.image_height)
+        focal = width / (2.0 * math.tan(viewpoint_camera.FoVx * 0.5))
+        center = viewpoint_camera.camera_center.to(self.xyz)
+
+        nodes = torch.zeros(1, dtype=torch.long, device=device)
+        kept = []
+        for level in range(len(self.level_offsets) - 1, 0, -1):
+            index = self.level_offsets[level - 1] + nodes
+            if cull:
+                visible = spheres_in_view(self.xyz[index], max(scaling_modifier, 1.0) * self.bound[index], viewpoint_camera.full_proj_transform, width, height)
+                nodes, index = nodes[visible], index[visible]
+            distance = torch.clamp((self.xyz[index] - center).norm(dim=1), min=1e-6)
+            coarse = focal * scaling_modifier * self.scaling[index].max(dim=1).values / distance <= threshold
+            kept.append(index[coarse])
+            nodes = nodes[~coarse]
+            nodes = torch.stack((2 * nodes, 2 * nodes + 1), dim=1).flatten()
+            children = self.leaf_rows.shape[0] if level == 1 else self.level_offsets[level - 1] - self.level_offsets[level - 2]
+            nodes = nodes[nodes < children]
+
+        rows = self.leaf_rows[nodes]
+        if cull:
+            radii = CUTOFF_SIGMAS * scaling_modifier * gaussians.get_scaling.detach()[rows].max(dim=1).values
+            rows = rows[spheres_in_view(gaussians.get_xyz.detach()[rows], radii, viewpoint_camera.full_proj_transform, width, height)]
+        return rows, torch.cat(kept) if kept else torch.zeros(0, dtype=torch.long, device=device)
@@ -0,0 +1,149 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import numpy as np
+from typing import NamedTuple
+from plyfile import PlyData, PlyElement
+
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8',
+}
+
+PLY_FORMATS = {
+    'binary_little_endian': '<',
+    'binary_big_endian': '>',
+}
+
+class PlyElementHeader(NamedTuple):
+    name: str
+    count: int
+    properties: list  # (name, ply type) pairs, type is None for list properties
+
+class PlyHeader(NamedTuple):
+    format: str
+    elements: list
+    header_size: int
+
+def read_ply_header(path):
+    """
+    Parse the header of a PLY file without touching its body.
+    """
+    elements = []
+    ply_format = None
+    with open(path, "rb") as fid:
+        magic = fid.readline().strip()
+        assert magic == b"ply", "Not a PLY file: {}".format(path)
+        while True:
+            line = fid.readline()
+            assert line, "Unexpected end of PLY header: {}".format(path)
+            elems = line.decode("ascii").split()
+            if not elems or elems[0] in ("comment", "obj_info"):
+                continue
+            if elems[0] == "format":
+                ply_format = elems[1]
+            elif elems[0] == "element":
+                elements.append(PlyElementHeader(name=elems[1], count=int(elems[2]), properties=[]))
+            elif elems[0] == "property":
+                if elems[1] == "list":
+                    elements[-1].properties.append((elems[-1], None))
+                else:
+                    elements[-1].properties.append((elems[2], elems[1]))
+            elif elems[0] == "end_header":
+                break
+        header_size = fid.tell()
+    return PlyHeader(format=ply_format, elements=elements, header_size=header_size)
+
+def element_dtype(element, ply_format):
+    """
+    Structured numpy dtype of one binary element record, or None if the
+    element cannot be described by a fixed-size record (list properties).
+    """
+    if ply_format not in PLY_FORMATS:
+        return None
+    endian = PLY_FORMATS[ply_format]
+    dtype = []
+    for name, ply_type in element.properties:
+        if ply_type is None:
+            return None
+        dtype.append((name, endian + PLY_TYPES[ply_type]))
+    return np.dtype(dtype)
+
+def memmap_ply_vertices(path):
+    """
+    Memory-map the vertex block of a binary PLY file as a structured array.
+    Only the header is read; pages of the body are loaded on access. Returns
+    None if the file layout does not allow it (ASCII files, list properties or
+    elements stored before the vertices).
+    """
+    header = read_ply_header(path)
+    if not header.elements or header.elements[0].name != "vertex":
+        return None
+    vertex = header.elements[0]
+    dtype = element_dtype(vertex, header.format)
+    if dtype is None:
+        return None
+    if vertex.count == 0:
+        return np.empty(0, dtype=dtype)
+    # Copy-on-write keeps the mapping read-only on disk while giving torch a writable buffer
+    return np.memmap(path, dtype=dtype, mode="c", offset=header.header_size, shape=(vertex.count,))
+
+def write_ply_vertices(path, names, arrays):
+    """
+    Write (N, k) arrays side by side as the float32 vertex properties names of
+    a binary PLY file. The file is written under a temporary name and renamed,
+    so readers never see a partial file.
+    """
+    num_vertices = arrays[0].shape[0] if arrays else 0
+    elements = np.empty(num_vertices, dtype=[(name, 'f4') for name in names])
+    # All properties are float32, so the records can be filled block by block
+    # through a plain (N, properties) view instead of one tuple per vertex
+    columns = elements.view(np.float32).reshape(num_vertices, len(names))
+    start = 0
+    for array in arrays:
+        columns[:, start:start + array.shape[1]] = array
+        start += array.shape[1]
+    assert start == len(names), "Got {} columns for {} properties".format(start, len(names))
+    tmp_path = path + ".tmp"
+    PlyData([PlyElement.describe(elements, 'vertex')]).write(tmp_path)
+    os.replace(tmp_path, path)
+
+def sorted_property_names(names, prefix):
+    names = [name for name in names if name.startswith(prefix)]
+    return sorted(names, key = lambda x: int(x.split('_')[-1]))
+
+def property_columns(vertices, names):
+    """
+    (N, len(names)) array with the given properties of a structured vertex
+    array, in native byte order. If all properties share one dtype and the
+    requested ones are stored next to each other, this is a strided view and
+    nothing is copied, unless the file is big-endian.
+    """
+    if not names:
+        return np.zeros((vertices.shape[0], 0), dtype=np.float32)
+    fields = vertices.dtype.names
+    base = vertices.dtype.fields[fields[0]][0]
+    uniform = all(vertices.dtype.fields[field][0] == base for field in fields) and vertices.dtype.itemsize == base.itemsize * len(fields)
+    idx = [fields.index(name) for name in names]
+    if uniform and idx == list(range(idx[0], idx[0] + len(idx))):
+        table = vertices.view(base).reshape(vertices.shape[0], len(fields))
+        columns = table[:, idx[0]:idx[0] + len(idx)]
+    else:
+        columns = np.stack([vertices[name] for name in names], axis=1)
+    # torch.from_numpy only accepts native byte order
+    return columns if columns.dtype.isnative else columns.astype(columns.dtype.newbyteorder("="))
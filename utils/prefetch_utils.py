@@ -0,0 +1,89 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import time
+import torch
+from random import randint
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from scene.cameras import normalize_image
+
+class ViewPrefetcher:
+    """
+    Draws training views with the same without-replacement schedule as
+    train.py (a random pick from a stack that is refilled once empty) and
+    stages the ground truth images of the next depth views on worker threads.
+    Images that are not on device are copied as uint8 through pinned host
+    memory on a side CUDA stream, so that the transfer overlaps the current
+    step, and are converted to float there.
+
+        prefetcher = ViewPrefetcher(scene.getTrainCameras(), "cuda", depth=4)
+        viewpoint_cam, gt_image = prefetcher.next()
+    """
+    def __init__(self, cameras, device, depth=4, num_workers=2):
+        self.cameras = cameras
+        self.device = torch.device(device)
+        self.depth = max(depth, 0)
+        self.viewpoint_stack = None
+        self.stall_time = 0.0  # seconds spent waiting in the last call to next()
+        self.use_stream = self.device.type == "cuda" and torch.cuda.is_available()
+        self.stream = torch.cuda.Stream(device=self.device) if self.use_stream else None
+        self.pool = ThreadPoolExecutor(max_workers=max(num_workers, 1)) if self.depth > 0 else None
+        self.pending = deque()
+        for _ in range(self.depth):
+            self._schedule()
+
+    def _draw(self):
+        if not self.viewpoint_stack:
+            self.viewpoint_stack = self.cameras.copy()
+        return self.viewpoint_stack.pop(randint(0, len(self.viewpoint_stack)-1))
+
+    def _stage(self, camera):
+        # Images are moved as uint8 and only converted to float on the training device
+        image, mask = camera.raw_image
+        if image.device == self.device or not self.use_stream:
+            return normalize_image(image.to(self.device), None if mask is None else mask.to(self.device)), None
+        with torch.cuda.stream(self.stream):
+            staged = [None if x is None else
+                      (x.pin_memory() if x.device.type == "cpu" else x).to(self.device, non_blocking=True)
+                      for x in (image, mask)]
+            staged = normalize_image(*staged)
+            ready = torch.cuda.Event()
+            ready.record(self.stream)
+        return staged, ready
+
+    def _schedule(self):
+        camera = self._draw()
+        self.pending.append((camera, self.pool.submit(self._stage, camera)))
+
+    def next(self):
+        if self.depth == 0:
+            start = time.perf_counter()
+            camera = self._draw()
+            image, mask = camera.raw_image
+            image = normalize_image(image.to(self.device), None if mask is None else mask.to(self.device))
+            self.stall_time = time.perf_counter() - start
+            return camera, image
+
+        camera, future = self.pending.popleft()
+        self._schedule()
+        start = time.perf_counter()
+        image, ready = future.result()
+        if ready is not None:
+            # Order the copy before the consumer's kernels and keep its memory alive on that stream
+            torch.cuda.current_stream(self.device).wait_event(ready)
+            image.record_stream(torch.cuda.current_stream(self.device))
+        self.stall_time = time.perf_counter() - start
+        return camera, image
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
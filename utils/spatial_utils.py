@@ -0,0 +1,330 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import math
+import torch
+from utils.compression_utils import quantize_range
+from utils.general_utils import build_rotation
+
+MORTON_BITS = 21  # per axis, three interleaved axes fit into 63 bits
+# The rasterizers skip splats with alpha below 1/255, which no Gaussian reaches beyond this distance
+CUTOFF_SIGMAS = math.sqrt(2.0 * math.log(255.0))
+
+def spread_bits(x):
+    # Move the lower 21 bits of x to every third bit position
+    x = x & 0x1fffff
+    x = (x | (x << 32)) & 0x1f00000000ffff
+    x = (x | (x << 16)) & 0x1f0000ff0000ff
+    x = (x | (x << 8)) & 0x100f00f00f00f00f
+    x = (x | (x << 4)) & 0x10c30c30c30c30c3
+    x = (x | (x << 2)) & 0x1249249249249249
+    return x
+
+def morton_codes(xyz, low=None, high=None):
+    """
+    Z-order (Morton) codes of points quantized to a 2^21 grid per axis over
+    [low, high], the bounding box of the points by default.
+    """
+    low = xyz.min(dim=0, keepdim=True).values if low is None else low
+    high = xyz.max(dim=0, keepdim=True).values if high is None else high
+    cells = quantize_range(xyz, low, high, MORTON_BITS)
+    return spread_bits(cells[:, 0]) | (spread_bits(cells[:, 1]) << 1) | (spread_bits(cells[:, 2]) << 2)
+
+def morton_order(xyz):
+    # Permutation that sorts the points along the Z-order curve
+    return torch.argsort(morton_codes(xyz))
+
+def refined_morton_order(xyz, rounds=3):
+    """
+    morton_order in which the points that share a cell of the 2^21 grid are in
+    turn sorted along the Z-order curve of their own bounding box, for up to
+    rounds more levels, so that tight clusters keep a spatial order too.
+    """
+    codes, order = torch.sort(morton_codes(xyz))
+    runs = torch.zeros_like(codes)
+    for _ in range(rounds):
+        starts = torch.ones_like(codes, dtype=torch.bool)
+        starts[1:] = (codes[1:] != codes[:-1]) | (runs[1:] != runs[:-1])
+        runs = torch.cumsum(starts, dim=0) - 1
+        tied = torch.bincount(runs)[runs] > 1
+        if not bool(tied.any()):
+            break
+        tied_points, tied_runs = xyz[order[tied]], runs[tied]
+        index = tied_runs[:, None].expand(-1, 3)
+        low = torch.full((int(runs[-1]) + 1, 3), float("inf"), dtype=xyz.dtype, device=xyz.device).scatter_reduce(0, index, tied_points, reduce="amin")
+        high = torch.full_like(low, -float("inf")).scatter_reduce(0, index, tied_points, reduce="amax")
+        local_codes = morton_codes(tied_points, low[tied_runs], high[tied_runs])
+        # Sort by run, then by local code; the runs are in order already
+        permutation = torch.sort(local_codes, stable=True).indices
+        permutation = permutation[torch.sort(tied_runs[permutation], stable=True).indices]
+        order[tied] = order[tied][permutation]
+        codes[tied] = local_codes[permutation]
+    return order
+
+def empty_boxes(count, dtype=torch.float, device="cpu"):
+    # Inverted boxes (min = inf, max = -inf), which fail every overlap test
+    return torch.tensor([[float("inf")] * 3, [-float("inf")] * 3], dtype=dtype, device=device).repeat(count, 1, 1)
+
+def box_tree_levels(leaf_boxes):
+    """
+    Levels of a complete binary tree over leaf_boxes, from the leaves up to the
+    root, in which every box bounds its two children.
+    """
+    levels = [leaf_boxes]
+    while levels[-1].shape[0] > 1:
+        children = levels[-1]
+        if children.shape[0] % 2:
+            children = torch.cat((children, empty_boxes(1, children.dtype, children.device)))
+        children = children.view(-1, 2, 2, 3)
+        levels.append(torch.stack((children[:, :, 0].min(dim=1).values, children[:, :, 1].max(dim=1).values), dim=1))
+    return levels
+
+def ellipsoid_bounds(xyz, scaling, rotation, num_sigmas=3.0):
+    """
+    (N, 2, 3) axis-aligned boxes (min, max) around the num_sigmas ellipsoids of
+    Gaussians. The half extent along world axis i is num_sigmas times the norm
+    of row i of R S.
+    """
+    half_extent = num_sigmas * torch.norm(build_rotation(rotation) * scaling[:, None, :], dim=2)
+    return torch.stack((xyz - half_extent, xyz + half_extent), dim=1)
+
+def frustum_planes(full_proj_transform):
+    """
+    (6, 4) inward-facing planes (a, b, c, d), with a x + b y + c z + d >= 0
+    inside, of the view frustum of a camera's full_proj_transform (stored
+    transposed, as in Camera). Depth is mapped to [0, 1].
+    """
+    m = full_proj_transform.t()
+    return torch.stack((m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[2], m[3] - m[2]))
+
+def spheres_in_view(centers, radii, full_proj_transform, width, height, guard_band=2.0):
+    """
+    Mask of the spheres that may cover a pixel of a width x height view. The
+    side planes are moved guard_band pixels outwards to account for the
+    rasterizer's low-pass filter, and there is no far plane, which the
+    rasterizers do not clip against either.
+    """
+    m = full_proj_transform.t().to(centers)
+    sx = 1.0 + 2.0 * guard_band / width
+    sy = 1.0 + 2.0 * guard_band / height
+    planes = torch.stack((sx * m[3] + m[0], sx * m[3] - m[0], sy * m[3] + m[1], sy * m[3] - m[1], m[2]))
+    planes = planes / planes[:, :3].norm(dim=1, keepdim=True)
+    distances = torch.addmm(planes[:, 3], centers, planes[:, :3].t())
+    return (distances.add_(radii[:, None]) >= 0).all(dim=1)
+
+def boxes_in_frustum(boxes, planes):
+    # A box is outside if its corner furthest along a plane's normal is behind that plane
+    corners = torch.where(planes[None, :, :3] >= 0, boxes[:, None, 1, :], boxes[:, None, 0, :])
+    return ((corners * planes[None, :, :3]).sum(dim=2) + planes[None, :, 3] >= 0).all(dim=1)
+
+def boxes_inside_frustum(boxes, planes):
+    # Fully inside if even the corner furthest against each plane's normal is in front of it
+    corners = torch.where(planes[None, :, :3] >= 0, boxes[:, None, 0, :], boxes[:, None, 1, :])
+    return ((corners * planes[None, :, :3]).sum(dim=2) + planes[None, :, 3] >= 0).all(dim=1)
+
+def boxes_overlap(boxes, low, high):
+    return torch.logical_and((boxes[:, 0] <= high).all(dim=1), (boxes[:, 1] >= low).all(dim=1))
+
+def boxes_inside(boxes, low, high):
+    return torch.logical_and((boxes[:, 0] >= low).all(dim=1), (boxes[:, 1] <= high).all(dim=1))
+
+def boxes_hit_by_ray(boxes, origin, direction, max_distance=float("inf")):
+    # Slab test; axis-parallel rays get infinite slab distances instead of NaNs
+    inv_direction = 1.0 / direction
+    t0 = (boxes[:, 0] - origin) * inv_direction
+    t1 = (boxes[:, 1] - origin) * inv_direction
+    t_near = torch.minimum(t0, t1).nan_to_num(nan=-float("inf")).max(dim=1).values
+    t_far = torch.maximum(t0, t1).nan_to_num(nan=float("inf")).min(dim=1).values
+    return torch.logical_and(t_near <= t_far, torch.logical_and(t_far >= 0, t_near <= max_distance))
+
+class GaussianBVH:
+    """
+    Bounding volume hierarchy over the 3 sigma boxes of a GaussianModel. The
+    Gaussians are grouped into leaves of about leaf_size neighbours along the
+    Morton curve, and the leaves are merged pairwise, level by level, into a
+    complete binary tree. Queries descend all levels at once with tensor ops
+    and return the indices of the Gaussians whose boxes pass the test.
+
+        bvh = GaussianBVH(gaussians)
+        visible = bvh.query_frustum(camera.full_proj_transform)
+        sources = gaussians.densify_and_prune(...)
+        bvh.update(gaussians, sources)
+    """
+    def __init__(self, gaussians, leaf_size=256):
+        self.leaf_size = leaf_size
+        self.build(gaussians)
+
+    def build(self, gaussians):
+        xyz = gaussians.get_xyz.detach()
+        self.leaf_of = torch.empty(xyz.shape[0], dtype=torch.long, device=xyz.device)
+        if xyz.shape[0] > 0:
+            self.leaf_of[morton_order(xyz)] = torch.arange(xyz.shape[0], device=xyz.device) // self.leaf_size
+        self.num_leaves = max(-(-xyz.shape[0] // self.leaf_size), 1)
+        self.refit(gaussians)
+
+    def update(self, gaussians, sources=None):
+        """
+        Follow a change of the model. sources[i] is the previous row of the
+        current row i, or of its parent for a split, as returned by
+        densify_and_prune or passed to reorder. New and moved Gaussians stay in
+        the leaf of their source and the boxes are refit; the tree is rebuilt
+        once a leaf grows to four times leaf_size. Without sources the rows
+        must be unchanged and only the boxes are refit, e.g. after optimizer
+        steps.
+        """
+        if sources is not None:
+            self.leaf_of = self.leaf_of[sources]
+            if self.leaf_of.shape[0] > 0 and int(torch.bincount(self.leaf_of).max()) > 4 * self.leaf_size:
+                self.build(gaussians)
+                return
+        self.refit(gaussians)
+
+    def refit(self, gaussians):
+        self.boxes = ellipsoid_bounds(gaussians.get_xyz.detach(), gaussians.get_scaling.detach(), gaussians.get_rotation.detach())
+        device = self.boxes.device
+        self.order = torch.sort(self.leaf_of, stable=True).indices
+        counts = torch.bincount(self.leaf_of, minlength=self.num_leaves)
+        self.leaf_offsets = torch.cat((torch.zeros(1, dtype=torch.long, device=device), torch.cumsum(counts, dim=0)))
+
+        leaf_boxes = empty_boxes(self.num_leaves, self.boxes.dtype, device)
+        index = self.leaf_of[:, None].expand(-1, 3)
+        leaf_boxes[:, 0] = leaf_boxes[:, 0].scatter_reduce(0, index, self.boxes[:, 0], reduce="amin")
+        leaf_boxes[:, 1] = leaf_boxes[:, 1].scatter_reduce(0, index, self.boxes[:, 1], reduce="amax")
+        self.levels = box_tree_levels(leaf_boxes)
+
+    def leaf_range_members(self, first_leaves, last_leaves):
+        # Gaussians of the leaf ranges [first, last), which are contiguous in self.order
+        starts = self.leaf_offsets[first_leaves]
+        counts = self.leaf_offsets[last_leaves] - starts
+        positions = torch.arange(int(counts.sum()), device=starts.device) + torch.repeat_interleave(starts - (torch.cumsum(counts, dim=0) - counts), counts)
+        return self.order[positions]
+
+    def query(self, test, inside=None):
+        """
+        Indices of the Gaussians whose boxes pass test, a function mapping
+        (M, 2, 3) boxes to an (M,) boolean mask that is also applied to the
+        nodes of the tree. The optional inside function marks boxes whose
+        contents all pass test; such nodes are accepted without descending.
+        """
+        device = self.boxes.device
+        nodes = torch.zeros(1, dtype=torch.long, device=device)
+        accepted = []
+        for level in range(len(self.levels) - 1, -1, -1):
+            nodes = nodes[test(self.levels[level][nodes])]
+            if inside is not None:
+                # A node of this level covers 2^level consecutive leaves
+                contained = inside(self.levels[level][nodes])
+                first = nodes[contained] << level
+                accepted.append(self.leaf_range_members(first, torch.clamp(first + (1 << level), max=self.num_leaves)))
+                nodes = nodes[~contained]
+            if level > 0:
+                nodes = torch.stack((2 * nodes, 2 * nodes + 1), dim=1).flatten()
+                nodes = nodes[nodes < self.levels[level - 1].shape[0]]
+        candidates = self.leaf_range_members(nodes, nodes + 1)
+        accepted.append(candidates[test(self.boxes[candidates])])
+        return torch.sort(torch.cat(accepted)).values
+
+    def query_box(self, low, high):
+        return self.query(lambda boxes: boxes_overlap(boxes, low, high), lambda boxes: boxes_inside(boxes, low, high))
+
+    def query_frustum(self, full_proj_transform):
+        planes = frustum_planes(full_proj_transform).to(self.boxes)
+        return self.query(lambda boxes: boxes_in_frustum(boxes, planes), lambda boxes: boxes_inside_frustum(boxes, planes))
+
+    def query_ray(self, origin, direction, max_distance=float("inf")):
+        return self.query(lambda boxes: boxes_hit_by_ray(boxes, origin, direction, max_distance))
+
+def nearest_in_tree(sorted_points, leaves, levels, bound2, start, end, k, max_pairs):
+    """
+    Sorted squared distances (end - start x k) from sorted_points[start:end] to
+    their k nearest other points. leaves holds the points in groups of
+    leaves.shape[1], levels is the box_tree_levels of the groups and bound2
+    bounds the squared distance to the k-th neighbour. The range is split when
+    more than max_pairs pairs of a query and a box remain at a level.
+    """
+    n, leaf_size = sorted_points.shape[0], leaves.shape[1]
+    device = sorted_points.device
+    query_points = sorted_points[start:end]
+    query_bound2 = bound2[start:end].clone()
+    pairs = torch.arange(end - start, device=device)
+    nodes = torch.zeros_like(pairs)
+    for level in range(len(levels) - 1, -1, -1):
+        if pairs.shape[0] > max_pairs and end - start > 1:
+            middle = (start + end) // 2
+            return torch.cat((nearest_in_tree(sorted_points, leaves, levels, bound2, start, middle, k, max_pairs),
+                              nearest_in_tree(sorted_points, leaves, levels, bound2, middle, end, k, max_pairs)))
+        boxes = levels[level][nodes]
+        p = query_points[pairs]
+        near2 = (torch.clamp(boxes[:, 0] - p, min=0) + torch.clamp(p - boxes[:, 1], min=0)).pow(2).sum(dim=1)
+        far2 = torch.max(p - boxes[:, 0], boxes[:, 1] - p).pow(2).sum(dim=1)
+        # All points of a box are within far of the query, k + 1 of them include k neighbours
+        full = n - (nodes << level) * leaf_size >= k + 1
+        query_bound2 = query_bound2.scatter_reduce(0, pairs[full], far2[full], reduce="amin")
+        keep = torch.nonzero(near2 <= query_bound2[pairs] * (1 + 1e-5)).squeeze(1)
+        pairs, nodes = pairs[keep], nodes[keep]
+        if level > 0:
+            pairs = pairs.repeat_interleave(2)
+            nodes = torch.stack((2 * nodes, 2 * nodes + 1), dim=1).flatten()
+            if levels[level - 1].shape[0] % 2:
+                valid = nodes < levels[level - 1].shape[0]
+                pairs, nodes = pairs[valid], nodes[valid]
+
+    d2 = (leaves[nodes] - query_points[pairs][:, None]).pow(2).sum(dim=2)
+    candidates = nodes[:, None] * leaf_size + torch.arange(leaf_size, device=device)
+    d2[(candidates >= n) | (candidates == (start + pairs)[:, None])] = float("inf")
+    d2 = torch.topk(d2, min(k, leaf_size), dim=1, largest=False).values.flatten()
+    pairs = pairs.repeat_interleave(min(k, leaf_size))
+    # Take the k smallest over the boxes of each query, one at a time
+    nearest = torch.empty((end - start, k), dtype=sorted_points.dtype, device=device)
+    indices = torch.arange(d2.shape[0], device=device)
+    for i in range(k):
+        nearest[:, i] = torch.full_like(query_bound2, float("inf")).scatter_reduce(0, pairs, d2, reduce="amin")
+        first = torch.full((end - start,), d2.shape[0], dtype=torch.long, device=device)
+        first = first.scatter_reduce(0, pairs, torch.where(d2 == nearest[pairs, i], indices, d2.shape[0]), reduce="amin")
+        d2[first[first < d2.shape[0]]] = float("inf")
+    return nearest
+
+def distCPU2(points, k=3, leaf_size=16, window=8, chunk_size=16384, max_pairs=2**19):
+    """
+    Mean squared distance of every point to its k nearest neighbours, the same
+    quantity simple_knn's distCUDA2 computes, for tensors that are not on a
+    GPU. As in distCUDA2 the points are sorted along the Z-order curve and
+    grouped into boxes of leaf_size, here the leaves of a box_tree_levels
+    tree. The k-th nearest of the window points before and after a point
+    along the curve bounds its search, which descends the tree and tightens
+    the bound with every box that holds more than k points. The result is
+    exact, takes O(N log N) time and O(N) memory; only many exact duplicates
+    make it slower. A point without neighbours gets 1.
+    """
+    n = points.shape[0]
+    dist2 = torch.ones(n, dtype=points.dtype, device=points.device)
+    k = min(k, n - 1)
+    if k < 1:
+        return dist2
+    order = refined_morton_order(points)
+    sorted_points = points[order]
+
+    window_dist2 = torch.full((n, 2 * window), float("inf"), dtype=points.dtype, device=points.device)
+    for shift in range(1, min(window, n - 1) + 1):
+        d = (sorted_points[shift:] - sorted_points[:-shift]).pow(2).sum(dim=1)
+        window_dist2[shift:, shift - 1] = d
+        window_dist2[:-shift, window + shift - 1] = d
+    bound2 = torch.topk(window_dist2, k, dim=1, largest=False).values[:, -1]
+    del window_dist2
+
+    # The last leaf is padded with copies of the last point, which are skipped as candidates
+    num_leaves = -(-n // leaf_size)
+    leaves = torch.cat((sorted_points, sorted_points[-1:].expand(num_leaves * leaf_size - n, -1))).view(num_leaves, leaf_size, 3)
+    levels = box_tree_levels(torch.stack((leaves.min(dim=1).values, leaves.max(dim=1).values), dim=1))
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        dist2[order[start:end]] = nearest_in_tree(sorted_points, leaves, levels, bound2, start, end, k, max_pairs).mean(dim=1)
+    return dist2
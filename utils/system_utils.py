@@ -12,6 +12,8 @@
 from errno import EEXIST
 from os import makedirs, path
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 def mkdir_p(folder_path):
     # Creates a directory. equivalent to using mkdir -p on the command line
@@ -26,3 +28,24 @@ def mkdir_p(folder_path):
 def searchForMaxIteration(folder):
     saved_iters = [int(fname.split("_")[-1]) for fname in os.listdir(folder)]
     return max(saved_iters)
+
+class BackgroundWriter:
+    """
+    Runs writes on a worker thread, in submission order. At most max_pending
+    writes are queued or running, submit() waits for the oldest one beyond
+    that so that the host copies they hold stay bounded. Errors of a write are
+    raised by a later submit() or by wait().
+    """
+    def __init__(self, max_pending=2):
+        self.max_pending = max(max_pending, 1)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.pending = deque()
+
+    def submit(self, func, *args):
+        while self.pending and (self.pending[0].done() or len(self.pending) >= self.max_pending):
+            self.pending.popleft().result()
+        self.pending.append(self.pool.submit(func, *args))
+
+    def wait(self):
+        while self.pending:
+            self.pending.popleft().result()